@@ -1,171 +1,427 @@
 import requests
+import http_client
 import csv
 import json
-import time
 import pandas as pd
-import copy
+import numpy as np
+import os
+import metrics
+import price_store
+import rate_limit
+import run_journal
+from concurrent.futures import ThreadPoolExecutor
 
+API_URL = 'https://www.alphavantage.co/query'
+API_URL_VARIABLE = 'ALPHAVANTAGE_URL'
+API_KEY = 'DU4ISISK6O9TAOZI'
+API_KEYS_VARIABLE = 'ALPHAVANTAGE_API_KEYS'
 
-def alphavantage_deposit(symbol, dictionary, headers, other_headers, tmp_ow):
+# alphavantage limit for each api key, and the key in the response when a call was throttled
+CALLS_PER_MINUTE = 5
+THROTTLE_KEY = 'Note'
+
+# key in the response when alphavantage could not answer the call (i.e. an unknown symbol), sent with a 200 status
+ERROR_KEY = 'Error Message'
+
+
+class PriceWriter:
     """
-    creates or adds to the file with historical prices
-    :param symbol: string value of symbol (i.e. "AAPL")
-    :param dictionary: prices where the keys are the date and teh value is a list of prices / split co-efficient
-    :param headers: names of headers that the file should include (from alphavantage)
-    :param other_headers: other headers that we have to manually add (symbol and date)
-    :param tmp_ow: a bool to determine if we should overwrite the current file.
-    :return: updated tmp_ow
+    writer session for the historical prices file. It is opened once per run, keeps the file handle and whether
+    the header was written in memory, and buffers rows so they are written in large blocks.
+    the same rows are also written to the columnar store (see price_store.py) that local runs read from. The store's
+    meta data is written once, when the writer is closed
     """
 
-    # ensure we can read and write to the file.
+    def __init__(self, file_name='ninety_day_historical_prices.csv', overwrite=False, buffer_rows=10000,
+                 store_path=price_store.STORE_PATH):
+        """
+        :param file_name: name of the csv file to write
+        :param overwrite: bool to determine if we should overwrite the current file
+        :param buffer_rows: number of rows to keep in memory before writing them to the file
+        :param store_path: directory of the columnar store, None to only write the csv file
+        """
+        self.file_name = file_name
+        self.overwrite = overwrite
+        self.buffer_rows = buffer_rows
+        self.store_path = store_path
+        self.file = None
+        self.writer = None
+        self.rows = list()
+        self.store_headers = None
+        self.store = None
+
+    def open(self, headers):
+        """
+        opens the file the first time something is deposited. Writes the header if the file is new or overwritten.
+        :param headers: names of headers from alphavantage (symbol and date are added in front)
+        :return: bool of whether the file could be opened
+        """
+        if self.file is not None:
+            return True
+
+        # ensure we can read and write to the file.
+        try:
+            empty = not os.path.exists(self.file_name) or os.path.getsize(self.file_name) == 0
+            mode = 'w' if empty or self.overwrite else 'a'
+            self.file = open(self.file_name, mode=mode, newline='', encoding="utf-8")
+        except PermissionError as e:
+            print(f'The file is locked. Please unlock or close the file before rerunning. {e}')
+            return False
+
+        # the store starts over whenever the csv file does. A file that is appended to without a store (or with a
+        # store that does not match it) gets one with all of its rows first, so the store always has the file's rows
+        if self.store_path is not None:
+            if mode == 'a' and not price_store.store_is_current(self.store_path, self.file_name):
+                price_store.csv_to_store(self.file_name, self.store_path)
+            self.store = price_store.StoreWriter(self.store_path, mode == 'w', self.file_name)
+
+        self.writer = csv.writer(self.file)
+        if mode == 'w':
+            self.writer.writerow(['symbol', 'date'] + list(headers))
+        return True
+
+    def deposit(self, symbol, dictionary, headers):
+        """
+        adds one symbol's prices to the buffer, and writes the buffer if it is full
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :param dictionary: prices where the keys are the date and the value is a list of prices / split co-efficient
+        :param headers: names of headers that the file should include (from alphavantage)
+        :return: bool of whether the prices were deposited
+        """
+        if not self.open(headers):
+            return False
+
+        # the store needs the same columns for every block, so write what we have if they change
+        if self.store_headers is not None and self.store_headers != list(headers):
+            self.flush()
+        self.store_headers = list(headers)
+
+        for key in dictionary.keys():
+            row = [symbol, key]
+            for header in headers:
+                row.append(dictionary[key][header])
+            self.rows.append(row)
+
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        writes the buffered rows to the file (and the store)
+        :return: nothing is returned
+        """
+        if len(self.rows) == 0:
+            return
+
+        metrics.count('rows_written', len(self.rows), file=self.file_name)
+        self.writer.writerows(self.rows)
+        self.file.flush()
+
+        if self.store is not None:
+            self.store.append(self.rows, self.store_headers)
+
+        self.rows = list()
+
+    def close(self):
+        """
+        writes anything left in the buffer and closes the file
+        :return: nothing is returned
+        """
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def decode_column(values, dtype):
+    """
+    turns the text values of one column into a typed array
+    :param values: list of strings (i.e. "0.7500")
+    :param dtype: numpy type for the column
+    :return: numpy array (float with NaN if an int column has missing or bad values)
+    """
     try:
-        tmp_append = open('ninety_day_historical_prices.csv', mode='a', newline='', encoding="utf-8")
-        tmp_append.close()
+        return np.array(values, dtype=dtype)
+    except (ValueError, TypeError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype='float64')
+
+
+def decode_time_series(time_series):
+    """
+    decodes the "Time Series (Daily)" part of a response straight into typed arrays (no DataFrame transpose)
+    :param time_series: prices where the keys are the date and the value is a dictionary of prices
+    :return: [dates, columns]
 
-        temp_read = open('ninety_day_historical_prices.csv', mode='r', encoding="utf-8")
-        read_tmp = csv.reader(temp_read)
-        row_count = sum(1 for row in read_tmp)
-        temp_read.close()
+    dates is a numpy datetime64 array
+    columns is a dictionary of header name (i.e. "1. open") to a float array (int for volume)
+    """
+    dates = np.array(list(time_series.keys()), dtype='datetime64[D]')
+    values = list(time_series.values())
+
+    headers = list()
+    for value in values:
+        for header in value.keys():
+            if header not in headers:
+                headers.append(header)
+
+    columns = dict()
+    for header in headers:
+        dtype = price_store.COLUMN_TYPES.get(header, price_store.DEFAULT_TYPE)
+        columns[header] = decode_column([value.get(header) for value in values], dtype)
+
+    return dates, columns
+
+
+class PriceAccumulator:
+    """
+    collects the prices from each API response as typed arrays, and builds one DataFrame at the end.
+    adding a symbol only appends arrays to lists, so time and memory grow linearly with the number of rows.
+    """
 
-    except PermissionError as e:
-        print(f'The file is locked. Please unlock or close the file before rerunning. {e}')
-    else:
-        other_headers.extend(headers)
+    def __init__(self):
+        self.symbols = dict()
+        self.symbol_codes = list()
+        self.dates = list()
+        self.columns = dict()
+        self.num_rows = 0
+
+    def add(self, symbol, time_series):
+        """
+        adds one symbol's prices
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :param time_series: prices where the keys are the date and the value is a dictionary of prices
+        :return: nothing is returned
+        """
+        dates, columns = decode_time_series(time_series)
+        num_new = len(dates)
+
+        code = self.symbols.setdefault(symbol, len(self.symbols))
+        self.symbol_codes.append(np.full(num_new, code, dtype='int32'))
+        self.dates.append(dates)
+
+        # columns this symbol is the first to have are filled with NaN for the rows before it
+        for header, values in columns.items():
+            if header not in self.columns:
+                self.columns[header] = [np.full(self.num_rows, np.nan)] if self.num_rows > 0 else list()
+            self.columns[header].append(values)
+
+        # and columns this symbol does not have are filled with NaN for its rows
+        for header, chunks in self.columns.items():
+            if header not in columns:
+                chunks.append(np.full(num_new, np.nan))
+
+        self.num_rows += num_new
+
+    def to_frame(self):
+        """
+        builds the DataFrame from the arrays
+        :return: pandas DataFrame with symbol (categorical), date (datetime64) and the typed price columns
+        """
+        codes = np.concatenate(self.symbol_codes) if self.num_rows > 0 else np.empty(0, dtype='int32')
+        data = {'symbol': pd.Categorical.from_codes(codes, categories=list(self.symbols.keys())),
+                'date': np.concatenate(self.dates) if self.num_rows > 0 else np.empty(0, dtype='datetime64[D]')}
+
+        for header, chunks in self.columns.items():
+            data[header] = np.concatenate(chunks)
+
+        return pd.DataFrame(data)
+
+
+def fetch_symbol(symbol, key_pool, api_url=None, max_errors=10, outputsize=None):
+    """
+    calls the Alphavantage API for one symbol, waiting on the key pool before every call
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :param key_pool: rate_limit.KeyPool with the API keys to use
+    :param api_url: url of the Alphavantage query endpoint, defaults to get_api_url()
+    :param max_errors: number of throttled responses (503 or "Note") in a row before giving up on the symbol
+    :param outputsize: "compact" (last 100 days) or "full" (whole history), None for the alphavantage default
+    :return: [historical_prices, stop]
+
+    historical_prices is the parsed JSON response, or None if there was an error
+    stop is a bool of whether the API looks to be offline (max_errors 503 errors in a row)
+    """
+    if api_url is None:
+        api_url = get_api_url()
+    error_count = 0
+    client = http_client.get_client()
+    query = f'{api_url}?function=TIME_SERIES_DAILY_ADJUSTED&symbol={symbol}'
+    if outputsize is not None:
+        query += f'&outputsize={outputsize}'
+
+    # cached responses do not use up any of the api quota, so check the cache before waiting for a key
+    # (the api key is not part of the cache key)
+    cached = client.get_cached(query)
+    if cached is not None:
+        historical_prices = json.loads(cached.content)
+        if THROTTLE_KEY not in historical_prices and ERROR_KEY not in historical_prices:
+            return historical_prices, False
+    if client.replay_only():
+        print(f'{symbol} is not in the cache (replay mode). Continuing with the remaining symbols.')
+        return None, False
+
+    # if we run into the 503 server error or get throttled, the key backs off (longer each time) before trying again
+    while error_count < max_errors:
+        api_key = key_pool.acquire()
+        api_link = f'{query}&apikey={api_key}'
+
+        # the http client retries connection errors, but 503s are left to the key pool since they are per key
+        try:
+            response = client.get(api_link, retry_statuses=())
+        except requests.exceptions.HTTPError as e:
+            if '503 Server Error' in str(e):
+                delay = key_pool.backoff(api_key)
+                print(e)
+                print(f'Retrying in {delay} seconds. Current symbol is {symbol}')
+                error_count += 1
+                continue
+            else:
+                print(f'Alphavantage could not process {symbol}. Error: "{e}"')
+                return None, False
+        except requests.exceptions.RequestException as e:
+            print(f'Could not reach Alphavantage for {symbol}. Continuing with the remaining symbols. Error: "{e}"')
+            return None, False
 
-        # if the file is empty, then write to it (create it)
-        if row_count == 0 or tmp_ow:
-            tmp_ow = not tmp_ow
-            with open('ninety_day_historical_prices.csv', mode='w', newline='', encoding="utf-8") as write:
-                writer = csv.writer(write)
-                writer.writerow(other_headers)
+        historical_prices = json.loads(response.content)
 
-                for key in dictionary.keys():
-                    row = [symbol, key]
-                    for header in headers:
-                        row.append(dictionary[key][header])
-                    writer.writerow(row)
+        # alphavantage sends back a "Note" instead of data when the call frequency is too high
+        if THROTTLE_KEY in historical_prices:
+            client.forget(api_link)
+            delay = key_pool.backoff(api_key)
+            print(f'Alphavantage throttled the call for {symbol}. Retrying in {delay} seconds.')
+            error_count += 1
+            continue
 
-        # or else just append to it
-        else:
-            with open('ninety_day_historical_prices.csv', mode='a', newline='', encoding="utf-8") as append:
-                appender = csv.writer(append)
+        # the error is not kept in the cache, so the symbol is asked for again next time
+        if ERROR_KEY in historical_prices:
+            client.forget(api_link)
 
-                for key in dictionary.keys():
-                    row = [symbol, key]
-                    for header in headers:
-                        row.append(dictionary[key][header])
-                    appender.writerow(row)
+        key_pool.reset(api_key)
+        return historical_prices, False
 
-    return tmp_ow
+    return None, True
 
 
-def alphavantage_api_call(symbols, api_key, overwrite, max_page_num):
+@metrics.timed('alphavantage_fetch')
+def alphavantage_api_call(symbols, api_keys, overwrite, max_page_num, api_url=None, workers=None,
+                          calls_per_minute=CALLS_PER_MINUTE):
     """
     make the API call to Alphavantage, write to file (if asked), and return pandas df with data from calls
     :param symbols: list of symbols to process
-    :param api_key: api key from alphavantage
+    :param api_keys: api key (or list of api keys) from alphavantage
     :param overwrite: bool to determine if we should overwrite the file
     :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+    :param api_url: url of the Alphavantage query endpoint, defaults to get_api_url()
+    :param workers: number of calls to have in flight at once, defaults to one per api key
+    :param calls_per_minute: number of calls allowed per minute for each api key
     :return: pandas DataFrame containing all information from API calls
     """
+    if isinstance(api_keys, str):
+        api_keys = [api_keys]
+    if workers is None:
+        workers = len(api_keys)
+
     count = 1
-    prices_for_all_symbols = pd.DataFrame()
-    tmp_ow = copy.copy(overwrite)
+    prices_for_all_symbols = PriceAccumulator()
     num_symbs = 20 * (max_page_num - 1)
+    key_pool = rate_limit.KeyPool(api_keys, calls_per_minute)
+    executor = ThreadPoolExecutor(max_workers=workers)
 
-    for symbol in symbols:
-        api_link = f'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY_ADJUSTED&symbol={symbol}' \
-                   f'&apikey={api_key}'
+    # the writer keeps the file open for the whole run, and writes whatever is buffered even if the run is stopped
+    try:
+        with PriceWriter(overwrite=True) as writer:
+            # results come back in the same order as symbols, so the file is written in a deterministic order.
+            # symbols that are in the run journal are not requested again
+            results = executor.map(lambda s: run_journal.fetch_prices(s, lambda x: fetch_symbol(x, key_pool, api_url)),
+                                   symbols)
+
+            for symbol, (historical_prices, stop) in zip(symbols, results):
+                if stop:
+                    print('Hit 10 consecutive 503 Errors. Ending program. Please check to see if the Alphavantage API '
+                          'is still online.')
+                    exit()
 
-        # default this to true so that it will enter the loop
-        error_503 = True
-        error_count = 0
+                if historical_prices is not None:
+                    key_error = False
 
-        # if we run into the 503 server error, we will try every 12 seconds for 2 minutes and to try to get the value
-        # if we still fail, then exit
-        while error_503:
+                    # write to file if user wants to update data
+                    if overwrite:
+                        try:
+                            headers = list(list(historical_prices['Time Series (Daily)'].values())[0].keys())
+                            writer.deposit(symbol, historical_prices['Time Series (Daily)'], headers)
+                        except KeyError:
+                            key_error = True
+                            print(f'Alphavantage could not process {symbol}. Continuing with the remaining symbols.')
 
-            try:
-                response = requests.get(api_link)
-                response.raise_for_status()
-            except requests.exceptions.HTTPError as e:
+                    # update dataframe if no errors from alphavantage API call
+                    if not key_error:
+                        try:
+                            prices_for_all_symbols.add(symbol, historical_prices['Time Series (Daily)'])
+                            metrics.count('rows_parsed', len(historical_prices['Time Series (Daily)']),
+                                          source='alphavantage')
+                        except KeyError:
+                            print(f'Alphavantage could not process {symbol}. Continuing with the remaining symbols.')
 
-                if '503 Server Error' in str(e):
-                    print(e)
-                    print(f'Retrying in 12 seconds. Current symbol is {symbol}')
+                # update user on progress
+                if count % 10 == 0:
+                    print(f'Finished API call for {symbol} ({count} of {num_symbs})')
 
-                    error_count += 1
-                else:
-                    error_503 = False
+                count += 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
-                if error_count == 10:
-                    print(
-                        'Hit 10 consecutive 503 Errors. Ending program. Please check to see if the Alphavantage API is still online.')
-                    exit()
+    return prices_for_all_symbols.to_frame()
 
-            else:
-                # this is if response is valid
-                error_503 = False
-                content = response.content
-                historical_prices = json.loads(content)
-                key_error = False
-
-                # write to file if user wants to update data
-                if overwrite:
-                    try:
-                        headers = list(list(historical_prices['Time Series (Daily)'].values())[0].keys())
-                        tmp_ow = alphavantage_deposit(symbol, historical_prices['Time Series (Daily)'], headers,
-                                                      ['symbol', 'date'], tmp_ow)
-                    except KeyError:
-                        key_error = True
-                        print(f'Alphavantage could not process {symbol}. Continuing with the remaining symbols.')
-
-                # update dataframe if no errors from alphavantage API call
-                if not key_error:
-                    try:
-                        curr_historical_prices = pd.DataFrame.from_dict(historical_prices['Time Series (Daily)']).T
-                        curr_historical_prices['symbol'] = [symbol] * len(
-                            historical_prices['Time Series (Daily)'].keys())
-                        curr_historical_prices['date'] = curr_historical_prices.index
-                        curr_historical_prices = curr_historical_prices.reset_index()
-                        prices_for_all_symbols = prices_for_all_symbols.append(curr_historical_prices)
-                    except KeyError:
-                        print(f'Alphavantage could not process {symbol}. Continuing with the remaining symbols.')
-
-            # update user on progress
-            if count % 10 == 0:
-                print(f'Finished API call for {symbol} ({count} of {num_symbs})')
-
-            # alphavantage has limit of 5 calls per minute
-            if count != len(symbols):
-                time.sleep(12)
-
-            count += 1
-
-    return prices_for_all_symbols.reset_index()
+
+def get_api_url():
+    """
+    url of the Alphavantage query endpoint. It can be pointed somewhere else (i.e. the local fake_upstream.py server)
+    with the ALPHAVANTAGE_URL environment variable
+    :return: url of the query endpoint
+    """
+    return os.environ.get(API_URL_VARIABLE, API_URL)
+
+
+def get_api_keys():
+    """
+    api keys to use for the calls. More keys can be used by setting the ALPHAVANTAGE_API_KEYS environment variable
+    (comma separated)
+    :return: list of api keys
+    """
+    return [key.strip() for key in os.environ.get(API_KEYS_VARIABLE, API_KEY).split(',') if key.strip()]
 
 
 def alphavantage_driver(symbols=None, overwrite=False, max_page_num=11):
     """
-    drives the calls, central place for the api key
+    drives the calls, central place for the api keys
     :param symbols: list of symbols to process
     :param overwrite: bool of if user wants to overwrite the csv file stored locally
     :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols), default to full run
     :return: pandas DataFrame with data from alphavantage API calls
     """
-    minutes = (max_page_num - 1) * 4
-    print(f'Alphavantage has an API limit of 5 calls a minute. This step will take roughly {minutes} minutes to '
-          f'complete.')
+    api_keys = get_api_keys()
+
+    minutes = round((max_page_num - 1) * 20 / (CALLS_PER_MINUTE * len(api_keys)))
+    print(f'Alphavantage has an API limit of {CALLS_PER_MINUTE} calls a minute per key ({len(api_keys)} key(s) in '
+          f'use). This step will take roughly {minutes} minutes to complete.')
 
     # if the symbols list is empty, then exit program
     if len(symbols) == 0:
         print('Symbols list is empty. File is possibly empty. Ending program. Check file and rerun.')
         exit()
 
-    api_key = 'DU4ISISK6O9TAOZI'
-    prices_df = alphavantage_api_call(symbols, api_key, overwrite, max_page_num)
+    prices_df = alphavantage_api_call(symbols, api_keys, overwrite, max_page_num)
 
     if overwrite:
-        print('ninety_day_historical_prices.csv was created or updated.')
+        print('ninety_day_historical_prices.csv and the ninety_day_historical_prices store were created or updated.')
 
     return prices_df
@@ -1,5 +1,433 @@
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+import result_cache
+import numpy as np
 import pandas as pd
+import os
+import sys
+import tracemalloc
+
+# the only price columns the analysis reads (besides symbol and date), and the only symbols.csv columns
+PRICE_COLUMNS = ['1. open', '8. split coefficient']
+SYMBOL_COLUMNS = ['symbol', 'sector']
+
+# the analysis looks at the last 100 trading days, sampled every 5 days (and the latest day)
+DEFAULT_HORIZON = '100d'
+DEFAULT_LOOKBACK = (99, 5)
+
+# trading days in each horizon unit (see parse_horizons)
+HORIZON_UNITS = {'d': 1, 'w': 5, 'm': 21, 'y': 252}
+
+CHART_TITLE = 'Sector Performances Over the Past Quarter'
+IMAGE_PATH = 'sector_performances.png'
+
+# batch charts (-charts) are written to this directory, for the whole period and for the last few sampled dates
+# (dates are 5 trading days apart, so 6 and 11 dates are the last 25 and 50 trading days)
+CHART_DIR = 'charts'
+CHART_WINDOWS = (6, 11)
+
+
+def numeric_values(column):
+    """
+    values of a price column as floats. Columns that were decoded as numbers are used as they are, text columns
+    (i.e. from the CSV) are converted with pd.to_numeric
+    :param column: pandas Series
+    :return: numpy float array, NaN where a value is not a number
+    """
+    if pd.api.types.is_numeric_dtype(column):
+        return column.to_numpy(dtype=float)
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=float)
+
+
+def date_strings(column):
+    """
+    dates as "YYYY-MM-DD" values. Parsed dates (see csv_loader.read_prices) become a categorical with one string for
+    each distinct date, so only the distinct dates are formatted. Text and categorical columns are used as they are
+    :param column: pandas Series of dates
+    :return: pandas Series with the same index
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        codes, uniques = pd.factorize(column)
+        categories = pd.DatetimeIndex(uniques).strftime('%Y-%m-%d')
+        return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=column.index)
+    return column
+
+
+def pivot_prices(prices_df, sample_dates, keep_symbols=None):
+    """
+    pivots the long prices table into date x symbol matrices of open prices and split coefficients
+    :param prices_df: pandas DataFrame of prices of stocks within 100 days
+    :param sample_dates: list of dates to keep (rows of the matrices, in this order)
+    :param keep_symbols: list of symbols to keep (columns of the matrices), None for every symbol
+    :return: [symbols, opens, coeffs, present]
+
+    symbols is a numpy array of the symbols (columns of the matrices)
+    opens and coeffs are float matrices of shape (dates, symbols), NaN where there is no usable value
+    present is a bool matrix of the same shape, True where the symbol has a row for that date
+    """
+    dates = date_strings(prices_df['date'])
+    keep = dates.isin(sample_dates)
+    if keep_symbols is not None:
+        keep &= prices_df['symbol'].isin(keep_symbols)
+    sample_df = prices_df[keep].assign(date=dates)
+    sample_df = sample_df.drop_duplicates(subset=['date', 'symbol'])
+
+    symbols, symbol_codes = np.unique(sample_df['symbol'].to_numpy().astype(str), return_inverse=True)
+    date_codes = pd.Index(sample_dates).get_indexer(sample_df['date'])
+
+    shape = (len(sample_dates), len(symbols))
+    opens = np.full(shape, np.nan)
+    coeffs = np.full(shape, np.nan)
+    present = np.zeros(shape, dtype=bool)
+
+    opens[date_codes, symbol_codes] = numeric_values(sample_df['1. open'])
+    coeffs[date_codes, symbol_codes] = numeric_values(sample_df['8. split coefficient'])
+    present[date_codes, symbol_codes] = True
+
+    return symbols, opens, coeffs, present
+
+
+def parse_horizons(text):
+    """
+    reads horizons like "5d,20d:2,60d,1y". A horizon is a number of trading days (d), weeks (w, 5 days), months
+    (m, 21 days) or years (y, 252 days), optionally followed by ":stride" (trading days between two sampled dates).
+    Without a stride, about 20 dates are sampled over the horizon
+    :param text: comma separated horizons
+    :return: dictionary of horizon name to (lookback, stride), where lookback is the number of trading days before the
+    latest date (a horizon of 100 days looks 99 days back)
+    """
+    horizons = dict()
+    for part in text.split(','):
+        part = part.strip().lower()
+        if part == '':
+            continue
+
+        name, _, stride = part.partition(':')
+        unit = name[-1]
+        if unit not in HORIZON_UNITS or not name[:-1].isdigit() or int(name[:-1]) * HORIZON_UNITS[unit] < 2:
+            raise ValueError(f'Invalid horizon "{part}". Use a number followed by d, w, m or y, of at least 2 '
+                             f'trading days (i.e. "20d" or "1y:5").')
+
+        if stride and (not stride.isdigit() or int(stride) < 1):
+            raise ValueError(f'Invalid horizon "{part}". The stride must be a number of at least 1.')
+
+        # the results of each horizon are saved under its name, so a name can only be used once
+        if name in horizons:
+            raise ValueError(f'Horizon "{name}" is given more than once.')
+
+        days = int(name[:-1]) * HORIZON_UNITS[unit]
+        stride = int(stride) if stride else max(1, days // 20)
+        horizons[name] = (days - 1, stride)
+    return horizons
+
+
+def fit_horizons(horizons, num_dates):
+    """
+    leaves out the horizons that look back further than the prices go, so a horizon is never labelled with more days
+    than it covers. The 100 day analysis is always kept (like before there were horizons), with a warning
+    :param horizons: dictionary of horizon name to (lookback, stride) (see parse_horizons)
+    :param num_dates: number of trading dates in the prices
+    :return: dictionary of horizon name to (lookback, stride)
+    """
+    fitted = dict()
+    for name, (lookback, stride) in horizons.items():
+        if lookback < num_dates:
+            fitted[name] = (lookback, stride)
+        elif name == DEFAULT_HORIZON:
+            print(f'Warning: there are only {num_dates} trading days of prices, so the {name} analysis covers '
+                  f'{num_dates} days.')
+            fitted[name] = (lookback, stride)
+        else:
+            print(f'Warning: the {name} horizon needs {lookback + 1} trading days of prices but there are only '
+                  f'{num_dates}. It is skipped.')
+    return fitted
+
+
+def trading_index(prices_df):
+    """
+    every date that has prices, for any symbol
+    :param prices_df: pandas DataFrame of prices
+    :return: sorted numpy array of the dates, oldest first
+    """
+    dates = date_strings(prices_df['date'])
+    if isinstance(dates.dtype, pd.CategoricalDtype):
+        dates = dates.cat.remove_unused_categories().cat.categories
+    return np.sort(pd.unique(np.asarray(dates, dtype=str)))
+
+
+def horizon_dates(dates, lookback, stride):
+    """
+    dates sampled over a horizon: every stride trading days from lookback days before the latest date, and the
+    latest date (lookback=99 and stride=5 are the original 100 day analysis)
+    :param dates: sorted numpy array of trading dates, oldest first (see trading_index)
+    :param lookback: number of trading days before the latest date to start from
+    :param stride: number of trading days between two sampled dates
+    :return: list of dates, oldest first (only dates that are in the index)
+    """
+    offsets = [i for i in range(lookback, 0, -stride) if i < len(dates)]
+    offsets.append(0)
+    return [str(dates[len(dates) - 1 - i]) for i in offsets]
+
+
+def sector_performance(groups, symbols, opens, coeffs, present, complete=None):
+    """
+    performance of each sector over the sampled dates, from pivoted prices
+    :param groups: dictionary of sectors and the symbols within them
+    :param symbols: numpy array of the symbols (columns of the matrices)
+    :param opens: float matrix of open prices, shape (dates, symbols)
+    :param coeffs: float matrix of split coefficients, same shape
+    :param present: bool matrix, True where the symbol has a row for that date
+    :param complete: bool array, True for the symbols that have a row for every sampled date. None to work it out
+    from present
+    :return: mapping from sector name to a list of its performance on each sampled date
+    """
+    analysis_dict = dict()
+
+    # only symbols traded on every sample day are used
+    if complete is None:
+        complete = present.all(axis=0)
+
+    # symbols x sectors membership matrix
+    group_names = list(groups.keys())
+    membership = np.zeros((len(symbols), len(group_names)), dtype=bool)
+    symbol_index = pd.Index(symbols)
+    for col, group in enumerate(group_names):
+        codes = symbol_index.get_indexer(list(groups[group]))
+        membership[codes[codes >= 0], col] = True
+    membership &= complete[:, np.newaxis]
+
+    # value of 1000 dollars invested in each symbol on the first day, for every day
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = (1000 / opens[0]) * opens * coeffs
+
+    # sum by sector. NaN values are kept as NaN (like sum() over a Series with NaN in it)
+    has_nan = np.isnan(values).astype(float) @ membership > 0
+    totals = np.where(np.isnan(values), 0.0, values) @ membership
+    totals[has_nan] = np.nan
+
+    # once we have all the prices, want to normalize to percentage to determine performance
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = 100 * (totals / totals[0]) - 100
+
+    for col, group in enumerate(group_names):
+        # don't use this group if there are no symbols to measure it with
+        if membership[:, col].any():
+            analysis_dict[group] = list(normalized[:, col])
+
+    return analysis_dict
+
+
+def multi_horizon_calculations(groups, prices_df, horizons, coverage=None):
+    """
+    sector performances for several horizons at once. The dates of every horizon are taken from one trading date
+    index and the prices are pivoted once for all of them
+    :param groups: dictionary of sectors and the symbols within them
+    :param prices_df: pandas DataFrame of prices
+    :param horizons: dictionary of horizon name to (lookback, stride) (see parse_horizons)
+    :param coverage: coverage.CoverageIndex of prices_df (see price_store.open_coverage), None to work out the
+    trading dates and the complete symbols from prices_df
+    :return: dictionary of horizon name to [analysis_dict, dates] (same as vectorized_calculations)
+    """
+    if coverage is None:
+        index = trading_index(prices_df)
+    else:
+        index = np.array(coverage.trading_dates())
+    sampled = {name: horizon_dates(index, lookback, stride)
+               for name, (lookback, stride) in fit_horizons(horizons, len(index)).items()}
+
+    # the complete symbols of each horizon come from ANDing the bitmaps of its dates, and only symbols that are
+    # complete for some horizon need to be pivoted
+    complete = None
+    keep_symbols = None
+    if coverage is not None:
+        complete = {name: coverage.complete(dates) for name, dates in sampled.items()}
+        keep_symbols = sorted(set(symbol for symbols in complete.values() for symbol in symbols))
+
+    # one pivot with the dates of every horizon
+    all_dates = sorted(set(date for dates in sampled.values() for date in dates))
+    symbols, opens, coeffs, present = pivot_prices(prices_df, all_dates, keep_symbols)
+
+    results = dict()
+    date_index = pd.Index(all_dates)
+    for name, dates in sampled.items():
+        rows = date_index.get_indexer(dates)
+        mask = None if complete is None else np.isin(symbols, complete[name])
+        analysis_dict = sector_performance(groups, symbols, opens[rows], coeffs[rows], present[rows], mask)
+        results[name] = (analysis_dict, dates)
+    return results
+
+
+def vectorized_calculations(groups, prices_df):
+    """
+    same results as calculations(), but pivots the prices once and computes every sector with numpy reductions.
+    The dates come from the trading date index (calculations() uses the rows of the first symbol in the file)
+    :param groups: dictionary of sectors and the symbols within them
+    :param prices_df: pandas DataFrame of prices of stocks within 100 days
+    :return: [analysis_dict, dates]
+
+    analysis_dict is the mapping from sector name to a list of its performance within the past 100 days
+    dates is a list of dates that were used to measure the prices
+    """
+    return multi_horizon_calculations(groups, prices_df, {DEFAULT_HORIZON: DEFAULT_LOOKBACK})[DEFAULT_HORIZON]
+
+
+class StreamingSectorTotals:
+    """
+    sector totals for one horizon, added up one symbol at a time while the prices file is read in chunks. Only the
+    sampled values of the symbol being read are kept, so the rows of each symbol have to be together in the file (like
+    PriceWriter writes it). A symbol whose rows appear again after another symbol's raises a ValueError instead of
+    being added twice. Memory depends on the number of sectors, sampled dates and symbols (the names of the symbols
+    already added are kept to catch that), not on the number of rows
+    """
+
+    def __init__(self, groups, dates):
+        """
+        :param groups: dictionary of sectors and the symbols within them
+        :param dates: list of sampled dates, oldest first
+        """
+        self.group_names = list(groups.keys())
+        self.sector_cols = dict()
+        for col, group in enumerate(self.group_names):
+            for symbol in groups[group]:
+                self.sector_cols.setdefault(symbol, list()).append(col)
+
+        self.dates = list(dates)
+        self.date_index = pd.Index(self.dates)
+        shape = (len(self.dates), len(self.group_names))
+        self.totals = np.zeros(shape)
+        self.has_nan = np.zeros(shape, dtype=bool)
+        self.members = np.zeros(len(self.group_names), dtype=bool)
+
+        self.finished = set()
+        self.symbol = None
+        self.opens = self.coeffs = self.present = None
+
+    def start_symbol(self, symbol):
+        """
+        :param symbol: symbol whose rows come next in the file
+        :return: nothing is returned
+        """
+        if symbol in self.finished:
+            raise ValueError(f'The rows of {symbol} are not together in the prices file, so it cannot be streamed. '
+                             f'-source=update adds the new dates of every symbol at the end of the file, so run the '
+                             f'analysis without -stream after an update.')
+        self.symbol = symbol
+        self.opens = np.full(len(self.dates), np.nan)
+        self.coeffs = np.full(len(self.dates), np.nan)
+        self.present = np.zeros(len(self.dates), dtype=bool)
+
+    def finish_symbol(self):
+        """
+        adds the symbol that was being read to its sectors (if it was traded on every sampled date)
+        :return: nothing is returned
+        """
+        if self.symbol is None:
+            return
+        self.finished.add(self.symbol)
+        cols = self.sector_cols.get(self.symbol, list())
+
+        if len(cols) > 0 and self.present.all():
+            # value of 1000 dollars invested on the first day, for every day
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = (1000 / self.opens[0]) * self.opens * self.coeffs
+            nan = np.isnan(values)
+            for col in cols:
+                self.totals[:, col] += np.where(nan, 0.0, values)
+                self.has_nan[:, col] |= nan
+                self.members[col] = True
+
+        self.symbol = None
+
+    def add(self, symbols, dates, opens, coeffs):
+        """
+        adds a chunk of rows
+        :param symbols: numpy array of the symbol of each row, in file order
+        :param dates: numpy array of the date of each row
+        :param opens: numpy float array of open prices
+        :param coeffs: numpy float array of split coefficients
+        :return: nothing is returned
+        """
+        rows = self.date_index.get_indexer(dates)
+        keep = rows >= 0
+        symbols, rows, opens, coeffs = symbols[keep], rows[keep], opens[keep], coeffs[keep]
+        if len(symbols) == 0:
+            return
+
+        # runs of rows that belong to the same symbol
+        starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+        ends = np.r_[starts[1:], len(symbols)]
+
+        for start, end in zip(starts, ends):
+            if symbols[start] != self.symbol:
+                self.finish_symbol()
+                self.start_symbol(symbols[start])
+
+            # the first row for a date is used (like drop_duplicates in pivot_prices)
+            run_rows, first = np.unique(rows[start:end], return_index=True)
+            new = ~self.present[run_rows]
+            run_rows, first = run_rows[new], first[new] + start
+            self.opens[run_rows] = opens[first]
+            self.coeffs[run_rows] = coeffs[first]
+            self.present[run_rows] = True
+
+    def result(self):
+        """
+        :return: mapping from sector name to a list of its performance on each sampled date (like
+        vectorized_calculations)
+        """
+        self.finish_symbol()
+        totals = self.totals.copy()
+        totals[self.has_nan] = np.nan
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            normalized = 100 * (totals / totals[0]) - 100
+
+        return {group: list(normalized[:, col]) for col, group in enumerate(self.group_names) if self.members[col]}
+
+
+def streaming_calculations(groups, path, horizons=None, chunk_rows=None):
+    """
+    same results as multi_horizon_calculations, but reads the prices csv file in chunks instead of loading it. The
+    file is read twice: once for the trading dates (date column only) and once for the sampled prices. The rows of
+    each symbol have to be together in the file (see StreamingSectorTotals), otherwise a ValueError is raised
+    :param groups: dictionary of sectors and the symbols within them
+    :param path: path to the prices csv file
+    :param horizons: dictionary of horizon name to (lookback, stride), defaults to the 100 day analysis
+    :param chunk_rows: number of rows read at a time, defaults to csv_loader.CHUNK_ROWS
+    :return: dictionary of horizon name to [analysis_dict, dates]
+    """
+    import csv_loader
+
+    if horizons is None:
+        horizons = {DEFAULT_HORIZON: DEFAULT_LOOKBACK}
+    if chunk_rows is None:
+        chunk_rows = csv_loader.CHUNK_ROWS
+
+    # first pass: every trading date
+    trading_dates = set()
+    for chunk in csv_loader.iter_prices(path, ['date'], chunk_rows):
+        trading_dates.update(chunk['date'].unique())
+    index = np.sort(np.array(list(trading_dates), dtype=str))
+
+    # second pass: the sampled prices, added to every horizon
+    accumulators = {name: StreamingSectorTotals(groups, horizon_dates(index, lookback, stride))
+                    for name, (lookback, stride) in fit_horizons(horizons, len(index)).items()}
+    sampled = set(date for accumulator in accumulators.values() for date in accumulator.dates)
+    types = {'symbol': 'str', 'date': 'str', **{column: 'float64' for column in PRICE_COLUMNS}}
+
+    for chunk in csv_loader.iter_prices(path, ['symbol', 'date'] + PRICE_COLUMNS, chunk_rows, types):
+        # most rows are not on a sampled date
+        metrics.count('rows_parsed', len(chunk), source='prices_csv')
+        chunk = chunk[chunk['date'].isin(sampled)]
+        symbols = chunk['symbol'].to_numpy(dtype=str)
+        dates = chunk['date'].to_numpy(dtype=str)
+        opens = numeric_values(chunk['1. open'])
+        coeffs = numeric_values(chunk['8. split coefficient'])
+        for accumulator in accumulators.values():
+            accumulator.add(symbols, dates, opens, coeffs)
+
+    return {name: (accumulator.result(), accumulator.dates) for name, accumulator in accumulators.items()}
 
 
 def calculations(groups, prices_df):
@@ -79,46 +507,161 @@ def calculations(groups, prices_df):
     return analysis_dict, dates
 
 
-def generate_image(analysis_dict, dates, ow):
+def best_sector(analysis_dict):
     """
-    creates an image with from the analysis of each sector
+    finds the sector that performed best over the whole period
     :param analysis_dict: the mapping from sector name to a list of its performance within the past 100 days
-    :param dates: a list of dates that were used to measure the prices
-    :param ow: bool of whether to overwrite the image generated.
-    :return: nothing is returned
+    :return: [sector, performance] ('N/A' and -100 if there are no sectors)
     """
-
-    # defaults
     curr_max = -100
     sect = 'N/A'
-
-    # image configurations
-    fig = plt.figure(num=1, figsize=(10, 6))
-    fig.subplots_adjust(top = 0.9, bottom=0.2, left=0.1, right=.75)
-    plt.title('Sector Performances Over the Past Quarter')
-    plt.xlabel('date')
-    plt.ylabel('% gain / loss')
-    plt.xticks(rotation=90)
-
-    # plot each sector and store the best performing sector
     for key, value in analysis_dict.items():
-        plt.plot(dates, value, label=key)
-
         if value[-1] > curr_max:
             curr_max = value[-1]
             sect = key
+    return sect, curr_max
+
+
+def draw_chart(fig, analysis_dict, dates, title=CHART_TITLE):
+    """
+    draws the performance of each sector on a figure. Only the figure's own axes are used (no pyplot state), so
+    charts can be drawn without a display and in several processes at once
+    :param fig: matplotlib Figure to draw on
+    :param analysis_dict: the mapping from sector name to a list of its performance
+    :param dates: a list of dates that were used to measure the prices
+    :param title: title of the chart
+    :return: nothing is returned
+    """
+    fig.subplots_adjust(top=0.9, bottom=0.2, left=0.1, right=.75)
+    ax = fig.add_subplot()
+    ax.set_title(title)
+    ax.set_xlabel('date')
+    ax.set_ylabel('% gain / loss')
+
+    for key, value in analysis_dict.items():
+        ax.plot(dates, value, label=key)
 
     # plot y = 0, just for reference
-    plt.plot(range(0, len(analysis_dict['Utilities'])), [0] * len(analysis_dict['Utilities']), color='black')
-    plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    ax.plot(range(0, len(dates)), [0] * len(dates), color='black')
+    ax.tick_params(axis='x', labelrotation=90)
+    ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+
+
+def render_chart(job):
+    """
+    draws a chart on its own figure (non-interactive, Agg canvas) and saves it
+    :param job: dictionary with analysis_dict, dates, path and title (see chart_jobs)
+    :return: path of the image
+    """
+    fig = Figure(figsize=(10, 6))
+    draw_chart(fig, job['analysis_dict'], job['dates'], job.get('title', CHART_TITLE))
+    fig.savefig(job['path'])
+    return job['path']
+
+
+def window_analysis(analysis_dict, dates, num_dates):
+    """
+    performance over the last few sampled dates only, measured from the first date of the window
+    :param analysis_dict: the mapping from sector name to a list of its performance
+    :param dates: a list of dates that were used to measure the prices
+    :param num_dates: number of sampled dates to keep
+    :return: [analysis_dict, dates] of the window
+    """
+    window_dict = dict()
+    for key, value in analysis_dict.items():
+        growth = 1 + np.asarray(value[-num_dates:], dtype=float) / 100
+        window_dict[key] = list(100 * (growth / growth[0]) - 100)
+    return window_dict, list(dates[-num_dates:])
 
-    # overwrite the image if user wants.
-    # as far as I can tell, I don't get a file error if the image is open and this save operation is run.
-    if ow:
-        plt.savefig('sector_performances.png')
-        print('Image was saved as "sector_performances.png" if you would like to refer to it.')
 
-    plt.show()
+def chart_jobs(analysis_dict, dates, chart_dir=CHART_DIR, windows=CHART_WINDOWS, subsets=None):
+    """
+    lists the charts of a batch report: every window (and the whole period) for all sectors and for each subset
+    :param analysis_dict: the mapping from sector name to a list of its performance
+    :param dates: a list of dates that were used to measure the prices
+    :param chart_dir: directory to write the charts to
+    :param windows: numbers of sampled dates to make window charts for
+    :param subsets: dictionary of subset name to a list of sectors, defaults to one subset for each sector
+    :return: list of jobs for render_chart
+    """
+    if subsets is None:
+        subsets = {sector: [sector] for sector in analysis_dict.keys()}
+    subsets = {'all': list(analysis_dict.keys()), **subsets}
+
+    jobs = list()
+    for num_dates in [None] + [w for w in windows if w < len(dates)]:
+        if num_dates is None:
+            curr_dict, curr_dates, period = analysis_dict, list(dates), 'all'
+        else:
+            curr_dict, curr_dates = window_analysis(analysis_dict, dates, num_dates)
+            period = f'last_{num_dates}'
+
+        for name, sectors in subsets.items():
+            file_name = f'{name}_{period}.png'.lower().replace(' ', '_').replace('/', '_')
+            jobs.append({'analysis_dict': {s: curr_dict[s] for s in sectors if s in curr_dict},
+                         'dates': curr_dates, 'path': os.path.join(chart_dir, file_name),
+                         'title': f'Sector Performances ({name}, {curr_dates[0]} to {curr_dates[-1]})'})
+    return jobs
+
+
+def stop_profiling():
+    """
+    turns off cProfile and tracemalloc in a worker process (they are copied from the parent when a run is profiled,
+    see metrics.py, and would slow the worker down)
+    :return: nothing is returned
+    """
+    sys.setprofile(None)
+    tracemalloc.stop()
+
+
+@metrics.timed('render_charts')
+def render_charts(jobs, workers=None):
+    """
+    renders charts in a pool of processes (one per core by default), so a batch report scales with the cores
+    :param jobs: list of jobs for render_chart
+    :param workers: number of processes, 1 to render in this process
+    :return: list of the paths of the images
+    """
+    for directory in {os.path.dirname(job['path']) for job in jobs}:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    if workers == 1 or len(jobs) <= 1:
+        return [render_chart(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=stop_profiling) as executor:
+        return list(executor.map(render_chart, jobs))
+
+
+def generate_image(analysis_dict, dates, ow, show=True):
+    """
+    creates an image with from the analysis of each sector
+    :param analysis_dict: the mapping from sector name to a list of its performance within the past 100 days
+    :param dates: a list of dates that were used to measure the prices
+    :param ow: bool of whether to overwrite the image generated.
+    :param show: bool of whether to show the image in a window (which waits for it to be closed)
+    :return: the best performing sector
+    """
+    sect, curr_max = best_sector(analysis_dict)
+
+    if show:
+        # pyplot is only needed (and only loaded) to show the window
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(10, 6))
+        draw_chart(fig, analysis_dict, dates)
+
+        # overwrite the image if user wants.
+        # as far as I can tell, I don't get a file error if the image is open and this save operation is run.
+        if ow:
+            fig.savefig(IMAGE_PATH)
+            print(f'Image was saved as "{IMAGE_PATH}" if you would like to refer to it.')
+
+        plt.show()
+        plt.close(fig)
+
+    elif ow:
+        render_chart({'analysis_dict': analysis_dict, 'dates': dates, 'path': IMAGE_PATH})
+        print(f'Image was saved as "{IMAGE_PATH}" if you would like to refer to it.')
 
     # display to user which sector performed best
     if curr_max >= 0.00:
@@ -131,16 +674,76 @@ def generate_image(analysis_dict, dates, ow):
     return sect
 
 
-def analysis_driver(symbols_df, prices_df, overwrite):
+def performance_table(results):
+    """
+    performance of each sector over the whole of each horizon
+    :param results: dictionary of horizon name to [analysis_dict, dates] (see multi_horizon_calculations)
+    :return: pandas DataFrame with a row for each sector and a column for each horizon
+    """
+    table = {name: {sector: values[-1] for sector, values in analysis_dict.items()}
+             for name, (analysis_dict, dates) in results.items()}
+    return pd.DataFrame(table)
+
+
+def cached_calculations(symbols_df, prices_df, groups, horizons, prices_path=None, coverage=None, prices_source=None):
+    """
+    sector performance for every horizon, served from the configured result cache (see result_cache.py) when the
+    inputs and horizons have been analyzed before. Only prices read from a file or store are cached (they are
+    fingerprinted by the file or store, not by their rows)
+    :param symbols_df: pandas DataFrame that has all symbols and sector data
+    :param prices_df: pandas DataFrame that contains prices for the symbols, None to stream prices_path
+    :param groups: dictionary of sectors and the symbols within them
+    :param horizons: dictionary of horizon name to (lookback, stride)
+    :param prices_path: path to a prices csv file to stream in chunks, used when prices_df is None
+    :param coverage: coverage.CoverageIndex of prices_df, None if there is none
+    :param prices_source: prices csv file or store directory prices_df was read from, None if it was not read from
+    one (then the results are not cached). A store has to match its csv file (see price_store.store_is_current)
+    :return: dictionary of horizon name to [analysis_dict, dates] (see multi_horizon_calculations)
+    """
+    def compute():
+        if prices_df is None:
+            return streaming_calculations(groups, prices_path, horizons)
+        return multi_horizon_calculations(groups, prices_df, horizons, coverage)
+
+    if prices_df is None:
+        prices_source = prices_path
+
+    cache = result_cache.get_cache()
+    prices_fingerprint = None if cache is None or prices_source is None else \
+        result_cache.source_fingerprint(prices_source)
+    if prices_fingerprint is None:
+        return compute()
+
+    # the prices are fingerprinted by their file or store, the (small) symbols by their values
+    fingerprints = [result_cache.frame_fingerprint(symbols_df, SYMBOL_COLUMNS), prices_fingerprint]
+    params = {name: list(lookback) for name, lookback in horizons.items()}
+    return cache.get_or_compute(result_cache.cache_key(fingerprints, params), compute)
+
+
+@metrics.timed('analysis')
+def analysis_driver(symbols_df, prices_df, overwrite, headless=False, charts=False, workers=None, horizons=None,
+                    prices_path=None, coverage=None, prices_source=None):
     """
     calls the appropriate analysis functions based on data and user input
     :param symbols_df: pandas DataFrame that has all symbols and sector data
     :param prices_df: pandas DataFrame that contains prices for symbols over past 100 days
     :param overwrite: bool of whether to overwrite analyzed DataFrame and image
+    :param headless: bool of whether to skip showing the image (nothing waits for a window to be closed)
+    :param charts: bool of whether to render the batch charts into CHART_DIR
+    :param workers: number of processes to render the batch charts with, defaults to one per core
+    :param horizons: dictionary of other horizons to analyze in the same pass (see parse_horizons), None for none
+    :param prices_path: path to a prices csv file to stream in chunks (see streaming_calculations), used when
+    prices_df is None
+    :param coverage: coverage.CoverageIndex of prices_df (see price_store.open_coverage), None if there is none
+    :param prices_source: prices csv file or store directory prices_df was read from, so the results can be cached
+    (see cached_calculations)
     :return:
     """
-    groups = symbols_df.groupby('sector')['symbol'].apply(list)
-    analysis_dict, dates = calculations(groups, prices_df)
+    groups = symbols_df.groupby('sector', observed=True)['symbol'].apply(list)
+    horizons = {DEFAULT_HORIZON: DEFAULT_LOOKBACK, **(horizons or dict())}
+    with metrics.stage('sector_calculations'):
+        results = cached_calculations(symbols_df, prices_df, groups, horizons, prices_path, coverage, prices_source)
+    analysis_dict, dates = results[DEFAULT_HORIZON]
 
     if overwrite:
         df = pd.DataFrame.from_dict(analysis_dict).T
@@ -148,6 +751,27 @@ def analysis_driver(symbols_df, prices_df, overwrite):
         df.to_csv('sector_analysis.csv', encoding='utf-8')
         print('sector_analysis.csv was generated.')
 
-    print('You will have to close the image for the program to finish.')
-    best_sector = generate_image(analysis_dict, dates, overwrite)
-    print(f'Stocks within the {best_sector} sector: {groups[best_sector]}')
+    # the other horizons get their own csv files, and a summary of all horizons is printed
+    if len(results) > 1:
+        for name, (horizon_dict, horizon_dates_list) in results.items():
+            if overwrite and name != DEFAULT_HORIZON:
+                df = pd.DataFrame.from_dict(horizon_dict).T
+                df.columns = horizon_dates_list
+                df.to_csv(f'sector_analysis_{name}.csv', encoding='utf-8')
+                print(f'sector_analysis_{name}.csv was generated.')
+        print(f'\n% gain / loss of each sector over each horizon:\n{performance_table(results).round(2)}')
+
+    if charts:
+        jobs = chart_jobs(analysis_dict, dates)
+        for name, (horizon_dict, horizon_dates_list) in results.items():
+            if name != DEFAULT_HORIZON:
+                jobs.append({'analysis_dict': horizon_dict, 'dates': horizon_dates_list,
+                             'path': os.path.join(CHART_DIR, f'all_{name}.png'),
+                             'title': f'Sector Performances (last {name})'})
+        paths = render_charts(jobs, workers)
+        print(f'{len(paths)} charts were saved in the "{CHART_DIR}" directory.')
+
+    if not headless:
+        print('You will have to close the image for the program to finish.')
+    sect = generate_image(analysis_dict, dates, overwrite, show=not headless)
+    print(f'Stocks within the {sect} sector: {groups[sect]}')
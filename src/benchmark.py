@@ -0,0 +1,618 @@
+import alphavantage_api as av
+import analysis as an
+import fixtures
+import http_client
+import pipeline as pl
+import price_store
+import scrape_swingtradebot as stb
+import scrape_yahoo_finance as syf
+import pandas as pd
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# scales of the pipeline suite, as "symbols x trading days" (200 x 100 is about the size of a normal run)
+PIPELINE_SCALES = '200x100,2000x250,20000x250,200x5000'
+
+# analysis.calculations loops over every row once per sector and date, so it is skipped above this many rows
+LOOP_MAX_ROWS = 100000
+
+# number of distinct price series generated for the pipeline suite. Symbols reuse them, so generating the data
+# does not need memory for every symbol, while the files are the same size as real ones
+SERIES_POOL = 50
+
+# chance that a synthetic symbol misses a day. analysis.calculations needs every symbol to have every sampled date,
+# so it is 0 by default
+MISSING_RATE = 0.0
+
+# universes of the remote suite, in symbols (200 is a normal remote run)
+REMOTE_SCALES = '200,2000,20000'
+
+# api keys the remote suite uses, and the calls each can make per minute when the fake upstream does not throttle
+REMOTE_KEYS = 4
+REMOTE_CALLS_PER_MINUTE = 60000
+
+# -h and invalid arguments should return within this many milliseconds
+STARTUP_BUDGET_MS = 100
+
+# modules a local run should never import
+SCRAPER_MODULES = ('requests', 'bs4', 'scrape_swingtradebot', 'scrape_yahoo_finance', 'alphavantage_api',
+                   'matplotlib.pyplot')
+
+# runs a headless local run and prints the scraper modules it imported
+LOCAL_RUN_CODE = '''
+import json
+import sys
+sys.argv = ['fulay_atharva.py', '-source=local', '-headless=1']
+import fulay_atharva
+fulay_atharva.main()
+print(json.dumps([m for m in {modules} if m in sys.modules]))
+'''
+
+
+def time_call(func, *args, repeat=3):
+    """
+    runs a function a few times and keeps the fastest time
+    :param func: function to time
+    :param args: arguments passed to the function
+    :param repeat: number of times to run the function
+    :return: [best_seconds, result] where result is the return value of the last run
+    """
+    best = None
+    result = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, result
+
+
+def same_analysis(expected, actual):
+    """
+    checks that two (analysis_dict, dates) results match (NaN is treated as equal to NaN)
+    :param expected: result from analysis.calculations
+    :param actual: result from the function being compared
+    :return: bool of whether the results match
+    """
+    expected_dict, expected_dates = expected
+    actual_dict, actual_dates = actual
+
+    if list(expected_dates) != list(actual_dates) or list(expected_dict.keys()) != list(actual_dict.keys()):
+        return False
+
+    for sector, values in expected_dict.items():
+        if len(values) != len(actual_dict[sector]):
+            return False
+
+        for a, b in zip(values, actual_dict[sector]):
+            if math.isnan(a) and math.isnan(b):
+                continue
+            if not math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9):
+                return False
+
+    return True
+
+
+def benchmark_calculations(symbols_df, prices_df, repeat=3):
+    """
+    times analysis.calculations against analysis.vectorized_calculations on the same data
+    :param symbols_df: pandas DataFrame that has all symbols and sector data
+    :param prices_df: pandas DataFrame that contains prices for the symbols
+    :param repeat: number of times to run each function (the fastest run is kept)
+    :return: dictionary with the timings and whether the two results match
+    """
+    groups = symbols_df.groupby('sector')['symbol'].apply(list)
+
+    loop_seconds, loop_result = time_call(an.calculations, groups, prices_df, repeat=repeat)
+    vector_seconds, vector_result = time_call(an.vectorized_calculations, groups, prices_df, repeat=repeat)
+
+    return {'calculations': loop_seconds,
+            'vectorized_calculations': vector_seconds,
+            'speedup': loop_seconds / vector_seconds,
+            'match': same_analysis(loop_result, vector_result)}
+
+
+def pages_per_second(parse, pages, repeat=3):
+    """
+    parses every page and returns the rate
+    :param parse: function that parses one page
+    :param pages: list of html pages
+    :param repeat: number of times to parse all the pages (the fastest run is kept)
+    :return: [pages_per_second, results] where results is the list of parsed pages
+    """
+    seconds, results = time_call(lambda: [parse(page) for page in pages], repeat=repeat)
+    return len(pages) / seconds, results
+
+
+def benchmark_parsers(num_pages=20, repeat=3, seed=0):
+    """
+    times the full BeautifulSoup parse against the fast (strained) parse on fixture pages
+    :param num_pages: number of pages of each kind to parse
+    :param repeat: number of times to parse the pages (the fastest run is kept)
+    :param seed: seed for the fixture pages
+    :return: dictionary with pages/sec for each parser and whether the fast parse gives the same results
+    """
+    rng = random.Random(seed)
+    profiles = list()
+    listings = list()
+    for i in range(num_pages):
+        symbol = f'SYM{i}'
+        profiles.append(fixtures.profile_page(symbol, fixtures.company(symbol, rng), seed=i))
+        listings.append(fixtures.listing_page([fixtures.listing_company(f'{symbol}X{j}', rng) for j in range(20)],
+                                              seed=i))
+
+    results = dict()
+    for name, parse, pages in (('profile', syf.parse_profile, profiles),
+                               ('listing', stb.parse_listing_page, listings)):
+        full_rate, full_results = pages_per_second(lambda page: parse(page, fast=False), pages, repeat)
+        fast_rate, fast_results = pages_per_second(lambda page: parse(page, fast=True), pages, repeat)
+        results[name] = {'full_pages_per_second': full_rate, 'fast_pages_per_second': fast_rate,
+                         'speedup': fast_rate / full_rate, 'match': full_results == fast_results}
+    return results
+
+
+def measure(func, *args, repeat=1):
+    """
+    times a function (fastest of repeat runs) and measures its peak memory in a separate run, so tracing the
+    allocations does not slow down the timed runs
+    :param func: function to measure
+    :param args: arguments passed to the function
+    :param repeat: number of timed runs
+    :return: [measurements, result] where measurements is a dictionary with seconds and peak_mb
+    """
+    seconds, result = time_call(func, *args, repeat=repeat)
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': seconds, 'peak_mb': peak / 2 ** 20}, result
+
+
+def parse_scales(text):
+    """
+    :param text: comma separated scales like "200x90,2000x250" (symbols x trading days)
+    :return: list of (num_symbols, num_days)
+    """
+    scales = list()
+    for scale in text.split(','):
+        num_symbols, num_days = scale.lower().split('x')
+        scales.append((int(num_symbols), int(num_days)))
+    return scales
+
+
+def deposit_synthetic_prices(symbols, series):
+    """
+    writes prices for every symbol through PriceWriter, the way alphavantage_api_call does
+    :param symbols: list of symbols
+    :param series: list of time series (see fixtures.price_series), symbols use them in turn
+    :return: nothing is returned
+    """
+    headers = list(list(series[0].values())[0].keys())
+    with av.PriceWriter(overwrite=True) as writer:
+        for i, symbol in enumerate(symbols):
+            writer.deposit(symbol, series[i % len(series)], headers)
+
+
+def quiet(func):
+    """
+    :param func: function that prints progress messages
+    :return: function that does the same without printing
+    """
+    def wrapper(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func(*args)
+    return wrapper
+
+
+def benchmark_pipeline(num_symbols, num_days, repeat=1, seed=0, loop_max_rows=LOOP_MAX_ROWS,
+                       missing_rate=MISSING_RATE):
+    """
+    generates synthetic symbols.csv and price files at the given scale in a temporary directory and measures each
+    local stage on them separately: deposit_to_csv, the price deposit through PriceWriter, local_driver (from the
+    columnar store, and from the CSV files with compact types and with every column) and the sector calculations
+    (in memory, streamed from the CSV file and, for small files, the original loop)
+    :param num_symbols: number of symbols
+    :param num_days: number of trading days for each symbol
+    :param repeat: number of timed runs of each stage (the fastest run is kept)
+    :param seed: seed for the synthetic data
+    :param loop_max_rows: analysis.calculations is skipped for price files with more rows than this (and for less
+    than 100 days, since it picks the dates from the first 100 rows of the file)
+    :param missing_rate: chance that a symbol misses a day
+    :return: dictionary with the scale, the size of the files, the measurements of each stage and whether the two
+    calculations match (None if calculations was skipped)
+    """
+    import fulay_atharva
+
+    symbols = fixtures.synthetic_symbols(num_symbols, seed)
+    series = [time_series for _, time_series in fixtures.synthetic_prices(range(SERIES_POOL), num_days, seed,
+                                                                                  missing_rate)]
+    stages = dict()
+    match = None
+
+    cwd = os.getcwd()
+    path = tempfile.mkdtemp(prefix='benchmark_')
+    os.chdir(path)
+    try:
+        stages['deposit_to_csv'], _ = measure(stb.deposit_to_csv, symbols, repeat=repeat)
+        stages['price_writer_deposit'], _ = measure(deposit_synthetic_prices, list(symbols.keys()), series,
+                                                    repeat=repeat)
+        csv_bytes = os.path.getsize('ninety_day_historical_prices.csv')
+
+        stages['local_driver_store'], _ = measure(quiet(fulay_atharva.local_driver), repeat=repeat)
+        shutil.rmtree(price_store.STORE_PATH)
+        stages['local_driver_csv'], _ = measure(quiet(fulay_atharva.local_driver), repeat=repeat)
+        stages['local_driver_csv_full'], (symbols_df, prices_df) = measure(quiet(fulay_atharva.local_driver), False,
+                                                                           repeat=repeat)
+
+        groups = symbols_df.groupby('sector')['symbol'].apply(list)
+        stages['vectorized_calculations'], vector_result = measure(an.vectorized_calculations, groups, prices_df,
+                                                                   repeat=repeat)
+        stages['streaming_calculations'], _ = measure(an.streaming_calculations, groups,
+                                                      'ninety_day_historical_prices.csv', repeat=repeat)
+        if len(prices_df) <= loop_max_rows and num_days >= 100:
+            stages['calculations'], loop_result = measure(an.calculations, groups, prices_df, repeat=repeat)
+            match = same_analysis(loop_result, vector_result)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+
+    return {'symbols': num_symbols, 'days': num_days, 'rows': len(prices_df), 'csv_mb': csv_bytes / 2 ** 20,
+            'stages': stages, 'match': match}
+
+
+def start_upstream(num_symbols, latency=0.0, error_rate=0.0, calls_per_minute=0, seed=0):
+    """
+    starts fake_upstream.py in its own process (so serving the pages does not hold the GIL of the process being
+    measured) and waits for its url
+    :param num_symbols: number of symbols in the listing
+    :param latency: seconds each response is delayed by on average
+    :param error_rate: chance that a request is answered with a 503
+    :param calls_per_minute: number of alphavantage calls the server allows per minute for each key, 0 for no limit
+    :param seed: seed for the symbols and prices
+    :return: [process, url]
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_upstream.py')
+    process = subprocess.Popen([sys.executable, path, '-port=0', f'-symbols={num_symbols}', f'-latency={latency}',
+                                f'-error_rate={error_rate}', f'-calls_per_minute={calls_per_minute}', f'-seed={seed}'],
+                               stdout=subprocess.PIPE, text=True)
+
+    # the first line ends with the url
+    line = process.stdout.readline()
+    if not line:
+        process.kill()
+        raise RuntimeError('fake_upstream.py did not start')
+    return process, line.split()[-1]
+
+
+def remote_run(mode, max_page_num, api_keys, calls_per_minute):
+    """
+    runs the remote scrape and alphavantage calls and writes symbols.csv and the prices file, like -source=remote
+    :param mode: "pipeline" for the streaming pipeline, "batch" for the scrape and then the alphavantage calls
+    :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+    :param api_keys: list of api keys
+    :param calls_per_minute: number of calls allowed per minute for each api key
+    :return: [symbols, prices_df]
+    """
+    if mode == 'pipeline':
+        symbols, message, success, prices_df = pl.Pipeline(max_page_num, True, api_keys,
+                                                           calls_per_minute=calls_per_minute).run()
+        stb.deposit_to_csv(symbols)
+    else:
+        symbols, message, success = stb.swingtradebot_scraper(max_page_num)
+        stb.deposit_to_csv(symbols)
+        prices_df = av.alphavantage_api_call(list(symbols.keys()), api_keys, True, max_page_num,
+                                             calls_per_minute=calls_per_minute)
+    return symbols, prices_df
+
+
+def benchmark_remote(num_symbols, mode='pipeline', latency=0.0, error_rate=0.0, calls_per_minute=0,
+                     num_keys=REMOTE_KEYS, seed=0):
+    """
+    measures the end to end throughput of the remote run against fake_upstream.py, in a temporary directory
+    :param num_symbols: number of symbols in the listing
+    :param mode: "pipeline" for the streaming pipeline, "batch" for the scrape and then the alphavantage calls
+    :param latency: seconds each response of the server is delayed by on average
+    :param error_rate: chance that the server answers a request with a 503
+    :param calls_per_minute: number of alphavantage calls the server allows per minute for each key, 0 for no limit
+    (the key pool is given the same limit)
+    :param num_keys: number of api keys to use
+    :param seed: seed for the symbols and prices
+    :return: dictionary with the seconds, symbols per second, requests, retries and failures, and how many symbols
+    came back with a profile and with prices (completed is False if the run ended itself, i.e. 10 503s in a row)
+    """
+    process, url = start_upstream(num_symbols, latency, error_rate, calls_per_minute, seed)
+    variables = {stb.BASE_URL_VARIABLE: url, syf.BASE_URL_VARIABLE: url, av.API_URL_VARIABLE: f'{url}/query'}
+    saved = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+
+    api_keys = [f'BENCHMARK{i}' for i in range(num_keys)]
+    max_page_num = math.ceil(num_symbols / 20) + 1
+    symbols = dict()
+    prices_df = None
+    completed = True
+
+    cwd = os.getcwd()
+    path = tempfile.mkdtemp(prefix='benchmark_')
+    os.chdir(path)
+    start = time.perf_counter()
+    try:
+        symbols, prices_df = quiet(remote_run)(mode, max_page_num, api_keys,
+                                               calls_per_minute or REMOTE_CALLS_PER_MINUTE)
+    except SystemExit:
+        completed = False
+    finally:
+        seconds = time.perf_counter() - start
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+        process.kill()
+        process.wait()
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    # each run uses a new port, so the counters of its host only have this run
+    stats = http_client.get_client().stats().get(url.split('//')[-1], dict())
+    requests_made = stats.get('requests', 0)
+    return {'symbols': num_symbols, 'mode': mode, 'completed': completed, 'seconds': seconds,
+            'symbols_per_second': num_symbols / seconds, 'requests': requests_made,
+            'requests_per_second': requests_made / seconds, 'retries': stats.get('retries', 0),
+            'failures': stats.get('failures', 0),
+            'profiles': sum(1 for info in symbols.values() if info.get('sector') is not None),
+            'priced': 0 if prices_df is None else int(prices_df['symbol'].nunique())}
+
+
+def git_commit():
+    """
+    :return: hash of the current git commit, None if it is not known
+    """
+    try:
+        output = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def compare_results(old, new):
+    """
+    prints how much each stage changed between two saved pipeline results
+    :param old: results loaded from an earlier run
+    :param new: results of this run
+    :return: nothing is returned
+    """
+    old_scales = {(scale['symbols'], scale['days']): scale for scale in old['scales']}
+    print(f'Compared to commit {old.get("commit")}:')
+
+    for scale in new['scales']:
+        old_scale = old_scales.get((scale['symbols'], scale['days']))
+        if old_scale is None:
+            continue
+
+        for stage, measurements in scale['stages'].items():
+            old_measurements = old_scale['stages'].get(stage)
+            if old_measurements is None:
+                continue
+            print(f'{scale["symbols"]}x{scale["days"]} {stage}: '
+                  f'{old_measurements["seconds"] / measurements["seconds"]:.2f}x as fast, '
+                  f'{old_measurements["peak_mb"]:.1f} -> {measurements["peak_mb"]:.1f} MB peak')
+
+
+def pipeline_suite(scales, repeat, output, compare=None):
+    """
+    runs the pipeline benchmark at each scale and saves the results as json
+    :param scales: list of (num_symbols, num_days)
+    :param repeat: number of timed runs of each stage
+    :param output: path of the json file to write the results to
+    :param compare: path of a json file from an earlier run to compare against, None to not compare
+    :return: dictionary of the results
+    """
+    results = {'commit': git_commit(), 'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'pandas': pd.__version__, 'scales': list()}
+
+    for num_symbols, num_days in scales:
+        scale = benchmark_pipeline(num_symbols, num_days, repeat)
+        results['scales'].append(scale)
+
+        print(f'{num_symbols} symbols x {num_days} days ({scale["rows"]} rows, {scale["csv_mb"]:.1f} MB csv, '
+              f'calculations match: {scale["match"]}):')
+        for stage, measurements in scale['stages'].items():
+            print(f'    {stage:<25} {measurements["seconds"]:9.4f} seconds {measurements["peak_mb"]:9.1f} MB peak')
+
+    with open(output, mode='w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {output}')
+
+    if compare is not None:
+        with open(compare, mode='r', encoding='utf-8') as f:
+            compare_results(json.load(f), results)
+
+    return results
+
+
+def remote_suite(scales, modes, latency, error_rate, calls_per_minute, num_keys, output):
+    """
+    runs the remote benchmark for each universe and mode and saves the results as json
+    :param scales: list of numbers of symbols
+    :param modes: list of "pipeline" and/or "batch"
+    :param latency: seconds each response of the server is delayed by on average
+    :param error_rate: chance that the server answers a request with a 503
+    :param calls_per_minute: number of alphavantage calls the server allows per minute for each key, 0 for no limit
+    :param num_keys: number of api keys to use
+    :param output: path of the json file to write the results to
+    :return: dictionary of the results
+    """
+    results = {'commit': git_commit(), 'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'latency': latency, 'error_rate': error_rate,
+               'calls_per_minute': calls_per_minute, 'keys': num_keys, 'runs': list()}
+
+    for num_symbols in scales:
+        for mode in modes:
+            run = benchmark_remote(num_symbols, mode, latency, error_rate, calls_per_minute, num_keys)
+            results['runs'].append(run)
+            print(f'{num_symbols:>6} symbols {mode:<8} {run["seconds"]:9.1f} seconds '
+                  f'{run["symbols_per_second"]:7.1f} symbols/sec {run["requests_per_second"]:7.1f} requests/sec '
+                  f'{run["retries"]} retries, {run["failures"]} failures, {run["profiles"]} profiles, '
+                  f'{run["priced"]} priced{"" if run["completed"] else " (ended early)"}')
+
+    with open(output, mode='w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {output}')
+    return results
+
+
+def startup_ms(args, repeat=5):
+    """
+    runs a python command in a new process and times it
+    :param args: arguments for python (i.e. ["fulay_atharva.py", "-h"])
+    :param repeat: number of runs (the median is kept)
+    :return: median milliseconds
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, capture_output=True, cwd=src_dir)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def local_run_imports(symbols_path, prices_path):
+    """
+    runs a headless local run on copies of the CSV files and lists the scraper modules it imported
+    :param symbols_path: path to the symbols CSV file
+    :param prices_path: path to the prices CSV file
+    :return: list of module names (empty if the local run imported none of SCRAPER_MODULES)
+    """
+    path = tempfile.mkdtemp(prefix='benchmark_')
+    try:
+        shutil.copy(symbols_path, os.path.join(path, 'symbols.csv'))
+        shutil.copy(prices_path, os.path.join(path, 'ninety_day_historical_prices.csv'))
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', LOCAL_RUN_CODE.format(modules=SCRAPER_MODULES)],
+                                capture_output=True, text=True, cwd=path, env=env, check=True)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def benchmark_startup(symbols_path, prices_path, repeat=5):
+    """
+    measures the startup of fulay_atharva.py against the budget
+    :param symbols_path: path to the symbols CSV file (for the local run)
+    :param prices_path: path to the prices CSV file (for the local run)
+    :param repeat: number of runs of each command (the median is kept)
+    :return: dictionary with the milliseconds of each command and the scraper modules a local run imported
+    """
+    results = {'python': startup_ms(['-c', 'pass'], repeat),
+               'help': startup_ms(['fulay_atharva.py', '-h'], repeat),
+               'invalid_source': startup_ms(['fulay_atharva.py', '-source=invalid'], repeat)}
+    results['within_budget'] = max(results['help'], results['invalid_source']) < STARTUP_BUDGET_MS
+    results['local_scraper_imports'] = local_run_imports(symbols_path, prices_path)
+    return results
+
+
+def main():
+    """
+    benchmarks the analysis on the local CSV files, the HTML parsers on fixture pages, or the whole local pipeline
+    on synthetic data
+    :return: nothing is returned
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-symbols', type=str, required=False, default='symbols.csv',
+                        help='Path to the symbols CSV file. Defaults to "symbols.csv".')
+    parser.add_argument('-prices', type=str, required=False, default='ninety_day_historical_prices.csv',
+                        help='Path to the prices CSV file. Defaults to "ninety_day_historical_prices.csv".')
+    parser.add_argument('-repeat', type=int, required=False, default=3,
+                        help='Number of times to run each function. The fastest run is reported.')
+    parser.add_argument('-suite', type=str, required=False, default='analysis',
+                        help='"analysis" times the sector calculations on the CSV files. "parsers" times the HTML '
+                             'parsers on fixture pages. "pipeline" times and memory profiles each local stage on '
+                             'synthetic data. "startup" times -h and invalid arguments and checks what a local run '
+                             'imports. "remote" measures the throughput of the whole remote run against the local '
+                             'fake_upstream.py server. Defaults to "analysis".')
+    parser.add_argument('-scales', type=str, required=False, default=PIPELINE_SCALES,
+                        help=f'Scales of the pipeline suite as symbols x trading days. Defaults to '
+                             f'"{PIPELINE_SCALES}".')
+    parser.add_argument('-output', type=str, required=False, default='benchmark_results.json',
+                        help='JSON file the pipeline and remote suites write their results to. Defaults to '
+                             '"benchmark_results.json".')
+    parser.add_argument('-compare', type=str, required=False, default=None,
+                        help='JSON file from an earlier pipeline run (i.e. another commit) to compare against.')
+    parser.add_argument('-universes', type=str, required=False, default=REMOTE_SCALES,
+                        help=f'Numbers of symbols of the remote suite. Defaults to "{REMOTE_SCALES}".')
+    parser.add_argument('-modes', type=str, required=False, default='pipeline,batch',
+                        help='Remote runs to measure: "pipeline" (-pipeline=1) and/or "batch" (the scrape, then the '
+                             'Alphavantage calls). Defaults to "pipeline,batch".')
+    parser.add_argument('-latency', type=float, required=False, default=0.0,
+                        help='Seconds the fake upstream delays each response by on average (remote suite). '
+                             'Defaults to 0.')
+    parser.add_argument('-error_rate', type=float, required=False, default=0.0,
+                        help='Chance that the fake upstream answers a request with a 503 (remote suite). '
+                             'Defaults to 0.')
+    parser.add_argument('-calls_per_minute', type=int, required=False, default=0,
+                        help='Alphavantage calls the fake upstream allows per minute for each key before throttling, '
+                             '"0" for no limit (remote suite). Defaults to 0.')
+    parser.add_argument('-keys', type=int, required=False, default=REMOTE_KEYS,
+                        help=f'Number of API keys to use (remote suite). Defaults to {REMOTE_KEYS}.')
+    args, unknown = parser.parse_known_args()
+
+    if args.suite == 'remote':
+        remote_suite([int(n) for n in args.universes.split(',')], args.modes.split(','), args.latency,
+                     args.error_rate, args.calls_per_minute, args.keys, args.output)
+        return
+
+    if args.suite == 'startup':
+        results = benchmark_startup(args.symbols, args.prices, max(args.repeat, 5))
+        print(f'python alone:    {results["python"]:.1f} ms')
+        print(f'-h:              {results["help"]:.1f} ms')
+        print(f'invalid -source: {results["invalid_source"]:.1f} ms')
+        print(f'within the {STARTUP_BUDGET_MS} ms budget: {results["within_budget"]}')
+        print(f'scraper modules imported by a local run: {results["local_scraper_imports"] or "none"}')
+        return
+
+    if args.suite == 'pipeline':
+        pipeline_suite(parse_scales(args.scales), args.repeat, args.output, args.compare)
+        return
+
+    if args.suite == 'parsers':
+        for name, results in benchmark_parsers(repeat=args.repeat).items():
+            print(f'{name} pages: full parse {results["full_pages_per_second"]:.1f} pages/sec, fast parse '
+                  f'{results["fast_pages_per_second"]:.1f} pages/sec ({results["speedup"]:.1f}x), '
+                  f'results match: {results["match"]}')
+        return
+
+    symbols_df = pd.read_csv(args.symbols)
+    prices_df = pd.read_csv(args.prices)
+
+    results = benchmark_calculations(symbols_df, prices_df, args.repeat)
+    print(f'calculations:            {results["calculations"]:.4f} seconds')
+    print(f'vectorized_calculations: {results["vectorized_calculations"]:.4f} seconds')
+    print(f'speedup: {results["speedup"]:.1f}x, results match: {results["match"]}')
+
+
+if __name__ == '__main__':
+    main()
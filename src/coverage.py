@@ -0,0 +1,177 @@
+import numpy as np
+import os
+
+COVERAGE_FILE = 'coverage.npz'
+
+
+def row_bytes(num_symbols):
+    """
+    :param num_symbols: number of symbols
+    :return: number of bytes in the bitmap of one date (one bit per symbol)
+    """
+    return (num_symbols + 7) // 8
+
+
+class CoverageIndex:
+    """
+    bitmap of which symbols have prices on which trading dates. Each date has one row of bits, one bit per symbol
+    (symbols and dates are numbered the same way as the codes of the price store), so the symbols that have prices on
+    every one of a set of dates are found by ANDing the rows of those dates
+    """
+
+    def __init__(self, symbols, dates, bits=None):
+        """
+        :param symbols: list of symbols, the position of a symbol is its code
+        :param dates: list of dates ("YYYY-MM-DD"), the position of a date is its code
+        :param bits: packed uint8 bitmap of shape (dates, row_bytes(symbols)), None for an empty bitmap. A smaller
+        bitmap (from before symbols or dates were added) is padded with zeros
+        """
+        self.symbols = list(symbols)
+        self.dates = list(dates)
+        self.bits = np.zeros((len(self.dates), row_bytes(len(self.symbols))), dtype=np.uint8)
+        if bits is not None:
+            self.bits[:bits.shape[0], :bits.shape[1]] = bits
+
+    @classmethod
+    def from_codes(cls, symbols, dates, symbol_codes, date_codes):
+        """
+        builds the bitmap from the symbol and date codes of every row
+        :param symbols: list of symbols, the position of a symbol is its code
+        :param dates: list of dates, the position of a date is its code
+        :param symbol_codes: int array of the symbol code of each row
+        :param date_codes: int array of the date code of each row
+        :return: CoverageIndex
+        """
+        index = cls(symbols, dates)
+        index.mark(symbol_codes, date_codes)
+        return index
+
+    @classmethod
+    def from_pairs(cls, symbol_values, date_values):
+        """
+        builds the bitmap from the symbol and date of every row (i.e. the columns of the prices csv file)
+        :param symbol_values: symbol of each row
+        :param date_values: date of each row ("YYYY-MM-DD")
+        :return: CoverageIndex
+        """
+        symbols, symbol_codes = np.unique(np.asarray(symbol_values, dtype=str), return_inverse=True)
+        dates, date_codes = np.unique(np.asarray(date_values, dtype=str), return_inverse=True)
+        return cls.from_codes(list(symbols), list(dates), symbol_codes, date_codes)
+
+    def grow(self, symbols, dates):
+        """
+        makes room for symbols and dates that were added to the end of the dictionaries
+        :param symbols: list of all symbols (the known ones first, in the same order)
+        :param dates: list of all dates (the known ones first, in the same order)
+        :return: nothing is returned
+        """
+        if len(symbols) == len(self.symbols) and len(dates) == len(self.dates):
+            return
+        bits = self.bits
+        self.__init__(symbols, dates, bits)
+
+    def mark(self, symbol_codes, date_codes):
+        """
+        sets the bits of (symbol, date) pairs that have prices
+        :param symbol_codes: int array of symbol codes
+        :param date_codes: int array of date codes (same length)
+        :return: nothing is returned
+        """
+        symbol_codes = np.asarray(symbol_codes, dtype=np.int64)
+        date_codes = np.asarray(date_codes, dtype=np.int64)
+        masks = (0x80 >> (symbol_codes & 7)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, (date_codes, symbol_codes >> 3), masks)
+
+    def matrix(self):
+        """
+        :return: bool matrix of shape (dates, symbols), True where the symbol has prices on that date
+        """
+        return np.unpackbits(self.bits, axis=1, count=len(self.symbols)).astype(bool)
+
+    def trading_dates(self):
+        """
+        every date that has prices for any symbol
+        :return: sorted list of dates, oldest first
+        """
+        return sorted(date for date, row in zip(self.dates, self.bits) if row.any())
+
+    def complete(self, dates):
+        """
+        symbols that have prices on every one of the dates
+        :param dates: list of dates ("YYYY-MM-DD")
+        :return: list of symbols, in code order (empty if a date is not in the index)
+        """
+        lookup = {date: code for code, date in enumerate(self.dates)}
+        rows = [lookup.get(date) for date in dates]
+        if len(rows) == 0 or None in rows:
+            return list()
+
+        combined = np.bitwise_and.reduce(self.bits[rows], axis=0)
+        mask = np.unpackbits(combined, count=len(self.symbols)).astype(bool)
+        return [symbol for symbol, has_all in zip(self.symbols, mask) if has_all]
+
+    def holes(self, since=None):
+        """
+        symbols that are missing a trading date between their first and last date with prices (a date is a trading
+        date if any symbol has prices on it). Dates before a symbol's first date (listed later) or after its last date
+        (delisted) are not holes
+        :param since: dictionary of symbol to a date, only dates after it are looked at for that symbol (i.e. holes
+        that could not be filled before), None to look at every date
+        :return: dictionary of symbol to its oldest missing date
+        """
+        order = np.argsort(np.asarray(self.dates, dtype=str), kind='stable')
+        order = order[self.bits[order].any(axis=1)]
+        if len(order) == 0:
+            return dict()
+
+        present = self.matrix()[order]
+        num_dates = len(order)
+        first = present.argmax(axis=0)
+        last = num_dates - 1 - present[::-1].argmax(axis=0)
+
+        # symbols that were already looked at are only checked after that date
+        if since:
+            sorted_dates = np.asarray(self.dates, dtype=str)[order]
+            for code, symbol in enumerate(self.symbols):
+                if symbol in since:
+                    first[code] = max(first[code], np.searchsorted(sorted_dates, since[symbol], side='right'))
+
+        # dates between the first and last date of each symbol that it has no prices for
+        rows = np.arange(num_dates)[:, np.newaxis]
+        missing = ~present & (rows >= first) & (rows <= last) & present.any(axis=0)
+        has_holes = missing.any(axis=0)
+        oldest = missing.argmax(axis=0)
+        return {self.symbols[code]: self.dates[order[oldest[code]]] for code in np.flatnonzero(has_holes)}
+
+    def save(self, file_name, rows):
+        """
+        writes the bitmap (to a temp file first, so it is never half written)
+        :param file_name: path of the file
+        :param rows: number of rows of prices the bitmap was built from, so a stale bitmap can be recognized
+        :return: nothing is returned
+        """
+        tmp_name = file_name + '.tmp'
+        with open(tmp_name, mode='wb') as f:
+            np.savez(f, bits=self.bits, rows=np.array(rows))
+        os.replace(tmp_name, file_name)
+
+    @classmethod
+    def load(cls, file_name, symbols, dates, rows):
+        """
+        reads a bitmap written by save
+        :param file_name: path of the file
+        :param symbols: list of symbols, the position of a symbol is its code
+        :param dates: list of dates, the position of a date is its code
+        :param rows: number of rows of prices the bitmap should have been built from
+        :return: CoverageIndex, or None if there is no file or it does not match the prices
+        """
+        try:
+            with np.load(file_name) as data:
+                bits = data['bits']
+                saved_rows = int(data['rows'])
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            return None
+
+        if saved_rows != rows or bits.shape[0] > len(dates) or bits.shape[1] > row_bytes(len(symbols)):
+            return None
+        return cls(symbols, dates, bits)
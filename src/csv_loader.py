@@ -0,0 +1,69 @@
+import pandas as pd
+
+SYMBOLS_PATH = 'symbols.csv'
+PRICES_PATH = 'ninety_day_historical_prices.csv'
+
+# rows read at a time by iter_prices
+CHUNK_ROWS = 200000
+
+# types of the symbols.csv columns. Columns with few distinct values are categorical (one copy of each value)
+SYMBOL_TYPES = {'symbol': 'category', 'name': 'str', 'close_price': 'float32', 'volatility': 'float32',
+                'avg_volume': 'int64', 'phone': 'str', 'website': 'str', 'city': 'category', 'country': 'category',
+                'sector': 'category', 'industry': 'category', 'fte': 'float32', 'description': 'str'}
+
+# types of the prices columns. Prices only have 4 decimals, so float32 is enough
+PRICE_TYPES = {'symbol': 'category', '1. open': 'float32', '2. high': 'float32', '3. low': 'float32',
+               '4. close': 'float32', '5. adjusted close': 'float32', '6. volume': 'int64',
+               '7. dividend amount': 'float32', '8. split coefficient': 'float32'}
+
+
+def read_typed_csv(path, types, columns=None, parse_dates=None):
+    """
+    reads a csv file with explicit types, keeping only the columns that are needed
+    :param path: path to the csv file
+    :param types: dictionary of column name to type (columns that are not in it are inferred)
+    :param columns: list of columns to read, None for all of them
+    :param parse_dates: list of columns to parse as dates
+    :return: pandas DataFrame
+    """
+    usecols = None if columns is None else (lambda column: column in columns)
+    return pd.read_csv(path, usecols=usecols, dtype=types, parse_dates=parse_dates, encoding='utf-8')
+
+
+def read_symbols(path=SYMBOLS_PATH, columns=None):
+    """
+    reads symbols.csv with compact types (sector, industry, ... are categorical and the numbers are float32)
+    :param path: path to the symbols csv file
+    :param columns: list of columns to read, None for all of them
+    :return: pandas DataFrame
+    """
+    return read_typed_csv(path, SYMBOL_TYPES, columns)
+
+
+def read_prices(path=PRICES_PATH, columns=None):
+    """
+    reads the prices csv file with compact types (categorical symbols, float32 prices and parsed dates)
+    :param path: path to the prices csv file
+    :param columns: list of price columns to read (symbol and date are always read), None for all of them
+    :return: pandas DataFrame
+    """
+    if columns is not None:
+        columns = ['symbol', 'date'] + [column for column in columns if column not in ('symbol', 'date')]
+    return read_typed_csv(path, PRICE_TYPES, columns, parse_dates=['date'])
+
+
+def iter_prices(path=PRICES_PATH, columns=None, chunk_rows=CHUNK_ROWS, types=None):
+    """
+    reads the prices csv file a chunk of rows at a time, so the file never has to fit in memory
+    :param path: path to the prices csv file
+    :param columns: list of columns to read, None for all of them
+    :param chunk_rows: number of rows in each chunk
+    :param types: dictionary of column name to type, defaults to PRICE_TYPES with the dates kept as text
+    :return: generator of pandas DataFrames, in file order
+    """
+    if types is None:
+        types = {**PRICE_TYPES, 'symbol': 'str', 'date': 'str'}
+    usecols = None if columns is None else (lambda column: column in columns)
+    with pd.read_csv(path, usecols=usecols, dtype=types, chunksize=chunk_rows, encoding='utf-8') as reader:
+        for chunk in reader:
+            yield chunk
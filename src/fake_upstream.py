@@ -0,0 +1,281 @@
+import fixtures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+
+# number of symbols on each listing page (same as swingtradebot.com)
+PAGE_SIZE = 20
+
+# trading days in a "compact" and a "full" alphavantage response
+COMPACT_DAYS = 100
+FULL_DAYS = 1000
+
+THROTTLE_NOTE = ('Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute and 500 '
+                 'calls per day.')
+
+
+class FakeUpstream:
+    """
+    local stand-in for swingtradebot.com, finance.yahoo.com and the alphavantage API, so the remote run can be
+    benchmarked and stressed offline. It serves listing pages, profile pages and daily time series built from
+    fixtures.py for a universe of num_symbols symbols (the same symbols and prices every time for the same seed).
+    Every response can be delayed, answered with a 503 at random, and alphavantage calls are throttled with a "Note"
+    once a key makes more than calls_per_minute calls in a minute.
+    """
+
+    def __init__(self, num_symbols=200, latency=0.0, error_rate=0.0, calls_per_minute=0, seed=0,
+                 host='127.0.0.1', port=0, filler_blocks=400, clock=time.monotonic):
+        """
+        :param num_symbols: number of symbols in the listing
+        :param latency: seconds each response is delayed by on average (somewhere between half and one and a half
+        times this)
+        :param error_rate: chance that a request is answered with a 503
+        :param calls_per_minute: number of alphavantage calls allowed per minute for each api key, 0 for no limit
+        :param seed: seed for the symbols and prices
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any free port
+        :param filler_blocks: number of blocks of markup the parsers do not need in each profile page (see fixtures)
+        :param clock: function that returns the current time in seconds
+        """
+        self.num_symbols = num_symbols
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls_per_minute = calls_per_minute
+        self.seed = seed
+        self.filler_blocks = filler_blocks
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = collections.defaultdict(collections.deque)
+        self.requests = collections.Counter()
+
+        self.server = ThreadingHTTPServer((host, port), UpstreamHandler)
+        self.server.daemon_threads = True
+        self.server.upstream = self
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        :return: base url of the server (i.e. "http://127.0.0.1:8000")
+        """
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def environment(self):
+        """
+        environment variables that point the scrapers and the alphavantage calls at this server
+        :return: dictionary of variable name to url
+        """
+        return {'SWINGTRADEBOT_URL': self.url, 'YAHOO_FINANCE_URL': self.url, 'ALPHAVANTAGE_URL': f'{self.url}/query'}
+
+    def symbol_rng(self, symbol, kind):
+        """
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :param kind: what the values are for, so the listing, profile and prices of a symbol do not share values
+        :return: random.Random that gives the same values for the same symbol every time
+        """
+        return random.Random(f'{self.seed}:{kind}:{symbol}')
+
+    def symbol_index(self, symbol):
+        """
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :return: position of the symbol in the listing, None if it is not in the universe
+        """
+        index = 0
+        for letter in symbol:
+            if not 'A' <= letter <= 'Z':
+                return None
+            index = index * 26 + ord(letter) - ord('A')
+        if index >= self.num_symbols or fixtures.symbol_name(index) != symbol:
+            return None
+        return index
+
+    def listing(self, page_num):
+        """
+        :param page_num: page number (pages past the end of the universe have an empty table)
+        :return: html of the listing page
+        """
+        first = (page_num - 1) * PAGE_SIZE
+        companies = list()
+        for index in range(max(first, 0), min(first + PAGE_SIZE, self.num_symbols)):
+            symbol = fixtures.symbol_name(index)
+            companies.append(fixtures.listing_company(symbol, self.symbol_rng(symbol, 'listing')))
+        return fixtures.listing_page(companies, seed=page_num)
+
+    def profile(self, symbol):
+        """
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :return: html of the profile page, None if the symbol is not in the universe
+        """
+        index = self.symbol_index(symbol)
+        if index is None:
+            return None
+        info = fixtures.company(symbol, self.symbol_rng(symbol, 'profile'))
+        return fixtures.profile_page(symbol, info, self.filler_blocks, seed=index)
+
+    def time_series(self, symbol, outputsize):
+        """
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :param outputsize: "compact" (last 100 days) or "full"
+        :return: dictionary in the same format as a TIME_SERIES_DAILY_ADJUSTED response, None if the symbol is not
+        in the universe
+        """
+        if self.symbol_index(symbol) is None:
+            return None
+        dates = fixtures.trading_dates(FULL_DAYS if outputsize == 'full' else COMPACT_DAYS)
+        return {'Meta Data': {'1. Information': 'Daily Time Series with Splits and Dividend Events',
+                              '2. Symbol': symbol, '3. Last Refreshed': dates[0],
+                              '4. Output Size': 'Full size' if outputsize == 'full' else 'Compact',
+                              '5. Time Zone': 'US/Eastern'},
+                'Time Series (Daily)': fixtures.price_series(dates, self.symbol_rng(symbol, 'prices'), 0)}
+
+    def throttled(self, api_key):
+        """
+        counts a call for an api key
+        :param api_key: api key of the call
+        :return: bool of whether the key has made more than calls_per_minute calls in the last minute
+        """
+        if self.calls_per_minute <= 0:
+            return False
+
+        with self.lock:
+            now = self.clock()
+            calls = self.calls[api_key]
+            while len(calls) > 0 and calls[0] <= now - 60:
+                calls.popleft()
+            if len(calls) >= self.calls_per_minute:
+                return True
+            calls.append(now)
+            return False
+
+    def respond(self, path):
+        """
+        builds the response for a request
+        :param path: path and query of the request (i.e. "/equities?page=1")
+        :return: [status, content_type, body]
+        """
+        parts = urlsplit(path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+        with self.lock:
+            self.requests[parts.path.split('/')[1]] += 1
+            delay = self.latency * self.rng.uniform(0.5, 1.5)
+            error = self.rng.random() < self.error_rate
+
+        if delay > 0:
+            time.sleep(delay)
+        if error:
+            return [503, 'text/html', b'<html><body>503 Service Unavailable</body></html>']
+
+        if parts.path == '/equities':
+            try:
+                page_num = int(query.get('page', '1'))
+            except ValueError:
+                return [400, 'text/html', b'<html><body>Bad page</body></html>']
+            return [200, 'text/html', self.listing(page_num).encode('utf-8')]
+
+        if parts.path.startswith('/quote/') and parts.path.endswith('/profile'):
+            page = self.profile(parts.path.split('/')[2])
+            if page is None:
+                return [404, 'text/html', b'<html><body>Symbol not found</body></html>']
+            return [200, 'text/html', page.encode('utf-8')]
+
+        if parts.path == '/query':
+            if self.throttled(query.get('apikey', '')):
+                return [200, 'application/json', json.dumps({'Note': THROTTLE_NOTE}).encode('utf-8')]
+
+            time_series = self.time_series(query.get('symbol', ''), query.get('outputsize', 'compact'))
+            if time_series is None:
+                message = {'Error Message': 'Invalid API call. Please retry or visit the documentation.'}
+                return [200, 'application/json', json.dumps(message).encode('utf-8')]
+            return [200, 'application/json', json.dumps(time_series).encode('utf-8')]
+
+        return [404, 'text/html', b'<html><body>Not found</body></html>']
+
+    def start(self):
+        """
+        serves requests in a background thread
+        :return: nothing is returned
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        stops serving and closes the socket
+        :return: nothing is returned
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """
+    answers GET requests with FakeUpstream.respond
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        status, content_type, body = self.server.upstream.respond(self.path)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # one line per request would drown out everything else
+        return
+
+
+def main():
+    """
+    runs the fake upstream server until it is stopped (Ctrl + C)
+    :return: nothing is returned
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-port', type=int, required=False, default=8000,
+                        help='Port to listen on, "0" for any free port. Defaults to 8000.')
+    parser.add_argument('-symbols', type=int, required=False, default=200,
+                        help='Number of symbols in the listing. Defaults to 200.')
+    parser.add_argument('-latency', type=float, required=False, default=0.0,
+                        help='Seconds each response is delayed by on average. Defaults to 0.')
+    parser.add_argument('-error_rate', type=float, required=False, default=0.0,
+                        help='Chance that a request is answered with a 503 (i.e. "0.05"). Defaults to 0.')
+    parser.add_argument('-calls_per_minute', type=int, required=False, default=0,
+                        help='Number of Alphavantage calls allowed per minute for each API key before the calls are '
+                             'throttled with a "Note". "0" for no limit. Defaults to 0.')
+    parser.add_argument('-seed', type=int, required=False, default=0,
+                        help='Seed for the symbols and prices. Defaults to 0.')
+    args, unknown = parser.parse_known_args()
+
+    upstream = FakeUpstream(args.symbols, args.latency, args.error_rate, args.calls_per_minute, args.seed,
+                            port=args.port)
+
+    # the first line has the url, so a benchmark that started this server can find it
+    print(f'Fake upstream serving {args.symbols} symbols at {upstream.url}', flush=True)
+    print('Point the program at it with these environment variables:')
+    for name, url in upstream.environment().items():
+        print(f'    {name}={url}')
+    print('Press Ctrl + C to stop.', flush=True)
+
+    try:
+        upstream.server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopped the fake upstream server.')
+    finally:
+        upstream.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
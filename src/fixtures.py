@@ -0,0 +1,207 @@
+import datetime
+import random
+
+SECTORS = {'Technology': ['Software', 'Semiconductors', 'Consumer Electronics'],
+           'Energy': ['Oil & Gas E&P', 'Oil & Gas Integrated'],
+           'Financial Services': ['Banks', 'Insurance'],
+           'Healthcare': ['Biotechnology', 'Drug Manufacturers'],
+           'Industrials': ['Airlines', 'Specialty Industrial Machinery'],
+           'Consumer Cyclical': ['Auto Manufacturers', 'Specialty Retail'],
+           'Utilities': ['Utilities - Regulated Electric'],
+           'Basic Materials': ['Gold', 'Steel'],
+           'Communication Services': ['Telecom Services', 'Internet Content & Information'],
+           'Real Estate': ['REIT - Retail']}
+
+CITIES = [('Boston', 'United States', 'MA 02210'), ('Toronto', 'Canada', 'ON M5J 2J2'),
+          ('London', 'United Kingdom', 'EC2N 4AG'), ('Sao Paulo', 'Brazil', 'SP 04543-000')]
+
+# words the filler markup is made of
+FILLER_WORDS = ['market', 'stock', 'quote', 'news', 'video', 'chart', 'trade']
+
+
+def filler(rng, blocks):
+    """
+    markup that the parsers never look at (navigation, scripts, ads), so pages are about as big as the real ones
+    :param rng: random.Random to use
+    :param blocks: number of filler blocks
+    :return: html string
+    """
+    parts = list()
+    for i in range(blocks):
+        words = ' '.join(rng.choice(FILLER_WORDS) for _ in range(12))
+        parts.append(f'<div class="Bd(0) Pos(r) nav-{i}"><ul><li><a href="/link/{i}">{words}</a></li>'
+                     f'<li><span class="C($c-fuji-grey-j)">{words}</span></li></ul>'
+                     f'<script>window.data_{i} = {{"id": {i}, "v": "{words}"}};</script></div>')
+    return ''.join(parts)
+
+
+def company(symbol, rng):
+    """
+    random company information for a symbol, with the same keys scrape_and_compile_yahoo returns
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :param rng: random.Random to use
+    :return: dictionary of company information
+    """
+    sector = rng.choice(sorted(SECTORS.keys()))
+    city, country, zip_code = rng.choice(CITIES)
+    return {'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'website': f'http://www.{symbol.lower()}.com', 'city': city, 'country': country,
+            'address': f'{rng.randint(1, 999)} Main Street', 'zip': zip_code,
+            'sector': sector, 'industry': rng.choice(SECTORS[sector]), 'fte': rng.randint(10, 300000),
+            'description': f'{symbol} Corporation operates in the {sector.lower()} sector. ' * 8}
+
+
+def profile_page(symbol, info, filler_blocks=400, seed=0):
+    """
+    yahoo finance profile page with the same structure the scraper reads
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :param info: dictionary of company information (see company())
+    :param filler_blocks: number of blocks of markup the parser does not need
+    :param seed: seed for the filler
+    :return: html string
+    """
+    rng = random.Random(seed)
+    if info['country'] == 'United States':
+        city_line = f'{info["city"]}, {info["zip"]}'
+    else:
+        city_line = f'{info["city"]} {info["zip"]}'
+
+    return (f'<!DOCTYPE html><html><head><title>{symbol} Profile</title></head><body>'
+            f'{filler(rng, filler_blocks // 2)}'
+            f'<div class="asset-profile-container"><h3>{symbol} Corporation</h3>'
+            f'<div><p class="D(ib) W(47.727%) Pend(40px)" data-reactid="8">{info["address"]}<br/>{city_line}<br/>'
+            f'{info["country"]}<br/><a href="tel:{info["phone"]}" data-reactid="13">{info["phone"]}</a><br/>'
+            f'<a href="{info["website"]}" target="_blank" data-reactid="15">{info["website"]}</a></p>'
+            f'<p class="D(ib) Va(t)"><span>Sector</span>: <span class="Fw(600)">{info["sector"]}</span><br/>'
+            f'<span>Industry</span>: <span class="Fw(600)">{info["industry"]}</span><br/>'
+            f'<span>Full Time Employees</span>: <span class="Fw(600)"><span>{info["fte"]:,}</span></span></p>'
+            f'</div></div>'
+            f'<section class="quote-sub-section Mt(30px)"><h2><span>Description</span></h2>'
+            f'<p class="Mt(15px) Lh(1.6)">{info["description"]}</p></section>'
+            f'{filler(rng, filler_blocks - filler_blocks // 2)}</body></html>')
+
+
+def listing_company(symbol, rng):
+    """
+    random swingtradebot.com listing row for a symbol
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :param rng: random.Random to use
+    :return: dictionary with the keys swingtradebot_scraper returns
+    """
+    return {'symbol': symbol, 'name': f'{symbol} Corporation...', 'close_price': round(rng.uniform(1, 500), 2),
+            'volatility': round(rng.uniform(0.5, 60), 3), 'avg_volume': rng.randint(100000, 90000000)}
+
+
+def listing_page(companies, filler_blocks=200, seed=0):
+    """
+    swingtradebot.com listing page with the same structure the scraper reads
+    :param companies: list of dictionaries from listing_company()
+    :param filler_blocks: number of blocks of markup the parser does not need
+    :param seed: seed for the filler
+    :return: html string
+    """
+    rng = random.Random(seed)
+    rows = list()
+    for c in companies:
+        rows.append(f'<tr><td><a href="/symbols/{c["symbol"]}">{c["symbol"]}</a></td>'
+                    f'<td><a href="/symbols/{c["symbol"]}">{c["name"]}</a></td><td></td>'
+                    f'<td>{c["close_price"]:,}</td><td>{c["volatility"]}</td><td>{c["avg_volume"]:,}</td></tr>')
+
+    return (f'<!DOCTYPE html><html><head><title>Equities</title></head><body>{filler(rng, filler_blocks // 2)}'
+            f'<div class="table-responsive"><table class="table"><thead><tr><th>Symbol</th><th>Name</th><th></th>'
+            f'<th>Close</th><th>Volatility</th><th>Avg Volume</th></tr></thead><tbody>{"".join(rows)}</tbody>'
+            f'</table></div>{filler(rng, filler_blocks - filler_blocks // 2)}</body></html>')
+
+
+def symbol_name(index):
+    """
+    unique ticker-like name for a number (0 -> "AAA", 1 -> "AAB", ...)
+    :param index: number of the symbol
+    :return: string of capital letters
+    """
+    letters = ''
+    while True:
+        index, rest = divmod(index, 26)
+        letters = chr(ord('A') + rest) + letters
+        if index == 0:
+            break
+    return letters.rjust(3, 'A')
+
+
+def synthetic_symbols(num_symbols, seed=0):
+    """
+    symbols with the same data swingtradebot_scraper returns (what deposit_to_csv writes to symbols.csv)
+    :param num_symbols: number of symbols
+    :param seed: seed for the random values
+    :return: dictionary of symbol to its information
+    """
+    rng = random.Random(seed)
+    symbols = dict()
+    for i in range(num_symbols):
+        symbol = symbol_name(i)
+        curr_company = listing_company(symbol, rng)
+        info = company(symbol, rng)
+        for key in ('phone', 'website', 'city', 'country', 'sector', 'industry', 'fte', 'description'):
+            curr_company[key] = info[key]
+        symbols[symbol] = curr_company
+    return symbols
+
+
+def trading_dates(num_days, end_date='2019-12-12'):
+    """
+    business days up to end_date, newest first (the same order alphavantage returns them in)
+    :param num_days: number of days
+    :param end_date: last date ("YYYY-MM-DD")
+    :return: list of "YYYY-MM-DD" strings
+    """
+    dates = list()
+    day = datetime.date.fromisoformat(end_date)
+    while len(dates) < num_days:
+        if day.weekday() < 5:
+            dates.append(day.isoformat())
+        day -= datetime.timedelta(days=1)
+    return dates
+
+
+def price_series(dates, rng, missing_rate=0.01):
+    """
+    random walk of prices in the same format as alphavantage's "Time Series (Daily)"
+    :param dates: list of dates, newest first
+    :param rng: random.Random to use
+    :param missing_rate: chance that a day is missing (not traded)
+    :return: dictionary of date to a dictionary of prices (as text, like the API)
+    """
+    price = rng.uniform(1, 300)
+    time_series = dict()
+
+    # walk from the oldest date so the newest price is the result of the whole walk
+    for date in reversed(dates):
+        price = max(0.01, price * (1 + rng.gauss(0, 0.02)))
+        if rng.random() < missing_rate:
+            continue
+
+        high = price * (1 + abs(rng.gauss(0, 0.01)))
+        low = price * (1 - abs(rng.gauss(0, 0.01)))
+        close = rng.uniform(low, high)
+        time_series[date] = {'1. open': f'{price:.4f}', '2. high': f'{high:.4f}', '3. low': f'{low:.4f}',
+                             '4. close': f'{close:.4f}', '5. adjusted close': f'{close:.4f}',
+                             '6. volume': str(rng.randint(1000, 90000000)), '7. dividend amount': '0.0000',
+                             '8. split coefficient': '1.0000'}
+
+    # newest first, like the API
+    return dict(reversed(list(time_series.items())))
+
+
+def synthetic_prices(symbols, num_days, seed=0, missing_rate=0.01):
+    """
+    generates prices one symbol at a time (so a large universe never has to fit in memory at once)
+    :param symbols: list of symbols
+    :param num_days: number of trading days for each symbol
+    :param seed: seed for the random values
+    :param missing_rate: chance that a day is missing for a symbol
+    :return: generator of (symbol, time_series)
+    """
+    rng = random.Random(seed)
+    dates = trading_dates(num_days)
+    for symbol in symbols:
+        yield symbol, price_series(dates, rng, missing_rate)
@@ -1,8 +1,13 @@
-import scrape_swingtradebot as stb
-import alphavantage_api as av
-import analysis as an
-import pandas as pd
-import argparse 
+# only the standard library, metrics, profile_store, result_cache and run_journal (which have no heavy imports) are
+# loaded at startup, so -h and invalid arguments return right away. pandas, matplotlib, requests and bs4 are imported
+# by the code paths that use them
+import metrics
+import profile_store
+import result_cache
+import run_journal
+import argparse
+
+SOURCES = ('local', 'remote', 'test', 'update')
 
 
 def scrape_driver(overwrite, max_page_num):
@@ -12,18 +17,64 @@ def scrape_driver(overwrite, max_page_num):
     :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
     :return: a list of symbols to process, and a pandas DataFrame containing all the information scraped
     """
+    import scrape_swingtradebot as stb
+    import pandas as pd
+
     symbols_from_scrape = stb.swingtradebot_driver(overwrite, max_page_num)
     scraped_df = pd.DataFrame(symbols_from_scrape).T.reset_index()
     scraped_df = scraped_df.drop(columns=["index"])
     return list(symbols_from_scrape.keys()), scraped_df
 
 
-def local_driver():
+def pipeline_scrape_driver(overwrite, max_page_num):
     """
-    collects data from local CSV files and generates pandas DataFrames
-    :return: pandas DataFrames containing information from symbols.csv and ninety_day_historical_prices.csv
+    runs the scrape and the alphavantage calls as one streaming pipeline (see pipeline.py)
+    :param overwrite: if the user wants to overwrite the current data
+    :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+    :return: a pandas DataFrame containing all the information scraped, and a pandas DataFrame with the prices
     """
-    # now we have the CSV
+    import pipeline as pl
+    import pandas as pd
+
+    symbols_from_scrape, prices_df = pl.pipeline_driver(overwrite, max_page_num)
+    scraped_df = pd.DataFrame(symbols_from_scrape).T.reset_index()
+    scraped_df = scraped_df.drop(columns=["index"])
+    return scraped_df, prices_df
+
+
+def sharded_scrape_driver(overwrite, max_page_num, num_shards, cache, profile_max_age, refresh_in_background, resume):
+    """
+    scrapes the listing and fetches the profiles and prices in shards, one process each (see shard_fetch.py)
+    :param overwrite: if the user wants to overwrite the current data
+    :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+    :param num_shards: number of shards (and processes)
+    :param cache: "off", "on" or "replay" (see http_client.configure_cache)
+    :param profile_max_age: number of days a profile is used before it is scraped again, 0 to always scrape
+    :param refresh_in_background: bool of whether to return stale profiles and refresh them in the background
+    :param resume: bool of whether the shards continue from their journals
+    :return: a pandas DataFrame containing all the information scraped, and a pandas DataFrame with the prices
+    """
+    import shard_fetch
+    import pandas as pd
+
+    symbols_from_scrape, prices_path = shard_fetch.shard_driver(overwrite, max_page_num, num_shards, cache,
+                                                                profile_max_age, refresh_in_background, resume)
+    scraped_df = pd.DataFrame(symbols_from_scrape).T.reset_index()
+    scraped_df = scraped_df.drop(columns=["index"])
+    prices_df = shard_fetch.read_merged_prices(prices_path) if prices_path is not None else pd.DataFrame()
+    return scraped_df, prices_df
+
+
+def symbols_driver(compact=True):
+    """
+    reads symbols.csv
+    :param compact: bool of whether to only read the columns the analysis uses, with compact types (see csv_loader)
+    :return: pandas DataFrame containing information from symbols.csv
+    """
+    import analysis as an
+    import csv_loader
+    import pandas as pd
+
     try:
         tmp = open('symbols.csv', mode='r', encoding="utf-8")
         tmp.close()
@@ -35,23 +86,60 @@ def local_driver():
               f'Ending program.')
         exit()
     else:
-        sym_df = pd.read_csv('symbols.csv')
+        if compact:
+            sym_df = csv_loader.read_symbols(columns=an.SYMBOL_COLUMNS)
+        else:
+            sym_df = pd.read_csv('symbols.csv')
         print('Successfully read symbols.csv')
+        return sym_df
+
+
+@metrics.timed('local_load')
+def local_driver(compact=True, stream=False):
+    """
+    collects data from local CSV files and generates pandas DataFrames
+    prices are read from the ninety_day_historical_prices store if it matches the CSV file, otherwise from the file
+    :param compact: bool of whether to only read the columns the analysis uses, with compact types (see csv_loader)
+    :param stream: bool of whether to leave the prices on disk, for the analysis to read in chunks (prices_df is None)
+    :return: pandas DataFrames containing information from symbols.csv and ninety_day_historical_prices.csv
+    """
+    import analysis as an
+    import csv_loader
+    import price_store as ps
+    import pandas as pd
 
-        try:
-            tmp = open('ninety_day_historical_prices.csv', mode='r', encoding="utf-8")
-            tmp.close()
-        except PermissionError as e:
-            print(f'ninety_day_historical_prices.csv is locked. Please unlock or close the file before rerunning. {e} ')
-            exit()
-        except FileNotFoundError as fnf:
-            print(f'ninety_day_historical_prices.csv does not exist in the current directory. '
-                  f'Please verify it exists in the current directory. Ending program.')
-            exit()
+    # now we have the CSV
+    sym_df = symbols_driver(compact)
+
+    # the columnar store is memory mapped and only the columns the analysis uses are read. The csv file is the
+    # source of truth, so a store that was not written from the file as it is now is not used
+    if not stream and ps.store_exists():
+        if ps.store_is_current():
+            prices_df = ps.open_prices(columns=an.PRICE_COLUMNS)
+            print(f'Successfully read the {ps.STORE_PATH} store')
+            return sym_df, prices_df
+        print(f'The {ps.STORE_PATH} store does not match ninety_day_historical_prices.csv (the file was changed after '
+              f'the store was written), so the CSV file is read instead. Run price_store.py to build the store again.')
+
+    try:
+        tmp = open('ninety_day_historical_prices.csv', mode='r', encoding="utf-8")
+        tmp.close()
+    except PermissionError as e:
+        print(f'ninety_day_historical_prices.csv is locked. Please unlock or close the file before rerunning. {e} ')
+        exit()
+    except FileNotFoundError as fnf:
+        print(f'ninety_day_historical_prices.csv does not exist in the current directory. '
+              f'Please verify it exists in the current directory. Ending program.')
+        exit()
+    else:
+        if stream:
+            return sym_df, None
+        if compact:
+            prices_df = csv_loader.read_prices(columns=an.PRICE_COLUMNS)
         else:
             prices_df = pd.read_csv('ninety_day_historical_prices.csv')
-            print('Successfully read ninety_day_historical_prices.csv')
-            return sym_df, prices_df
+        print('Successfully read ninety_day_historical_prices.csv')
+        return sym_df, prices_df
 
 
 def main():
@@ -66,61 +154,228 @@ def main():
                              'and assumes that they are of the correct format. "remote" will scrape websites and use '
                              'the Alphavantage API to collect the data (this will take approximately 45-50 minutes). '
                              '"test" will be the same as remote with the exception of pulling only 1 page and'
-                             ' processing 20 symbols instead of 200 (takes 5-6 minutes).')
+                             ' processing 20 symbols instead of 200 (takes 5-6 minutes). "update" will use the '
+                             'symbols in symbols.csv and only request the prices that are missing from '
+                             'ninety_day_historical_prices.csv (the prices file is always updated, and created if '
+                             'there is none).')
     parser.add_argument('-overwrite', type=int, required=False, default=0,
                         help='"1" for True/Yes, anything else for False/No. "Yes" will overwrite CSV files (if '
                              'remote/test is chosen for source) and image generated by the program with updated data. '
                              '"No" will only generate the results from current data but leave the files in their '
                              'current state. If not included as an argument, program will default as False/No. You '
                              'must choose "-overwrite=1" to generate the files if they do not already exist.')
+    parser.add_argument('-pipeline', type=int, required=False, default=0,
+                        help='"1" to run the scrape and the Alphavantage calls as one streaming pipeline (remote/test '
+                             'only). Each symbol is fetched as soon as it is scraped instead of waiting for the whole '
+                             'scrape to finish. Defaults to 0.')
+    parser.add_argument('-shards', type=int, required=False, default=0,
+                        help='Number of processes to split the Yahoo Finance and Alphavantage calls between '
+                             '(remote/test). The listing is scraped first, then each symbol goes to a shard by a '
+                             'stable hash of its name. Each shard writes its own files in the "shards" directory and '
+                             'they are merged into the usual files. The API keys are split between the shards. Shards '
+                             'can also run on different hosts with shard_fetch.py. Defaults to 0 (no shards).')
+    parser.add_argument('-cache', type=str, required=False, default='off',
+                        help='"on" keeps web pages and API responses in the http_cache directory and reuses them '
+                             'while they are fresh (1 day for SwingTradeBot, 7 days for Yahoo Finance, 12 hours for '
+                             'Alphavantage). "replay" only uses the cached responses and never goes to the network. '
+                             'Defaults to "off".')
+    parser.add_argument('-profile_max_age', type=int, required=False, default=profile_store.MAX_AGE_DAYS,
+                        help='Number of days a Yahoo Finance company profile is kept in company_profiles.json before '
+                             'it is scraped again (remote/test). "0" scrapes every profile. Defaults to '
+                             f'{profile_store.MAX_AGE_DAYS}.')
+    parser.add_argument('-profile_refresh', type=str, required=False, default='now',
+                        help='"now" scrapes profiles that are too old before using them. "background" uses the old '
+                             'profile for this run and scrapes it again in the background. Defaults to "now".')
+    parser.add_argument('-resume', type=int, required=False, default=0,
+                        help=f'"1" to continue a remote/test run that failed or was stopped. Every listing page, '
+                             f'profile and Alphavantage response is saved in "{run_journal.JOURNAL_PATH}" as soon as '
+                             f'it lands, and only the work that is not in it is done again. Without it a new journal '
+                             f'is started. The journal is removed once a run finishes. Defaults to 0.')
+    parser.add_argument('-headless', type=int, required=False, default=0,
+                        help='"1" to never show the image in a window (for unattended runs). The image is still '
+                             'saved with -overwrite=1. Defaults to 0.')
+    parser.add_argument('-charts', type=int, required=False, default=0,
+                        help='"1" to also save a batch of charts (all sectors and each sector, for the whole period '
+                             'and the last 25 and 50 trading days) in the "charts" directory. The charts are '
+                             'rendered in parallel, one process per core. Defaults to 0.')
+    parser.add_argument('-horizons', type=str, required=False, default='',
+                        help='Other horizons to analyze in the same pass as the 100 day analysis, i.e. '
+                             '"5d,20d,60d,1y". A horizon is a number of trading days (d), weeks (w), months (m) or '
+                             'years (y), optionally followed by ":stride" (trading days between sampled dates, i.e. '
+                             '"60d:3"). A summary of every horizon is printed, and with -overwrite=1 each one is '
+                             'saved as sector_analysis_<horizon>.csv. Defaults to none.')
+    parser.add_argument('-stream', type=int, required=False, default=0,
+                        help='"1" to read ninety_day_historical_prices.csv in chunks during the analysis (local '
+                             'only), keeping only the prices of the sampled dates, so price files larger than memory '
+                             'can be analyzed. Memory grows with the number of symbols, not rows. The rows of each '
+                             'symbol have to be together in the file, which -source=update does not keep (it adds the '
+                             'new dates at the end), so run without -stream after an update. Defaults to 0.')
+    parser.add_argument('-analysis_cache', type=int, required=False, default=result_cache.MAX_ENTRIES,
+                        help=f'Number of analysis results to keep in the "{result_cache.CACHE_PATH}" directory. A '
+                             f'result is served from there when symbols.csv, the prices and the horizons are the same '
+                             f'as in an earlier run, and the least recently used results are removed past this '
+                             f'number. Results are saved whatever the overwrite setting. "0" always runs the '
+                             f'calculations. '
+                             f'Defaults to {result_cache.MAX_ENTRIES}.')
+    parser.add_argument('-metrics', type=str, required=False, default='',
+                        help='File to write the metrics of the run to: time, CPU and peak memory of each stage, HTTP '
+                             'latency histograms, bytes, retries and rows parsed/written. Files ending with ".prom" '
+                             'are written in the Prometheus text format, others as JSON lines. Defaults to none.')
+    parser.add_argument('-profile', type=int, required=False, default=0,
+                        help=f'"1" to run every stage under cProfile and tracemalloc. The profile is saved as '
+                             f'"{metrics.PROFILE_PATH}" and the slowest functions and biggest allocations are printed '
+                             f'at the end. Defaults to 0.')
     args, unknown = parser.parse_known_args()
 
+    # check every argument before anything heavy is imported
+    if args.source.strip() not in SOURCES:
+        print('Invalid arguments. Please rerun program with "-source=local", "-source=remote", "-source=test" or '
+              '"-source=update". No spaces in between the dash or equal sign.')
+        return
+
+    if args.cache.strip() not in ('off', 'on', 'replay'):
+        print('Invalid arguments. -cache must be "off", "on" or "replay".')
+        return
+
+    if args.profile_refresh.strip() not in ('now', 'background'):
+        print('Invalid arguments. -profile_refresh must be "now" or "background".')
+        return
+
+    import analysis as an
+
+    try:
+        horizons = an.parse_horizons(args.horizons)
+    except ValueError as e:
+        print(f'Invalid arguments. {e}')
+        return
+
+    result_cache.configure(args.analysis_cache)
+
+    # the network clients are only set up for the sources that use them
+    if args.source.strip() != 'local':
+        import http_client
+        http_client.configure_cache(args.cache.strip())
+        profile_store.configure(args.profile_max_age, args.profile_refresh.strip() == 'background')
+
+    # remote/test runs keep a journal of the finished work so they can be resumed
+    if args.source.strip() in ('remote', 'test'):
+        run_journal.configure(args.resume == 1)
+
     if args.overwrite == 1:
         overwrite = True
     else:
         overwrite = False
 
-    if args.source.strip() == 'remote':
-        print(
-            f'Overwrite setting is {overwrite}. If you did not enter an overwrite setting, the program defaults to '
-            f'False. This means the current files will not be touched (if they exist). To see more, run the program '
-            f'with -h.')
-        page_to_stop = 11
-        symbols, symbol_df = scrape_driver(overwrite, page_to_stop)
-        prices_df = av.alphavantage_driver(symbols, overwrite, page_to_stop)
-        print('Running analysis now')
-        an.analysis_driver(symbol_df, prices_df, overwrite)
-        print('End of program.\n--------')
-
-    elif args.source.strip() == 'local':
-        print(
-            f'Overwrite setting is {overwrite}. If you did not enter an overwrite setting, the program defaults to '
-            f'False. This means the current files will not be touched (if they exist). To see more, run the program '
-            f'with -h.')
-        # generate dataframes from local files
-        print('Calling local driver. ')
-        symbol_df, prices_df = local_driver()
-
-        # analyze from dataframes
-        print('Running analysis now')
-        an.analysis_driver(symbol_df, prices_df, overwrite)
-        print('End of program.\n--------')
-
-    elif args.source.strip() == 'test':
-        print(
-            f'Overwrite setting is {overwrite}. If you did not enter an overwrite setting, the program defaults to '
-            f'False. This means the current files will not be touched (if they exist). To see more, run the program '
-            f'with -h.')
-        page_to_stop = 2
-        symbols, symbol_df = scrape_driver(overwrite, page_to_stop)
-        prices_df = av.alphavantage_driver(symbols, overwrite, page_to_stop)
-        print('Running analysis now')
-        an.analysis_driver(symbol_df, prices_df, overwrite)
-        print('End of program.\n--------')
+    metrics.configure(profile=args.profile == 1)
 
-    else:
-        print('Invalid arguments. Please rerun program with "-source=local", "-source=remote" or "-source=test". No '
-              'spaces in between the dash or equal sign.')
+    # the metrics are written even if the run ends early
+    try:
+        if args.source.strip() == 'remote':
+            print(
+                f'Overwrite setting is {overwrite}. If you did not enter an overwrite setting, the program defaults '
+                f'to False. This means the current files will not be touched (if they exist). To see more, run the '
+                f'program with -h.')
+            page_to_stop = 11
+            if args.shards > 0:
+                symbol_df, prices_df = sharded_scrape_driver(overwrite, page_to_stop, args.shards, args.cache.strip(),
+                                                             args.profile_max_age,
+                                                             args.profile_refresh.strip() == 'background',
+                                                             args.resume == 1)
+            elif args.pipeline == 1:
+                symbol_df, prices_df = pipeline_scrape_driver(overwrite, page_to_stop)
+            else:
+                import alphavantage_api as av
+                symbols, symbol_df = scrape_driver(overwrite, page_to_stop)
+                prices_df = av.alphavantage_driver(symbols, overwrite, page_to_stop)
+            http_client.print_stats()
+            print('Running analysis now')
+            an.analysis_driver(symbol_df, prices_df, overwrite, args.headless == 1, args.charts == 1,
+                               horizons=horizons)
+            run_journal.finish()
+            print('End of program.\n--------')
+
+        elif args.source.strip() == 'local':
+            print(
+                f'Overwrite setting is {overwrite}. If you did not enter an overwrite setting, the program defaults '
+                f'to False. This means the current files will not be touched (if they exist). To see more, run the '
+                f'program with -h.')
+            # generate dataframes from local files
+            print('Calling local driver. ')
+            symbol_df, prices_df = local_driver(stream=args.stream == 1)
+
+            # prices read from the store come with its coverage bitmap, so the analysis does not have to scan them
+            import price_store as ps
+            coverage_index = None
+            prices_source = 'ninety_day_historical_prices.csv'
+            if prices_df is not None and ps.store_is_current():
+                coverage_index = ps.open_coverage()
+                prices_source = ps.STORE_PATH
+
+            # analyze from dataframes
+            print('Running analysis now')
+            try:
+                an.analysis_driver(symbol_df, prices_df, overwrite, args.headless == 1, args.charts == 1,
+                                   horizons=horizons, prices_path='ninety_day_historical_prices.csv',
+                                   coverage=coverage_index, prices_source=prices_source)
+            except ValueError as e:
+                # only the streamed analysis checks the order of the file
+                if prices_df is not None:
+                    raise
+                print(e)
+                return
+            print('End of program.\n--------')
+
+        elif args.source.strip() == 'test':
+            print(
+                f'Overwrite setting is {overwrite}. If you did not enter an overwrite setting, the program defaults '
+                f'to False. This means the current files will not be touched (if they exist). To see more, run the '
+                f'program with -h.')
+            page_to_stop = 2
+            if args.shards > 0:
+                symbol_df, prices_df = sharded_scrape_driver(overwrite, page_to_stop, args.shards, args.cache.strip(),
+                                                             args.profile_max_age,
+                                                             args.profile_refresh.strip() == 'background',
+                                                             args.resume == 1)
+            elif args.pipeline == 1:
+                symbol_df, prices_df = pipeline_scrape_driver(overwrite, page_to_stop)
+            else:
+                import alphavantage_api as av
+                symbols, symbol_df = scrape_driver(overwrite, page_to_stop)
+                prices_df = av.alphavantage_driver(symbols, overwrite, page_to_stop)
+            http_client.print_stats()
+            print('Running analysis now')
+            an.analysis_driver(symbol_df, prices_df, overwrite, args.headless == 1, args.charts == 1,
+                               horizons=horizons)
+            run_journal.finish()
+            print('End of program.\n--------')
+
+        elif args.source.strip() == 'update':
+            print(
+                f'Overwrite setting is {overwrite}. The prices file is updated either way, the setting only applies '
+                f'to the analysis CSV and image. To see more, run the program with -h.')
+            import price_refresh as pr
+
+            # only the symbols are needed, the refresh reads the prices it keeps (there may be no prices file yet)
+            symbol_df = symbols_driver()
+            prices_df = pr.refresh_driver(list(symbol_df['symbol']))
+            http_client.print_stats()
+            print('Running analysis now')
+            an.analysis_driver(symbol_df, prices_df, overwrite, args.headless == 1, args.charts == 1,
+                               horizons=horizons, prices_source=pr.CSV_PATH)
+            print('End of program.\n--------')
+
+    finally:
+        # a run that did not finish leaves its journal behind to resume from
+        if run_journal.get_journal() is not None:
+            run_journal.close()
+            print(f'The finished work was saved in "{run_journal.JOURNAL_PATH}". Rerun with the same arguments and '
+                  f'"-resume=1" to continue from there.')
+        if args.metrics.strip():
+            metrics.get_metrics().export(args.metrics.strip())
+            print(f'Metrics were saved as "{args.metrics.strip()}".')
+        if args.profile == 1:
+            metrics.get_metrics().print_summary()
+            metrics.get_metrics().print_profile()
 
 
 if __name__ == '__main__':
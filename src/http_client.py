@@ -0,0 +1,270 @@
+import requests
+import metrics
+import response_cache
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+import random
+import threading
+import time
+
+# seconds to wait to connect and to read a response
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# retries for transient errors, waiting base * 2^attempt seconds (with jitter), up to max_backoff
+MAX_RETRIES = 4
+BASE_BACKOFF = 1
+MAX_BACKOFF = 30
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# connections kept open to each host
+POOL_SIZE = 20
+
+
+class HostStats:
+    """
+    counters for the requests made to one host
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def to_dict(self):
+        """
+        :return: dictionary of the counters (and the average latency)
+        """
+        average = self.total_seconds / self.requests if self.requests > 0 else 0.0
+        return {'requests': self.requests, 'cache_hits': self.cache_hits, 'retries': self.retries,
+                'failures': self.failures, 'total_seconds': self.total_seconds, 'average_seconds': average,
+                'max_seconds': self.max_seconds}
+
+
+class HttpClient:
+    """
+    HTTP client shared by the scrapers and the alphavantage calls. Keeps a pool of keep-alive connections for each
+    host, retries transient errors with exponential backoff and jitter, and counts latency and retries per host.
+    """
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, max_retries=MAX_RETRIES,
+                 base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF, retry_statuses=RETRY_STATUSES,
+                 pool_size=POOL_SIZE, cache=None, sleep=time.sleep):
+        """
+        :param connect_timeout: seconds to wait to connect
+        :param read_timeout: seconds to wait for the server to send data
+        :param max_retries: number of times to retry a request after a transient error
+        :param base_backoff: seconds to wait before the first retry (doubled for each retry after that)
+        :param max_backoff: longest to wait between two retries
+        :param retry_statuses: HTTP status codes that are worth retrying
+        :param pool_size: number of connections to keep open to each host
+        :param cache: response_cache.ResponseCache to serve responses from, None to always use the network
+        :param sleep: function that waits for a number of seconds
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = tuple(retry_statuses)
+        self.cache = cache
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.host_stats = dict()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def backoff(self, attempt):
+        """
+        seconds to wait before a retry
+        :param attempt: number of the retry (0 for the first one)
+        :return: seconds to wait, somewhere between half and all of the exponential backoff
+        """
+        delay = min(self.base_backoff * 2 ** attempt, self.max_backoff)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def stats_for(self, host):
+        """
+        gets the counters for a host, creating them if needed (call with the lock held)
+        :param host: name of the host (i.e. "finance.yahoo.com")
+        :return: HostStats for the host
+        """
+        stats = self.host_stats.get(host)
+        if stats is None:
+            stats = HostStats()
+            self.host_stats[host] = stats
+        return stats
+
+    def record(self, host, seconds, retried, failed):
+        """
+        updates the counters for a host after one request
+        :param host: name of the host
+        :param seconds: time the request took
+        :param retried: bool of whether the request is going to be retried
+        :param failed: bool of whether the request failed for good
+        :return: nothing is returned
+        """
+        metrics.observe('http_request_seconds', seconds, host=host)
+        if retried:
+            metrics.count('http_retries', host=host)
+        if failed:
+            metrics.count('http_failures', host=host)
+
+        with self.lock:
+            stats = self.stats_for(host)
+            stats.requests += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            if retried:
+                stats.retries += 1
+            if failed:
+                stats.failures += 1
+
+    def get_cached(self, url):
+        """
+        gets the url's response from the cache without going to the network
+        :param url: url of the request
+        :return: requests response, or None if there is no cache or nothing usable in it
+        """
+        if self.cache is None:
+            return None
+
+        response = self.cache.load(url)
+        if response is not None:
+            metrics.count('http_cache_hits', host=urlsplit(url).netloc)
+            with self.lock:
+                self.stats_for(urlsplit(url).netloc).cache_hits += 1
+        return response
+
+    def replay_only(self):
+        """
+        :return: bool of whether the client only serves from the cache
+        """
+        return self.cache is not None and self.cache.replay
+
+    def get(self, url, retry_statuses=None, max_retries=None, **kwargs):
+        """
+        GET request with retries. Raises for the status of the last response, like response.raise_for_status()
+        :param url: url to request
+        :param retry_statuses: HTTP status codes to retry, defaults to the ones given to the client
+        :param max_retries: number of retries, defaults to the one given to the client
+        :param kwargs: other arguments for requests (params, headers, ...)
+        :return: requests response
+        """
+        if retry_statuses is None:
+            retry_statuses = self.retry_statuses
+        if max_retries is None:
+            max_retries = self.max_retries
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+
+        # serve from the cache if we can. In replay mode the network is never used
+        if self.cache is not None:
+            response = self.get_cached(url)
+            if response is not None:
+                return response
+            if self.cache.replay:
+                raise requests.exceptions.ConnectionError(f'{url} is not in the cache (replay mode)')
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            can_retry = attempt < max_retries
+
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.record(host, time.perf_counter() - start, can_retry, not can_retry)
+                if not can_retry:
+                    raise
+            else:
+                retry = response.status_code in retry_statuses
+                failed = response.status_code >= 400
+                self.record(host, time.perf_counter() - start, retry and can_retry,
+                            failed and not (retry and can_retry))
+
+                if not (retry and can_retry):
+                    metrics.count('http_bytes', len(response.content), host=host)
+                    response.raise_for_status()
+                    if self.cache is not None:
+                        self.cache.store(url, response)
+                    return response
+
+            self.sleep(self.backoff(attempt))
+            attempt += 1
+
+    def forget(self, url):
+        """
+        drops a url from the cache (i.e. the response was an error message sent with a 200 status)
+        :param url: url of the request
+        :return: nothing is returned
+        """
+        if self.cache is not None:
+            self.cache.forget(url)
+
+    def stats(self):
+        """
+        :return: dictionary of host name to a dictionary of its counters
+        """
+        with self.lock:
+            return {host: stats.to_dict() for host, stats in self.host_stats.items()}
+
+
+# one client shared by every module, so they all use the same connection pools
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    the shared client, created the first time it is needed
+    :return: HttpClient
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def configure_cache(mode, path=response_cache.CACHE_PATH):
+    """
+    sets up the response cache of the shared client
+    :param mode: "off" to always use the network, "on" to use fresh cached responses, "replay" to only use the cache
+    :param path: directory of the cache
+    :return: nothing is returned
+    """
+    if mode not in ('off', 'on', 'replay'):
+        raise ValueError(f'Unknown cache mode "{mode}". Valid modes are "off", "on" and "replay".')
+
+    client = get_client()
+    if mode == 'off':
+        client.cache = None
+    else:
+        client.cache = response_cache.ResponseCache(path, replay=mode == 'replay')
+
+
+def get(url, **kwargs):
+    """
+    GET request through the shared client (see HttpClient.get)
+    :param url: url to request
+    :param kwargs: other arguments for HttpClient.get
+    :return: requests response
+    """
+    return get_client().get(url, **kwargs)
+
+
+def print_stats():
+    """
+    prints the request counters of the shared client for each host
+    :return: nothing is returned
+    """
+    for host, stats in get_client().stats().items():
+        print(f'{host}: {stats["requests"]} requests, {stats["cache_hits"]} from cache, {stats["retries"]} retries, '
+              f'{stats["failures"]} failures, {stats["average_seconds"]:.3f} seconds on average '
+              f'({stats["max_seconds"]:.3f} max)')
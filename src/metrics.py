@@ -0,0 +1,417 @@
+from contextlib import contextmanager
+import functools
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak memory is then only reported when profiling (tracemalloc)
+    resource = None
+
+# upper bounds (seconds) of the HTTP latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# file the cProfile statistics are written to with -profile
+PROFILE_PATH = 'profile.pstats'
+
+# metric names are prefixed with this in the Prometheus text format
+PROMETHEUS_PREFIX = 'fulay_atharva_'
+
+
+def peak_rss_mb():
+    """
+    :return: highest resident memory of the process so far in MB, None if it is not known
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # bytes on macOS, kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def label_key(labels):
+    """
+    :param labels: dictionary of label name to value
+    :return: hashable (sorted) version of the labels
+    """
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class StageStats:
+    """
+    totals for one stage (a function or block of the run)
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_mb = None
+        self.traced_peak_mb = None
+
+    def to_dict(self):
+        """
+        :return: dictionary of the totals
+        """
+        return {'calls': self.calls, 'wall_seconds': self.wall_seconds, 'cpu_seconds': self.cpu_seconds,
+                'peak_rss_mb': self.peak_rss_mb, 'traced_peak_mb': self.traced_peak_mb}
+
+
+class Histogram:
+    """
+    counts of observed values in fixed buckets (like a Prometheus histogram)
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        :param value: value to count
+        :return: nothing is returned
+        """
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        """
+        :return: list of (upper bound, number of values up to it), ending with "+Inf"
+        """
+        total = 0
+        result = list()
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append(('+Inf', self.count))
+        return result
+
+
+class Metrics:
+    """
+    metrics of one run: wall/CPU time and peak memory for each stage, counters (rows parsed and written, bytes,
+    retries, ...) and histograms (HTTP latency). Safe to use from several threads. With profiling on, every stage is
+    also run under cProfile and tracemalloc keeps track of the allocations
+    """
+
+    def __init__(self, profile=False, clock=time.perf_counter, cpu_clock=time.process_time):
+        """
+        :param profile: bool of whether to profile the stages with cProfile and tracemalloc
+        :param clock: function that returns wall time in seconds
+        :param cpu_clock: function that returns the CPU time of the process in seconds
+        """
+        self.profile = profile
+        self.clock = clock
+        self.cpu_clock = cpu_clock
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stages = dict()
+        self.counters = dict()
+        self.histograms = dict()
+        self.profile_stats = None
+        self.started_at = time.time()
+
+        if profile:
+            import tracemalloc
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        times a block of the run. Stages can be nested and can run in several threads at once. CPU time is the CPU
+        time of the whole process while the stage ran (worker threads included)
+        :param name: name of the stage (i.e. "alphavantage_fetch")
+        :return: context manager
+        """
+        profiler = self.start_profiler() if self.profile else None
+        start_wall = self.clock()
+        start_cpu = self.cpu_clock()
+        try:
+            yield
+        finally:
+            wall = self.clock() - start_wall
+            cpu = self.cpu_clock() - start_cpu
+            if profiler is not None:
+                self.stop_profiler(profiler)
+            rss = peak_rss_mb()
+            traced = self.traced_peak_mb()
+
+            with self.lock:
+                stats = self.stages.get(name)
+                if stats is None:
+                    stats = StageStats()
+                    self.stages[name] = stats
+                stats.calls += 1
+                stats.wall_seconds += wall
+                stats.cpu_seconds += cpu
+                if rss is not None:
+                    stats.peak_rss_mb = max(stats.peak_rss_mb or 0, rss)
+                if traced is not None:
+                    stats.traced_peak_mb = max(stats.traced_peak_mb or 0, traced)
+
+    def start_profiler(self):
+        """
+        starts cProfile for the current thread, unless a stage of this thread is already being profiled
+        :return: cProfile.Profile, or None if the thread is already profiled
+        """
+        if getattr(self.local, 'profiling', False):
+            return None
+
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is active (only one at a time is allowed on newer Pythons)
+            return None
+        self.local.profiling = True
+        return profiler
+
+    def stop_profiler(self, profiler):
+        """
+        stops a profiler and adds its statistics to the run's
+        :param profiler: cProfile.Profile from start_profiler
+        :return: nothing is returned
+        """
+        import pstats
+        profiler.disable()
+        self.local.profiling = False
+        with self.lock:
+            if self.profile_stats is None:
+                self.profile_stats = pstats.Stats(profiler)
+            else:
+                self.profile_stats.add(profiler)
+
+    def traced_peak_mb(self):
+        """
+        :return: highest memory traced by tracemalloc so far in MB, None if it is not tracing
+        """
+        if not self.profile:
+            return None
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+
+    def count(self, name, value=1, **labels):
+        """
+        adds to a counter
+        :param name: name of the counter (i.e. "rows_written")
+        :param value: amount to add
+        :param labels: labels of the counter (i.e. source="alphavantage")
+        :return: nothing is returned
+        """
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """
+        adds a value to a histogram
+        :param name: name of the histogram (i.e. "http_request_seconds")
+        :param value: value to add
+        :param buckets: upper bounds of the buckets (used when the histogram is created)
+        :param labels: labels of the histogram (i.e. host="finance.yahoo.com")
+        :return: nothing is returned
+        """
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(buckets)
+                self.histograms[key] = histogram
+            histogram.observe(value)
+
+    def records(self):
+        """
+        every metric as a dictionary (one per stage, counter and histogram)
+        :return: list of dictionaries
+        """
+        with self.lock:
+            records = [{'type': 'run', 'started_at': self.started_at, 'seconds': time.time() - self.started_at,
+                        'peak_rss_mb': peak_rss_mb(), 'traced_peak_mb': self.traced_peak_mb()}]
+            for name, stats in self.stages.items():
+                records.append({'type': 'stage', 'name': name, **stats.to_dict()})
+            for (name, labels), value in self.counters.items():
+                records.append({'type': 'counter', 'name': name, 'labels': dict(labels), 'value': value})
+            for (name, labels), histogram in self.histograms.items():
+                records.append({'type': 'histogram', 'name': name, 'labels': dict(labels), 'count': histogram.count,
+                                'sum': histogram.sum, 'buckets': [[str(b), c] for b, c in histogram.cumulative()]})
+        return records
+
+    def to_json_lines(self):
+        """
+        :return: text with one json object per line (see records)
+        """
+        return ''.join(json.dumps(record) + '\n' for record in self.records())
+
+    def to_prometheus(self):
+        """
+        :return: the metrics in the Prometheus text exposition format
+        """
+        lines = list()
+
+        def sample(name, labels, value):
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f'{PROMETHEUS_PREFIX}{name}{{{label_text}}} {value}' if label_text else
+                         f'{PROMETHEUS_PREFIX}{name} {value}')
+
+        records = self.records()
+        run = records[0]
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}run_seconds gauge')
+        sample('run_seconds', (), run['seconds'])
+        if run['peak_rss_mb'] is not None:
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}peak_rss_megabytes gauge')
+            sample('peak_rss_megabytes', (), run['peak_rss_mb'])
+
+        stages = [r for r in records if r['type'] == 'stage']
+        for field, kind in (('calls', 'counter'), ('wall_seconds', 'counter'), ('cpu_seconds', 'counter'),
+                            ('peak_rss_mb', 'gauge'), ('traced_peak_mb', 'gauge')):
+            values = [(r['name'], r[field]) for r in stages if r[field] is not None]
+            if len(values) == 0:
+                continue
+            name = 'stage_' + field.replace('_mb', '_megabytes')
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}{name} {kind}')
+            for stage, value in values:
+                sample(name, (('stage', stage),), value)
+
+        typed = set()
+        for record in records:
+            labels = tuple(sorted(record.get('labels', dict()).items()))
+            if record['type'] == 'counter':
+                if record['name'] not in typed:
+                    lines.append(f'# TYPE {PROMETHEUS_PREFIX}{record["name"]} counter')
+                    typed.add(record['name'])
+                sample(record['name'], labels, record['value'])
+            elif record['type'] == 'histogram':
+                if record['name'] not in typed:
+                    lines.append(f'# TYPE {PROMETHEUS_PREFIX}{record["name"]} histogram')
+                    typed.add(record['name'])
+                for bound, count in record['buckets']:
+                    sample(record['name'] + '_bucket', labels + (('le', bound),), count)
+                sample(record['name'] + '_sum', labels, record['sum'])
+                sample(record['name'] + '_count', labels, record['count'])
+
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        """
+        writes the metrics to a file, in the Prometheus text format if the file ends with ".prom" and as json lines
+        otherwise
+        :param path: path of the file
+        :return: nothing is returned
+        """
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json_lines()
+        with open(path, mode='w', encoding='utf-8') as f:
+            f.write(text)
+
+    def print_summary(self):
+        """
+        prints the time and memory of each stage
+        :return: nothing is returned
+        """
+        with self.lock:
+            stages = [(name, stats.to_dict()) for name, stats in self.stages.items()]
+        for name, stats in stages:
+            memory = '' if stats['peak_rss_mb'] is None else f', {stats["peak_rss_mb"]:.1f} MB peak'
+            print(f'{name}: {stats["calls"]} calls, {stats["wall_seconds"]:.3f} seconds, '
+                  f'{stats["cpu_seconds"]:.3f} CPU seconds{memory}')
+
+    def print_profile(self, path=PROFILE_PATH, top=25):
+        """
+        writes the cProfile statistics to a file and prints the slowest functions and the biggest allocations
+        :param path: file to write the statistics to (open with pstats or snakeviz)
+        :param top: number of functions and allocation sites to print
+        :return: nothing is returned
+        """
+        if self.profile_stats is not None:
+            self.profile_stats.dump_stats(path)
+            print(f'Profile was saved as "{path}". Functions with the most cumulative time:')
+            self.profile_stats.sort_stats('cumulative').print_stats(top)
+
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            # leave out the memory used by the profiler itself and by imports
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, '*cProfile.py'), tracemalloc.Filter(False, '*pstats.py'),
+                tracemalloc.Filter(False, '*tracemalloc.py'), tracemalloc.Filter(False, '<frozen importlib.*>')])
+            print('Lines that allocated the most memory that is still in use:')
+            for stat in snapshot.statistics('lineno')[:top]:
+                print(stat)
+
+
+# metrics shared by every module. Stages and counters are always recorded (they are cheap), profiling is optional
+_metrics = Metrics()
+
+
+def get_metrics():
+    """
+    :return: the shared Metrics
+    """
+    return _metrics
+
+
+def configure(profile=False):
+    """
+    starts a new set of shared metrics
+    :param profile: bool of whether to profile the stages with cProfile and tracemalloc
+    :return: nothing is returned
+    """
+    global _metrics
+    _metrics = Metrics(profile)
+
+
+def stage(name):
+    """
+    times a block of the run in the shared metrics (see Metrics.stage)
+    :param name: name of the stage
+    :return: context manager
+    """
+    return _metrics.stage(name)
+
+
+def timed(name):
+    """
+    decorator that runs a function as a stage of the shared metrics (whichever are configured when it is called)
+    :param name: name of the stage
+    :return: decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _metrics.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1, **labels):
+    """
+    adds to a counter of the shared metrics
+    :param name: name of the counter
+    :param value: amount to add
+    :param labels: labels of the counter
+    :return: nothing is returned
+    """
+    _metrics.count(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    """
+    adds a value to a histogram of the shared metrics
+    :param name: name of the histogram
+    :param value: value to add
+    :param labels: labels of the histogram
+    :return: nothing is returned
+    """
+    _metrics.observe(name, value, **labels)
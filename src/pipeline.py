@@ -0,0 +1,289 @@
+import scrape_swingtradebot as stb
+import profile_store
+import alphavantage_api as av
+import metrics
+import rate_limit
+import run_journal
+import queue
+import threading
+
+# number of symbols that can wait between two stages before the earlier stage has to wait
+QUEUE_SIZE = 40
+
+# marks the end of a queue
+DONE = None
+
+
+class Pipeline:
+    """
+    streaming version of the remote run. Symbols flow downstream as soon as they are parsed from a listing page:
+    one thread scrapes the listing pages, a pool of threads scrapes the yahoo finance profiles, and one thread per
+    alphavantage key fetches the prices. The stages are connected by bounded queues, so the whole run takes about as
+    long as its slowest stage.
+    """
+
+    def __init__(self, max_page_num, overwrite, api_keys, profile_workers=stb.YAHOO_WORKERS, api_url=None,
+                 calls_per_minute=av.CALLS_PER_MINUTE, queue_size=QUEUE_SIZE):
+        """
+        :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+        :param overwrite: bool to determine if we should overwrite the files
+        :param api_keys: list of api keys from alphavantage
+        :param profile_workers: number of yahoo finance requests to make at once
+        :param api_url: url of the Alphavantage query endpoint, defaults to alphavantage_api.get_api_url()
+        :param calls_per_minute: number of calls allowed per minute for each api key
+        :param queue_size: number of symbols that can wait between two stages
+        """
+        self.max_page_num = max_page_num
+        self.overwrite = overwrite
+        self.api_keys = list(api_keys)
+        self.profile_workers = max(1, profile_workers)
+        self.api_url = api_url
+        self.key_pool = rate_limit.KeyPool(self.api_keys, calls_per_minute)
+
+        self.profile_queue = queue.Queue(maxsize=queue_size)
+        self.price_queue = queue.Queue(maxsize=queue_size)
+        self.result_queue = queue.Queue()
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+
+        # filled in by the stages. Keyed by the position of the symbol in the listing
+        self.companies = dict()
+        self.profiles = dict()
+        self.message = None
+        self.success = True
+        self.errors = list()
+
+    def put(self, q, item):
+        """
+        puts an item on a queue, giving up if the pipeline was stopped
+        :param q: queue to put on
+        :param item: item to put on the queue
+        :return: bool of whether the item was put on the queue
+        """
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        """
+        gets an item from a queue, giving up if the pipeline was stopped
+        :param q: queue to get from
+        :return: the item, or DONE if the pipeline was stopped
+        """
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def fail(self, error):
+        """
+        records an error from a stage and stops the pipeline
+        :param error: exception raised in the stage
+        :return: nothing is returned
+        """
+        with self.lock:
+            self.errors.append(error)
+        self.stop.set()
+
+    @metrics.timed('pipeline_listing')
+    def listing_stage(self):
+        """
+        scrapes the swingtradebot.com listing pages and sends each symbol to the profile and price stages
+        :return: nothing is returned
+        """
+        index = 0
+        try:
+            for page_num in range(1, self.max_page_num):
+                companies, message = run_journal.listing_page(page_num, stb.fetch_listing_page)
+                if companies is None:
+                    self.message = message
+                    self.success = False
+                    break
+
+                for curr_company in companies:
+                    self.companies[index] = curr_company
+                    if not self.put(self.profile_queue, (index, curr_company['symbol'])):
+                        return
+                    if not self.put(self.price_queue, (index, curr_company['symbol'])):
+                        return
+                    index += 1
+
+                print(f'Finished scraping symbols from SwingTradeBot for page {page_num}.')
+        except BaseException as e:
+            self.fail(e)
+        finally:
+            # one DONE for each worker of the next stages
+            for _ in range(self.profile_workers):
+                self.put(self.profile_queue, DONE)
+            for _ in range(len(self.api_keys)):
+                self.put(self.price_queue, DONE)
+
+    @metrics.timed('pipeline_profiles')
+    def profile_stage(self):
+        """
+        scrapes the yahoo finance profile of each symbol
+        :return: nothing is returned
+        """
+        try:
+            while True:
+                item = self.get(self.profile_queue)
+                if item is DONE:
+                    return
+
+                index, symbol = item
+                self.profiles[index] = run_journal.get_company_info(symbol)
+        except BaseException as e:
+            self.fail(e)
+
+    @metrics.timed('pipeline_prices')
+    def price_stage(self):
+        """
+        fetches the alphavantage prices of each symbol and sends them to the result queue
+        :return: nothing is returned
+        """
+        try:
+            while True:
+                item = self.get(self.price_queue)
+                if item is DONE:
+                    return
+
+                index, symbol = item
+                historical_prices, stop = run_journal.fetch_prices(
+                    symbol, lambda s: av.fetch_symbol(s, self.key_pool, self.api_url))
+                self.result_queue.put((index, symbol, historical_prices, stop))
+        except BaseException as e:
+            self.fail(e)
+        finally:
+            self.result_queue.put(DONE)
+
+    def run(self):
+        """
+        runs all the stages and writes the prices in listing order as they come in
+        :return: [symbols, message, success, prices_df]
+
+        symbols is a dictionary full with the data from STB and Yahoo Finance
+        message is a text of whether the scrape was successful or if it failed
+        success is a bool based on if the scrape was successful or it it failed
+        prices_df is a pandas DataFrame containing all information from API calls
+        """
+        threads = [threading.Thread(target=self.listing_stage, daemon=True)]
+        threads += [threading.Thread(target=self.profile_stage, daemon=True) for _ in range(self.profile_workers)]
+        threads += [threading.Thread(target=self.price_stage, daemon=True) for _ in self.api_keys]
+        for thread in threads:
+            thread.start()
+
+        prices = av.PriceAccumulator()
+        waiting = dict()
+        next_index = 0
+        price_workers_left = len(self.api_keys)
+        count = 1
+
+        try:
+            with av.PriceWriter(overwrite=True) as writer:
+                while price_workers_left > 0:
+                    result = self.result_queue.get()
+                    if result is DONE:
+                        price_workers_left -= 1
+                        continue
+
+                    if result[3]:
+                        print('Hit 10 consecutive 503 Errors. Ending program. Please check to see if the Alphavantage '
+                              'API is still online.')
+                        exit()
+
+                    # results can come back out of order, so hold on to them until it is their turn
+                    waiting[result[0]] = result
+                    while next_index in waiting:
+                        index, symbol, historical_prices, stop = waiting.pop(next_index)
+                        next_index += 1
+                        self.deposit_prices(writer, prices, symbol, historical_prices)
+
+                        # update user on progress
+                        if count % 10 == 0:
+                            print(f'Finished API call for {symbol} ({count})')
+                        count += 1
+        finally:
+            self.stop.set()
+
+        for thread in threads:
+            thread.join()
+
+        # errors from a stage (including exit() calls) end the program the same way they would have without threads
+        if len(self.errors) > 0:
+            raise self.errors[0]
+
+        # merge the profiles in listing order
+        symbols = dict()
+        sectors = dict()
+        for index in sorted(self.companies.keys()):
+            if index in self.profiles:
+                symbols, sectors = stb.merge_sym_data(self.companies[index], self.profiles[index], symbols, sectors)
+
+        if self.success:
+            self.message = 'Successfully scraped SwingTradeBot.com and Yahoo Finance'
+
+        return [symbols, self.message, self.success, prices.to_frame()]
+
+    def deposit_prices(self, writer, prices, symbol, historical_prices):
+        """
+        writes one symbol's prices to file (if asked) and adds them to the DataFrame
+        :param writer: alphavantage_api.PriceWriter for the prices file
+        :param prices: alphavantage_api.PriceAccumulator for the DataFrame
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :param historical_prices: parsed JSON response from alphavantage, or None if the call failed
+        :return: nothing is returned
+        """
+        if historical_prices is None:
+            return
+
+        try:
+            time_series = historical_prices['Time Series (Daily)']
+            headers = list(list(time_series.values())[0].keys())
+        except (KeyError, IndexError):
+            print(f'Alphavantage could not process {symbol}. Continuing with the remaining symbols.')
+            return
+
+        # write to file if user wants to update data
+        if self.overwrite:
+            writer.deposit(symbol, time_series, headers)
+        prices.add(symbol, time_series)
+
+
+def pipeline_driver(overwrite, max_page_num, api_keys=None):
+    """
+    runs the streaming pipeline, and writes symbols.csv (if asked)
+    :param overwrite: bool of if user wants to overwrite the csv files stored locally
+    :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+    :param api_keys: list of api keys from alphavantage, defaults to the same keys as alphavantage_driver
+    :return: [symbols, prices_df]
+
+    symbols is a dictionary full with the data from STB and Yahoo Finance
+    prices_df is a pandas DataFrame containing all information from API calls
+    """
+    if api_keys is None:
+        api_keys = av.get_api_keys()
+
+    print(f'--------\nRunning the scrape and the Alphavantage calls as one pipeline with {len(api_keys)} API key(s).')
+    symbols, message, success, prices_df = Pipeline(max_page_num, overwrite, api_keys).run()
+    profile_store.close()
+
+    if success and overwrite and len(symbols) > 0:
+        message = stb.deposit_to_csv(symbols)
+        print(message)
+    elif success:
+        print(message)
+    else:
+        print(message)
+        print('Scraping SwingTradeBot.com and Yahoo Finance was unsuccessful. Please check the error message to see '
+              'if there is a internet/HTTP issue')
+
+    if overwrite:
+        print('ninety_day_historical_prices.csv and the ninety_day_historical_prices store were created or updated.')
+
+    return symbols, prices_df
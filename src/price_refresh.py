@@ -0,0 +1,383 @@
+import alphavantage_api as av
+import coverage
+import metrics
+import price_store
+import rate_limit
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from pandas.tseries.holiday import AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay, USMartinLutherKingJr, \
+    USMemorialDay, USPresidentsDay, USThanksgivingDay, nearest_workday, sunday_to_monday
+import json
+import os
+
+CSV_PATH = 'ninety_day_historical_prices.csv'
+KEY_COLUMNS = ['symbol', 'date']
+
+STATE_PATH = 'price_refresh_state.json'
+
+# alphavantage "compact" output has the last 100 trading days
+COMPACT_DAYS = 100
+
+# symbols that came back without newer prices (delisted or halted) are not requested again for this many trading days
+RECHECK_DAYS = 5
+
+
+class MarketHolidayCalendar(AbstractHolidayCalendar):
+    """
+    days the US stock market is closed on weekdays (NYSE holidays)
+    """
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+
+def market_holidays(start='2000-01-01', end='2100-12-31'):
+    """
+    :param start: first date to list holidays for
+    :param end: last date to list holidays for
+    :return: numpy array of the market holidays (datetime64[D]), for np.busday_offset and np.busday_count
+    """
+    return MarketHolidayCalendar().holidays(start, end).to_numpy().astype('datetime64[D]')
+
+
+def load_stored_prices(csv_path=CSV_PATH):
+    """
+    reads the prices file as text, so rows that are kept are written back exactly as they were
+    :param csv_path: path to the prices csv file
+    :return: pandas DataFrame of the stored prices (empty if there is no file yet)
+    """
+    if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+        return pd.DataFrame(columns=KEY_COLUMNS)
+    return pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+
+
+def expected_latest_date(today=None, holidays=None):
+    """
+    latest date the prices should have: the last trading day before today (today's prices are not final yet)
+    :param today: date to use as today (for testing), defaults to the current date
+    :param holidays: market holidays (see market_holidays), None to use market_holidays()
+    :return: date as a "YYYY-MM-DD" string
+    """
+    holidays = market_holidays() if holidays is None else holidays
+    today = np.datetime64(pd.Timestamp.today().date() if today is None else today, 'D')
+    return str(np.busday_offset(today, -1, roll='forward', holidays=holidays))
+
+
+def trading_days_between(start, end, holidays):
+    """
+    :param start: date ("YYYY-MM-DD")
+    :param end: date ("YYYY-MM-DD")
+    :param holidays: market holidays (see market_holidays)
+    :return: number of trading days from start (included) to end (not included)
+    """
+    return int(np.busday_count(np.datetime64(start, 'D'), np.datetime64(end, 'D'), holidays=holidays))
+
+
+def plan_refresh(symbols, latest_dates, expected_date, holes=None, checked=None, holidays=None):
+    """
+    decides what to request for each symbol
+    :param symbols: list of symbols to refresh
+    :param latest_dates: dictionary of symbol to its latest stored date ("YYYY-MM-DD")
+    :param expected_date: latest date the prices should have
+    :param holes: dictionary of symbol to its oldest missing date (see find_holes), None for no holes
+    :param checked: dictionary of symbol to the expected date of the last refresh that got no newer prices for it
+    (see load_state), None if there are none
+    :param holidays: market holidays (see market_holidays), None to use market_holidays()
+    :return: dictionary of symbol to "compact" or "full" (symbols that are already current are left out)
+    """
+    holes = holes or dict()
+    checked = checked or dict()
+    holidays = market_holidays() if holidays is None else holidays
+    plan = dict()
+    for symbol in symbols:
+        latest = latest_dates.get(symbol)
+
+        # new symbols get the same 100 days as a normal run
+        if latest is None:
+            plan[symbol] = 'compact'
+            continue
+
+        # delisted or halted symbols never reach the expected date, so they are only checked again now and then
+        stale = trading_days_between(latest, expected_date, holidays) > 0
+        if symbol in checked and trading_days_between(checked[symbol], expected_date, holidays) < RECHECK_DAYS:
+            stale = False
+
+        # symbols with holes are requested back to their oldest missing date, even if they are current
+        if not stale and symbol not in holes:
+            continue
+        oldest = min(latest, holes.get(symbol, latest))
+        gap = trading_days_between(oldest, expected_date, holidays)
+        plan[symbol] = 'compact' if gap < COMPACT_DAYS else 'full'
+
+    return plan
+
+
+def load_state(state_path=STATE_PATH):
+    """
+    reads what earlier refreshes learned about the symbols
+    :param state_path: path to the state file
+    :return: dictionary with "checked" (see plan_refresh) and "filled_through" (see find_holes)
+    """
+    state = {'checked': dict(), 'filled_through': dict()}
+    try:
+        with open(state_path, mode='r', encoding='utf-8') as f:
+            state.update(json.load(f))
+    except (FileNotFoundError, ValueError):
+        pass
+    return state
+
+
+def save_state(state, state_path=STATE_PATH):
+    """
+    writes what this refresh learned about the symbols (to a temp file first, so it is never half written)
+    :param state: dictionary from load_state
+    :param state_path: path to the state file
+    :return: nothing is returned
+    """
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, mode='w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def find_holes(stored_df, store_path=price_store.STORE_PATH, since=None, csv_path=CSV_PATH):
+    """
+    symbols that are missing trading dates between their first and latest stored date (see
+    coverage.CoverageIndex.holes). The store's coverage bitmap is used when the store matches the csv file,
+    otherwise the bitmap is built from the file
+    :param stored_df: pandas DataFrame of the stored prices
+    :param store_path: directory of the columnar store, None to always build the bitmap from stored_df
+    :param since: dictionary of symbol to the date up to which its holes could not be filled (see load_state), None
+    to look at every date
+    :param csv_path: path to the prices csv file stored_df was read from
+    :return: dictionary of symbol to its oldest missing date
+    """
+    if len(stored_df) == 0:
+        return dict()
+
+    current = store_path is not None and price_store.store_is_current(store_path, csv_path)
+    meta = price_store.read_meta(store_path) if current else None
+    if meta is not None and meta['rows'] == len(stored_df):
+        index = price_store.open_coverage(store_path, meta)
+    else:
+        index = coverage.CoverageIndex.from_pairs(stored_df['symbol'], stored_df['date'])
+    return index.holes(since)
+
+
+def new_rows(symbol, time_series, headers, latest, oldest_hole=None, stored_dates=None):
+    """
+    rows of a response that are newer than what is stored, or that fill a hole in what is stored
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :param time_series: prices where the keys are the date and the value is a dictionary of prices
+    :param headers: names of the price columns, in file order
+    :param latest: latest stored date for the symbol, None if there is none
+    :param oldest_hole: oldest missing date for the symbol, None if it has no holes
+    :param stored_dates: set of the stored dates for the symbol (only needed if it has holes)
+    :return: list of rows ([symbol, date, *prices])
+    """
+    rows = list()
+    for date, values in time_series.items():
+        is_new = latest is None or date > latest
+        fills_hole = oldest_hole is not None and date >= oldest_hole and date not in stored_dates
+        if is_new or fills_hole:
+            rows.append([symbol, date] + [values.get(header, '') for header in headers])
+    return rows
+
+
+def merge_prices(stored_df, rows, columns, symbols):
+    """
+    merges the new rows into the stored prices, without duplicates
+    :param stored_df: pandas DataFrame of the stored prices
+    :param rows: list of new rows
+    :param columns: names of all the columns, in file order
+    :param symbols: list of symbols, in the order they should be in the file
+    :return: pandas DataFrame with one row per (symbol, date), by symbol and then newest date first
+    """
+    new_df = pd.DataFrame(rows, columns=columns, dtype=str)
+
+    # new rows go first so they win over a stored row for the same (symbol, date). Before the first refresh there
+    # is no file, so the stored prices have no price columns yet
+    merged = pd.concat([new_df, stored_df.reindex(columns=columns)], ignore_index=True)
+    merged = merged.drop_duplicates(subset=KEY_COLUMNS, keep='first')
+
+    # symbols keep the order of the symbols list (symbols that were only in the file go after them)
+    order = {symbol: i for i, symbol in enumerate(dict.fromkeys(list(symbols) + list(stored_df['symbol'].unique())))}
+    merged['_order'] = merged['symbol'].map(lambda s: order.setdefault(s, len(order)))
+    merged = merged.sort_values(['_order', 'date'], ascending=[True, False], kind='stable')
+    return merged.drop(columns=['_order']).reset_index(drop=True)
+
+
+def write_prices(prices_df, csv_path=CSV_PATH, store_path=price_store.STORE_PATH):
+    """
+    writes the prices to the csv file (same format as PriceWriter) and rebuilds the columnar store
+    :param prices_df: pandas DataFrame of the prices as text
+    :param csv_path: path to the prices csv file
+    :param store_path: directory of the columnar store, None to only write the csv file
+    :return: nothing is returned
+    """
+    prices_df.to_csv(csv_path, index=False, lineterminator='\r\n', encoding='utf-8')
+
+    if store_path is not None:
+        headers = [column for column in prices_df.columns if column not in KEY_COLUMNS]
+        price_store.deposit_rows(store_path, prices_df.values.tolist(), headers, True, csv_path)
+
+
+def append_prices(rows, columns, csv_path=CSV_PATH, store_path=price_store.STORE_PATH):
+    """
+    adds rows to the end of the csv file and the columnar store, so a refresh that only brings newer dates does not
+    rewrite what is stored. A store that does not match the file is built again from it
+    :param rows: list of new rows ([symbol, date, *prices] as text)
+    :param columns: names of all the columns, in file order
+    :param csv_path: path to the prices csv file
+    :param store_path: directory of the columnar store, None to only write the csv file
+    :return: nothing is returned
+    """
+    new_file = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+
+    # checked before the file changes, the store records the file as it was when the store was written
+    current = store_path is not None and not new_file and price_store.store_is_current(store_path, csv_path)
+
+    pd.DataFrame(rows, columns=columns, dtype=str).to_csv(csv_path, mode='a', header=new_file, index=False,
+                                                          lineterminator='\r\n', encoding='utf-8')
+
+    if store_path is None:
+        return
+    if new_file or current:
+        price_store.deposit_rows(store_path, rows, columns[len(KEY_COLUMNS):], new_file, csv_path)
+    else:
+        price_store.csv_to_store(csv_path, store_path)
+
+
+@metrics.timed('price_refresh')
+def refresh_prices(symbols, api_keys, csv_path=CSV_PATH, store_path=price_store.STORE_PATH, api_url=None,
+                   calls_per_minute=av.CALLS_PER_MINUTE, today=None, state_path=STATE_PATH):
+    """
+    fetches only what is missing from the prices file and merges it in
+    :param symbols: list of symbols to refresh
+    :param api_keys: list of api keys from alphavantage
+    :param csv_path: path to the prices csv file
+    :param store_path: directory of the columnar store, None to only write the csv file
+    :param api_url: url of the Alphavantage query endpoint, defaults to alphavantage_api.get_api_url()
+    :param calls_per_minute: number of calls allowed per minute for each api key
+    :param today: date to use as today (for testing), defaults to the current date
+    :param state_path: file that remembers which symbols had no newer prices, None to not remember them
+    :return: [prices_df, summary]
+
+    prices_df is a pandas DataFrame of all the prices after the refresh (as text, in the same order as the file).
+    Newer dates are added to the end of the file and the store, the file is only written again (by symbol and then
+    newest date first) when a refresh fills holes
+    summary is a dictionary with the number of symbols skipped/fetched (and how many of them were fetched to fill
+    holes or came back without newer prices) and the number of new rows
+    """
+    stored_df = load_stored_prices(csv_path)
+    latest_dates = stored_df.groupby('symbol')['date'].max().to_dict() if len(stored_df) > 0 else dict()
+    state = load_state(state_path) if state_path is not None else {'checked': dict(), 'filled_through': dict()}
+    holes = find_holes(stored_df, store_path, state['filled_through'], csv_path)
+    holidays = market_holidays()
+    expected_date = expected_latest_date(today, holidays)
+    plan = plan_refresh(symbols, latest_dates, expected_date, holes, state['checked'], holidays)
+
+    # the dates that are stored for symbols with holes, so only the missing ones are added
+    hole_symbols = [symbol for symbol in plan.keys() if symbol in holes]
+    stored_dates = dict()
+    if len(hole_symbols) > 0:
+        hole_df = stored_df[stored_df['symbol'].isin(hole_symbols)]
+        stored_dates = hole_df.groupby('symbol')['date'].apply(set).to_dict()
+
+    columns = list(stored_df.columns)
+    rows = list()
+    key_pool = rate_limit.KeyPool(api_keys, calls_per_minute)
+    to_fetch = list(plan.keys())
+
+    executor = ThreadPoolExecutor(max_workers=len(api_keys))
+
+    # queued calls are cancelled if the refresh stops early, so a down API is not called for every symbol left
+    try:
+        results = executor.map(lambda s: av.fetch_symbol(s, key_pool, api_url, outputsize=plan[s]), to_fetch)
+
+        for symbol, (historical_prices, stop) in zip(to_fetch, results):
+            if stop:
+                print('Hit 10 consecutive 503 Errors. Stopping the refresh. Please check to see if the Alphavantage '
+                      'API is still online.')
+                break
+
+            try:
+                time_series = historical_prices['Time Series (Daily)']
+            except (KeyError, TypeError):
+                print(f'Alphavantage could not process {symbol}. Continuing with the remaining symbols.')
+                continue
+
+            # the first response decides the columns if there is no file yet
+            if len(columns) == len(KEY_COLUMNS) and len(time_series) > 0:
+                columns = KEY_COLUMNS + list(list(time_series.values())[0].keys())
+
+            rows.extend(new_rows(symbol, time_series, columns[len(KEY_COLUMNS):], latest_dates.get(symbol),
+                                 holes.get(symbol), stored_dates.get(symbol)))
+
+            # remember symbols that had nothing newer, so they are not requested on every refresh
+            latest = latest_dates.get(symbol)
+            if latest is not None and all(date <= latest for date in time_series.keys()):
+                state['checked'][symbol] = expected_date
+            else:
+                state['checked'].pop(symbol, None)
+
+            # holes the response did not fill cannot be filled from alphavantage, so they are not requested again
+            if symbol in holes:
+                state['filled_through'][symbol] = max([latest] + list(time_series.keys()))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if state_path is not None:
+        save_state(state, state_path)
+
+    summary = {'skipped': len(symbols) - len(to_fetch), 'fetched': len(to_fetch), 'holes': len(hole_symbols),
+               'unchanged': sum(state['checked'].get(symbol) == expected_date for symbol in to_fetch),
+               'new_rows': len(rows)}
+    if len(rows) == 0:
+        return stored_df, summary
+
+    # rows that fill holes go in the middle of their symbol's rows, anything else can go at the end
+    fills_holes = any(row[1] < latest_dates.get(row[0], row[1]) for row in rows)
+    if not fills_holes:
+        append_prices(rows, columns, csv_path, store_path)
+        prices_df = pd.concat([stored_df.reindex(columns=columns), pd.DataFrame(rows, columns=columns, dtype=str)],
+                              ignore_index=True)
+        return prices_df, summary
+
+    prices_df = merge_prices(stored_df, rows, columns, symbols)
+    write_prices(prices_df, csv_path, store_path)
+    return prices_df, summary
+
+
+def refresh_driver(symbols):
+    """
+    drives the incremental refresh of ninety_day_historical_prices.csv
+    :param symbols: list of symbols to refresh
+    :return: pandas DataFrame with all the prices after the refresh
+    """
+    # if the symbols list is empty, then exit program
+    if len(symbols) == 0:
+        print('Symbols list is empty. File is possibly empty. Ending program. Check file and rerun.')
+        exit()
+
+    print('Refreshing ninety_day_historical_prices.csv with only the dates that are missing.')
+    prices_df, summary = refresh_prices(symbols, av.get_api_keys())
+    print(f'{summary["skipped"]} symbols were already current, {summary["fetched"]} were requested '
+          f'({summary["holes"]} of them to fill missing dates, {summary["unchanged"]} had no newer prices) and '
+          f'{summary["new_rows"]} new rows were added.')
+
+    if len(prices_df) == 0:
+        print('No prices could be fetched and there are no stored prices. Ending program. Check the Alphavantage API '
+              'and rerun.')
+        exit()
+    return prices_df
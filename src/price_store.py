@@ -0,0 +1,387 @@
+import coverage
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os
+import uuid
+
+STORE_PATH = 'ninety_day_historical_prices'
+META_FILE = 'meta.json'
+
+# the csv file is the source of truth, the store is only used while it was written from the file as it is now
+CSV_PATH = 'ninety_day_historical_prices.csv'
+
+# alphavantage columns are floats except for volume
+COLUMN_TYPES = {'6. volume': 'int64'}
+DEFAULT_TYPE = 'float64'
+
+# symbol and date are stored as int32 codes into the dictionaries kept in meta.json
+CODE_TYPE = 'int32'
+KEY_COLUMNS = ['symbol', 'date']
+
+
+def column_file(path, column):
+    """
+    file name of a column in the store
+    :param path: directory of the store
+    :param column: name of the column (i.e. "1. open")
+    :return: path to the binary file for that column
+    """
+    return os.path.join(path, column.replace(' ', '_').replace('.', '') + '.bin')
+
+
+def read_meta(path):
+    """
+    reads the store's meta data (columns, dtypes, symbol/date dictionaries and row count)
+    :param path: directory of the store
+    :return: dictionary of meta data, or None if the store does not exist
+    """
+    try:
+        with open(os.path.join(path, META_FILE), mode='r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_meta(path, meta):
+    """
+    writes the store's meta data. Written to a temp file first so a reader never sees half of it. Every write starts
+    a new generation of the store, so results computed from an older one are not mistaken for this one
+    :param path: directory of the store
+    :param meta: dictionary of meta data (the generation is updated)
+    :return: nothing is returned
+    """
+    meta['generation'] = uuid.uuid4().hex
+    tmp_path = os.path.join(path, META_FILE + '.tmp')
+    with open(tmp_path, mode='w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+
+def store_exists(path=STORE_PATH):
+    """
+    checks if there is a price store at the path
+    :param path: directory of the store
+    :return: bool of whether the store exists
+    """
+    return read_meta(path) is not None
+
+
+def csv_stat(csv_path):
+    """
+    size and modification time of the prices csv file, recorded in the meta data when the store is written from it
+    :param csv_path: path to the csv file
+    :return: dictionary with size and mtime_ns, or None if there is no file
+    """
+    try:
+        stat = os.stat(csv_path)
+    except FileNotFoundError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def store_is_current(path=STORE_PATH, csv_path=CSV_PATH):
+    """
+    checks that the store was written from the csv file as it is now. A store without a csv file is all there is,
+    so it is used as it is
+    :param path: directory of the store
+    :param csv_path: path to the csv file the store was written from
+    :return: bool of whether the store exists and matches the csv file
+    """
+    meta = read_meta(path)
+    if meta is None:
+        return False
+    stat = csv_stat(csv_path)
+    return stat is None or meta.get('csv') == stat
+
+
+def append_columns(path, meta, columns, commit=True):
+    """
+    appends typed arrays to the end of each column file and updates the meta data
+    :param path: directory of the store
+    :param meta: dictionary of meta data (row count is updated)
+    :param columns: dictionary of column name to list of values (all the same length)
+    :param commit: bool of whether to write the meta data now (False leaves it to the caller, see StoreWriter)
+    :return: nothing is returned
+    """
+    rows = meta['rows']
+    num_new = 0
+
+    for column, dtype in meta['dtypes'].items():
+        values = np.asarray(columns[column], dtype=dtype)
+        num_new = len(values)
+
+        # cut off anything after the last committed row (left over if a previous write was interrupted)
+        file_name = column_file(path, column)
+        mode = 'r+b' if os.path.exists(file_name) else 'w+b'
+        with open(file_name, mode=mode) as f:
+            f.seek(rows * np.dtype(dtype).itemsize)
+            f.truncate()
+            values.tofile(f)
+
+    meta['rows'] = rows + num_new
+    if commit:
+        write_meta(path, meta)
+
+
+def encode(values, dictionary, lookup):
+    """
+    turns values into int codes, adding new values to the dictionary
+    :param values: list of strings (symbols or dates)
+    :param dictionary: list of known values, the code is the position in the list
+    :param lookup: dictionary of value to code for the values in dictionary
+    :return: list of int codes
+    """
+    codes = list()
+    for value in values:
+        code = lookup.get(value)
+        if code is None:
+            code = len(dictionary)
+            dictionary.append(value)
+            lookup[value] = code
+        codes.append(code)
+    return codes
+
+
+def new_meta(headers):
+    """
+    meta data for an empty store
+    :param headers: names of the alphavantage headers (i.e. "1. open")
+    :return: dictionary of meta data
+    """
+    dtypes = {column: CODE_TYPE for column in KEY_COLUMNS}
+    for header in headers:
+        dtypes[header] = COLUMN_TYPES.get(header, DEFAULT_TYPE)
+    return {'columns': KEY_COLUMNS + list(headers), 'dtypes': dtypes, 'symbols': list(), 'dates': list(), 'rows': 0,
+            'csv': None}
+
+
+def create_store(path, headers):
+    """
+    creates (or empties) the store at the path
+    :param path: directory of the store
+    :param headers: names of the alphavantage headers (i.e. "1. open")
+    :return: dictionary of meta data for the new store
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = new_meta(headers)
+
+    for column in meta['columns']:
+        open(column_file(path, column), mode='wb').close()
+    if os.path.exists(coverage_file(path)):
+        os.remove(coverage_file(path))
+
+    write_meta(path, meta)
+    return meta
+
+
+class StoreWriter:
+    """
+    writer session for the store. Rows are appended to the column files as they come, and the meta data and the
+    coverage bitmap (which are written as a whole every time) are only written when the session is closed. Until
+    then readers see the store as it was when the session started
+    """
+
+    def __init__(self, path=STORE_PATH, overwrite=False, csv_path=None):
+        """
+        :param path: directory of the store
+        :param overwrite: bool to determine if we should start the store over
+        :param csv_path: path to the csv file the same rows are written to, so the store can be checked against it
+        (see store_is_current). It has to be written and closed before the session is. None if there is no file
+        """
+        self.path = path
+        self.overwrite = overwrite
+        self.csv_path = csv_path
+        self.meta = None
+        self.lookups = None
+        self.index = None
+
+    def open(self, headers):
+        """
+        reads the store's meta data and coverage bitmap, or creates the store if it is new, overwritten or has other
+        columns
+        :param headers: names of the alphavantage headers (i.e. "1. open")
+        :return: nothing is returned
+        """
+        meta = None if self.overwrite else read_meta(self.path)
+        if meta is None or meta['columns'][len(KEY_COLUMNS):] != list(headers):
+            meta = create_store(self.path, headers)
+        self.overwrite = False
+
+        self.meta = meta
+        self.lookups = {'symbol': {value: code for code, value in enumerate(meta['symbols'])},
+                        'date': {value: code for code, value in enumerate(meta['dates'])}}
+        self.index = open_coverage(self.path, meta)
+
+    def append(self, rows, headers):
+        """
+        writes rows of prices to the column files
+        :param rows: list of rows in the same order as the csv file ([symbol, date, *values of headers])
+        :param headers: names of the alphavantage headers (i.e. "1. open")
+        :return: nothing is returned
+        """
+        # the store needs the same columns for every row, so different headers start it over (like overwrite)
+        if self.meta is not None and self.meta['columns'][len(KEY_COLUMNS):] != list(headers):
+            self.close()
+        if self.meta is None:
+            self.open(headers)
+
+        meta = self.meta
+        columns = {column: [row[index] for row in rows] for index, column in enumerate(meta['columns'])}
+        columns['symbol'] = encode(columns['symbol'], meta['symbols'], self.lookups['symbol'])
+        columns['date'] = encode(columns['date'], meta['dates'], self.lookups['date'])
+        for header in headers:
+            columns[header] = pd.to_numeric(columns[header], errors='coerce')
+
+        append_columns(self.path, meta, columns, commit=False)
+        self.index.grow(meta['symbols'], meta['dates'])
+        self.index.mark(columns['symbol'], columns['date'])
+
+    def close(self):
+        """
+        writes the meta data and the coverage bitmap, which makes the appended rows visible to readers
+        :return: nothing is returned
+        """
+        if self.meta is None:
+            return
+        if self.csv_path is not None:
+            self.meta['csv'] = csv_stat(self.csv_path)
+        write_meta(self.path, self.meta)
+        self.index.save(coverage_file(self.path), self.meta['rows'])
+        self.meta = None
+        self.lookups = None
+        self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def deposit_rows(path, rows, headers, overwrite, csv_path=None):
+    """
+    writes rows of prices into the store
+    :param path: directory of the store
+    :param rows: list of rows in the same order as the csv file ([symbol, date, *values of headers])
+    :param headers: names of the alphavantage headers (i.e. "1. open")
+    :param overwrite: bool to determine if we should start the store over
+    :param csv_path: path to the csv file that has the same rows (already written), None if there is none
+    :return: nothing is returned
+    """
+    with StoreWriter(path, overwrite, csv_path) as writer:
+        writer.append(rows, headers)
+
+
+def open_prices(path=STORE_PATH, columns=None):
+    """
+    opens the store through memory mapping and returns the requested columns as a DataFrame
+    only the requested columns are read from disk.
+    :param path: directory of the store
+    :param columns: list of columns to load (symbol and date are always loaded), None for all of them
+    :return: pandas DataFrame in the same row order as the csv file
+    """
+    meta = read_meta(path)
+    if meta is None:
+        raise FileNotFoundError(f'No price store found at {path}')
+
+    if columns is None:
+        columns = meta['columns']
+    columns = KEY_COLUMNS + [column for column in columns if column not in KEY_COLUMNS]
+
+    rows = meta['rows']
+    data = dict()
+
+    for column in columns:
+        dtype = np.dtype(meta['dtypes'][column])
+        if rows == 0:
+            values = np.empty(0, dtype=dtype)
+        else:
+            values = np.memmap(column_file(path, column), dtype=dtype, mode='r', shape=(rows,))
+
+        if column == 'symbol':
+            values = pd.Categorical.from_codes(values, categories=meta['symbols'])
+        elif column == 'date':
+            values = pd.Categorical.from_codes(values, categories=meta['dates'])
+        data[column] = values
+
+    return pd.DataFrame(data, columns=columns)
+
+
+def coverage_file(path):
+    """
+    :param path: directory of the store
+    :return: path to the file with the store's coverage bitmap (see coverage.py)
+    """
+    return os.path.join(path, coverage.COVERAGE_FILE)
+
+
+def build_coverage(path, meta):
+    """
+    builds the coverage bitmap from the symbol and date columns of the store
+    :param path: directory of the store
+    :param meta: dictionary of meta data
+    :return: coverage.CoverageIndex
+    """
+    rows = meta['rows']
+    codes = dict()
+    for column in KEY_COLUMNS:
+        if rows == 0:
+            codes[column] = np.empty(0, dtype=meta['dtypes'][column])
+        else:
+            codes[column] = np.memmap(column_file(path, column), dtype=meta['dtypes'][column], mode='r', shape=(rows,))
+    return coverage.CoverageIndex.from_codes(meta['symbols'], meta['dates'], codes['symbol'], codes['date'])
+
+
+def open_coverage(path=STORE_PATH, meta=None):
+    """
+    reads the bitmap of which symbols have prices on which dates in the store. If it is missing or out of date (the
+    store was written before there was a bitmap, or a write was interrupted) it is built again from the store
+    :param path: directory of the store
+    :param meta: dictionary of meta data, None to read it
+    :return: coverage.CoverageIndex
+    """
+    if meta is None:
+        meta = read_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f'No price store found at {path}')
+
+    index = coverage.CoverageIndex.load(coverage_file(path), meta['symbols'], meta['dates'], meta['rows'])
+    if index is None:
+        index = build_coverage(path, meta)
+    return index
+
+
+def csv_to_store(csv_path, path=STORE_PATH):
+    """
+    converts a prices csv file (same format as ninety_day_historical_prices.csv) into a store
+    :param csv_path: path to the csv file
+    :param path: directory of the store
+    :return: number of rows written
+    """
+    prices_df = pd.read_csv(csv_path, dtype={'symbol': str, 'date': str})
+    headers = [column for column in prices_df.columns if column not in KEY_COLUMNS]
+    rows = prices_df[KEY_COLUMNS + headers].values.tolist()
+    deposit_rows(path, rows, headers, True, csv_path)
+    return len(rows)
+
+
+def main():
+    """
+    converts ninety_day_historical_prices.csv into the columnar store
+    :return: nothing is returned
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-csv', type=str, required=False, default=CSV_PATH,
+                        help=f'Path to the prices CSV file. Defaults to "{CSV_PATH}".')
+    parser.add_argument('-store', type=str, required=False, default=STORE_PATH,
+                        help=f'Directory of the store to create. Defaults to "{STORE_PATH}".')
+    args, unknown = parser.parse_known_args()
+
+    rows = csv_to_store(args.csv, args.store)
+    print(f'Wrote {rows} rows from {args.csv} to {args.store}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+import time
+
+PROFILE_PATH = 'company_profiles.json'
+
+# profiles older than this are scraped again
+MAX_AGE_DAYS = 30
+
+# the store is written to disk after this many new profiles (and when it is closed)
+SAVE_EVERY = 20
+
+
+class ProfileStore:
+    """
+    local store of the yahoo finance company profiles (sector, industry, FTE, address, description), keyed by
+    symbol. Profiles rarely change, so a profile is only scraped again once it is older than max_age_days. With
+    refresh_in_background, a stale profile is returned right away and scraped again in the background.
+    """
+
+    def __init__(self, path=PROFILE_PATH, max_age_days=MAX_AGE_DAYS, refresh_in_background=False,
+                 fetch=None, clock=time.time, save_every=SAVE_EVERY):
+        """
+        :param path: json file to keep the profiles in
+        :param max_age_days: number of days a profile is used before it is scraped again
+        :param refresh_in_background: bool of whether to return stale profiles and refresh them in the background
+        :param fetch: function that scrapes a profile for a symbol, defaults to scrape_and_compile_yahoo
+        :param clock: function that returns the current time in seconds
+        :param save_every: number of new profiles between writes to disk
+        """
+        self.path = path
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.refresh_in_background = refresh_in_background
+        if fetch is None:
+            # the scraper (and bs4) is only loaded when profiles can actually be scraped
+            import scrape_yahoo_finance
+            fetch = scrape_yahoo_finance.scrape_and_compile_yahoo
+        self.fetch = fetch
+        self.clock = clock
+        self.save_every = save_every
+        self.lock = threading.Lock()
+        self.unsaved = 0
+        self.refreshing = set()
+        self.executor = None
+        self.profiles = self.load()
+
+    def load(self):
+        """
+        reads the profiles from disk
+        :return: dictionary of symbol to {'fetched_at': seconds, 'info': company information}
+        """
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return dict()
+
+    def save(self):
+        """
+        writes the profiles to disk (to a temp file first, so the file is never half written)
+        :return: nothing is returned
+        """
+        with self.lock:
+            data = json.dumps(self.profiles)
+            self.unsaved = 0
+
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def put(self, symbol, info):
+        """
+        keeps a freshly scraped profile. Profiles that could not be scraped (all None) are not kept.
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :param info: dictionary of company information from scrape_and_compile_yahoo
+        :return: nothing is returned
+        """
+        if all(value is None for value in info.values()):
+            return
+
+        with self.lock:
+            self.profiles[symbol] = {'fetched_at': self.clock(), 'info': info}
+            self.unsaved += 1
+            save = self.unsaved >= self.save_every
+
+        if save:
+            self.save()
+
+    def refresh(self, symbol):
+        """
+        scrapes a profile again and keeps it
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :return: dictionary of company information
+        """
+        try:
+            info = self.fetch(symbol)
+            self.put(symbol, info)
+            return info
+        finally:
+            with self.lock:
+                self.refreshing.discard(symbol)
+
+    def get_company_info(self, symbol):
+        """
+        company information for a symbol, from the store if it is fresh enough or else from yahoo finance
+        :param symbol: string value of symbol (i.e. "AAPL")
+        :return: dictionary of company information (same as scrape_and_compile_yahoo)
+        """
+        with self.lock:
+            entry = self.profiles.get(symbol)
+            stale = entry is None or self.clock() - entry['fetched_at'] > self.max_age
+
+            # return the stale profile now and scrape it again in the background
+            if stale and entry is not None and self.refresh_in_background:
+                if symbol not in self.refreshing:
+                    self.refreshing.add(symbol)
+                    if self.executor is None:
+                        self.executor = ThreadPoolExecutor(max_workers=4)
+                    self.executor.submit(self.refresh, symbol)
+                stale = False
+
+        if not stale:
+            return dict(entry['info'])
+
+        return self.refresh(symbol)
+
+    def close(self):
+        """
+        waits for background refreshes to finish and writes the profiles to disk
+        :return: nothing is returned
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.save()
+
+
+def merge_profiles(paths, path=PROFILE_PATH, symbols=None):
+    """
+    folds the profiles of other stores into a store (i.e. the stores of the shards into the main one, see
+    shard_fetch.py). The most recently scraped profile of a symbol wins
+    :param paths: list of json files of the other stores (files that do not exist are skipped)
+    :param path: json file of the store to fold them into
+    :param symbols: set of the symbols to fold in, None for all of them
+    :return: number of profiles that were added or replaced
+    """
+    # nothing is scraped, the stores are only read and written
+    store = ProfileStore(path, fetch=dict)
+    updated = 0
+    for other_path in paths:
+        for symbol, entry in ProfileStore(other_path, fetch=dict).profiles.items():
+            if symbols is not None and symbol not in symbols:
+                continue
+            current = store.profiles.get(symbol)
+            if current is None or entry['fetched_at'] > current['fetched_at']:
+                store.profiles[symbol] = entry
+                updated += 1
+
+    if updated > 0:
+        store.save()
+    return updated
+
+
+# the store used by the scrapers. None means every profile is scraped (like before there was a store)
+_store = None
+
+
+def configure(max_age_days=MAX_AGE_DAYS, refresh_in_background=False, path=PROFILE_PATH):
+    """
+    sets up the store used by the scrapers
+    :param max_age_days: number of days a profile is used before it is scraped again, 0 to always scrape
+    :param refresh_in_background: bool of whether to return stale profiles and refresh them in the background
+    :param path: json file to keep the profiles in
+    :return: nothing is returned
+    """
+    global _store
+    if max_age_days <= 0:
+        _store = None
+    else:
+        _store = ProfileStore(path, max_age_days, refresh_in_background)
+
+
+def get_company_info(symbol):
+    """
+    company information for a symbol, through the store if one is configured
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :return: dictionary of company information (same as scrape_and_compile_yahoo)
+    """
+    if _store is None:
+        import scrape_yahoo_finance
+        return scrape_yahoo_finance.scrape_and_compile_yahoo(symbol)
+    return _store.get_company_info(symbol)
+
+
+def close():
+    """
+    writes the configured store to disk (if there is one)
+    :return: nothing is returned
+    """
+    if _store is not None:
+        _store.close()
@@ -0,0 +1,140 @@
+import metrics
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    token bucket for one API key. Calls are given a time slot instead of polling for tokens, so concurrent callers
+    are spaced exactly at the allowed rate with no idle time in between.
+    """
+
+    def __init__(self, rate, capacity=1, base_backoff=12, max_backoff=120, clock=time.monotonic):
+        """
+        :param rate: number of calls allowed per second
+        :param capacity: number of calls that can be made back to back (burst size)
+        :param base_backoff: seconds to wait after the first throttled call, doubled for each one after that
+        :param max_backoff: longest that a throttled key will wait
+        :param clock: function that returns the current time in seconds
+        """
+        self.interval = 1 / rate
+        self.capacity = capacity
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.next_slot = clock()
+        self.blocked_until = 0
+        self.failures = 0
+
+    def peek(self, now):
+        """
+        earliest time a call could be made with this key (does not use a token)
+        :param now: current time from the clock
+        :return: time in seconds (same scale as the clock)
+        """
+        # up to capacity calls can be made before next_slot
+        earliest = self.next_slot - (self.capacity - 1) * self.interval
+        return max(now, earliest, self.blocked_until)
+
+    def reserve(self, now):
+        """
+        uses a token and returns when the call can be made
+        :param now: current time from the clock
+        :return: time in seconds (same scale as the clock)
+        """
+        call_at = self.peek(now)
+        self.next_slot = max(self.next_slot, call_at) + self.interval
+        return call_at
+
+    def backoff(self, now):
+        """
+        blocks this key for longer after each throttled call in a row
+        :param now: current time from the clock
+        :return: seconds the key is blocked for
+        """
+        self.failures += 1
+        delay = min(self.base_backoff * 2 ** (self.failures - 1), self.max_backoff)
+        self.blocked_until = max(self.blocked_until, now + delay)
+        return delay
+
+    def reset(self):
+        """
+        the last call went through, so the next throttled call starts back at the base backoff
+        :return: nothing is returned
+        """
+        self.failures = 0
+
+
+class KeyPool:
+    """
+    set of API keys, each with its own token bucket. Workers ask the pool for a key and get the one that can make a
+    call the soonest (keys are rotated when they are equally free).
+    """
+
+    def __init__(self, keys, calls_per_minute=5, capacity=1, base_backoff=12, max_backoff=120,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        :param keys: list of API keys
+        :param calls_per_minute: number of calls allowed per minute for each key
+        :param capacity: number of calls each key can make back to back
+        :param base_backoff: seconds to wait after a key is throttled, doubled each time it happens in a row
+        :param max_backoff: longest that a throttled key will wait
+        :param clock: function that returns the current time in seconds
+        :param sleep: function that waits for a number of seconds
+        """
+        if len(keys) == 0:
+            raise ValueError('KeyPool needs at least one API key')
+
+        self.keys = list(keys)
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.turn = 0
+        self.buckets = {key: TokenBucket(calls_per_minute / 60, capacity, base_backoff, max_backoff, clock)
+                        for key in self.keys}
+
+    def acquire(self):
+        """
+        waits until one of the keys can make a call, and returns it
+        :return: API key to use for the call
+        """
+        with self.lock:
+            now = self.clock()
+            best_key = None
+            best_time = None
+
+            # start from a different key each time so that ties are rotated
+            for i in range(len(self.keys)):
+                key = self.keys[(self.turn + i) % len(self.keys)]
+                call_at = self.buckets[key].peek(now)
+                if best_time is None or call_at < best_time:
+                    best_key = key
+                    best_time = call_at
+
+            self.turn = (self.keys.index(best_key) + 1) % len(self.keys)
+            call_at = self.buckets[best_key].reserve(now)
+
+        # wait outside of the lock so other workers can get their own slot
+        wait = call_at - self.clock()
+        if wait > 0:
+            metrics.count('rate_limit_wait_seconds', wait)
+            self.sleep(wait)
+        return best_key
+
+    def backoff(self, key):
+        """
+        call after a throttled response (503 or alphavantage "Note") to slow that key down
+        :param key: API key that was throttled
+        :return: seconds the key is blocked for
+        """
+        with self.lock:
+            return self.buckets[key].backoff(self.clock())
+
+    def reset(self, key):
+        """
+        call after a successful response
+        :param key: API key that made the call
+        :return: nothing is returned
+        """
+        with self.lock:
+            self.buckets[key].reset()
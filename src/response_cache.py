@@ -0,0 +1,147 @@
+import requests
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_PATH = 'http_cache'
+
+# seconds a cached response stays fresh for each source. Listings and profiles change rarely
+HOST_TTLS = {'swingtradebot.com': 24 * 60 * 60,
+             'finance.yahoo.com': 7 * 24 * 60 * 60,
+             'www.alphavantage.co': 12 * 60 * 60}
+DEFAULT_TTL = 60 * 60
+
+# query parameters that do not change the response (so a different api key still hits the cache)
+IGNORED_PARAMS = ('apikey',)
+
+
+def cache_key(url):
+    """
+    normalized url used as the cache key (ignored parameters are dropped and the others are sorted)
+    :param url: url of the request
+    :return: normalized url
+    """
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in IGNORED_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def sha256(data):
+    """
+    :param data: bytes to hash
+    :return: hex sha256 of the data
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResponseCache:
+    """
+    on-disk cache of HTTP responses. Each url points to a gzip compressed body that is stored by the hash of its
+    content, so identical bodies are only stored once. In replay mode responses are always served from the cache
+    (no matter how old) and nothing goes to the network.
+    """
+
+    def __init__(self, path=CACHE_PATH, host_ttls=None, default_ttl=DEFAULT_TTL, replay=False, clock=time.time):
+        """
+        :param path: directory of the cache
+        :param host_ttls: dictionary of host name to seconds a response stays fresh, defaults to HOST_TTLS
+        :param default_ttl: seconds a response stays fresh for hosts that are not in host_ttls
+        :param replay: bool of whether to only serve from the cache
+        :param clock: function that returns the current time in seconds
+        """
+        self.path = path
+        self.host_ttls = HOST_TTLS if host_ttls is None else host_ttls
+        self.default_ttl = default_ttl
+        self.replay = replay
+        self.clock = clock
+        os.makedirs(os.path.join(path, 'urls'), exist_ok=True)
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+
+    def url_file(self, url):
+        """
+        :param url: url of the request
+        :return: path to the file with the url's entry
+        """
+        return os.path.join(self.path, 'urls', sha256(cache_key(url).encode('utf-8')) + '.json')
+
+    def object_file(self, body_hash):
+        """
+        :param body_hash: sha256 of the body
+        :return: path to the compressed body
+        """
+        return os.path.join(self.path, 'objects', body_hash + '.gz')
+
+    def ttl(self, url):
+        """
+        :param url: url of the request
+        :return: seconds a response from the url's host stays fresh
+        """
+        return self.host_ttls.get(urlsplit(url).netloc, self.default_ttl)
+
+    def load(self, url):
+        """
+        gets a fresh (or, in replay mode, any) cached response for the url
+        :param url: url of the request
+        :return: requests response, or None if there is nothing usable in the cache
+        """
+        try:
+            with open(self.url_file(url), mode='r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if not self.replay and self.clock() - entry['fetched_at'] > self.ttl(url):
+                return None
+            with gzip.open(self.object_file(entry['body']), mode='rb') as f:
+                content = f.read()
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            return None
+
+        response = requests.models.Response()
+        response.status_code = entry['status']
+        response.url = entry['url']
+        response.encoding = entry['encoding']
+        response.headers.update(entry['headers'])
+        response._content = content
+        return response
+
+    def store(self, url, response):
+        """
+        saves a successful response
+        :param url: url of the request
+        :param response: requests response
+        :return: nothing is returned
+        """
+        if response.status_code != 200:
+            return
+
+        content = response.content
+        body_hash = sha256(content)
+        object_file = self.object_file(body_hash)
+
+        if not os.path.exists(object_file):
+            tmp_file = object_file + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+            with gzip.open(tmp_file, mode='wb') as f:
+                f.write(content)
+            os.replace(tmp_file, object_file)
+
+        entry = {'url': cache_key(url), 'status': response.status_code, 'encoding': response.encoding,
+                 'headers': {'Content-Type': response.headers.get('Content-Type', '')},
+                 'fetched_at': self.clock(), 'body': body_hash}
+        url_file = self.url_file(url)
+        tmp_file = url_file + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_file, mode='w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, url_file)
+
+    def forget(self, url):
+        """
+        removes the url's entry (i.e. the response turned out to be an error message)
+        :param url: url of the request
+        :return: nothing is returned
+        """
+        try:
+            os.remove(self.url_file(url))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,184 @@
+import metrics
+import hashlib
+import json
+import os
+import threading
+
+CACHE_PATH = 'analysis_cache'
+
+# number of results (inputs x parameter sets) kept. The least recently used one is removed after that
+MAX_ENTRIES = 16
+
+# changes whenever the calculations change, so results of older code are never served
+CACHE_VERSION = 2
+
+# a csv file is hashed this many bytes at a time
+HASH_BLOCK_BYTES = 1 << 20
+
+
+def frame_fingerprint(df, columns):
+    """
+    fingerprint of the values of some columns of a DataFrame (row order matters, the index does not)
+    :param df: pandas DataFrame
+    :param columns: names of the columns the analysis uses
+    :return: hex sha256
+    """
+    import pandas as pd
+
+    digest = hashlib.sha256(json.dumps([[column, str(df[column].dtype)] for column in columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def source_fingerprint(path):
+    """
+    fingerprint of the prices file or store the prices were read from. A csv file is fingerprinted by a hash of its
+    contents (hashing is much faster than parsing it). A store is fingerprinted by its generation, which changes every
+    time its meta data is written (see price_store.write_meta), so it costs the same however many rows there are. A
+    store goes stale with the csv file it was written from, so only pass a store that was checked against the file
+    (see price_store.store_is_current)
+    :param path: path to a prices csv file or to the directory of a price store
+    :return: string fingerprint, or None if the store has no generation (written before there were generations)
+    """
+    import price_store
+
+    if os.path.isdir(path):
+        generation = (price_store.read_meta(path) or dict()).get('generation')
+        return None if generation is None else f'store:{generation}'
+
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return f'csv:{digest.hexdigest()}'
+
+
+def cache_key(fingerprints, params):
+    """
+    :param fingerprints: list of fingerprints of the inputs
+    :param params: dictionary of the analysis parameters (must be JSON serializable)
+    :return: hex sha256 of the inputs, the parameters and CACHE_VERSION
+    """
+    key = json.dumps({'version': CACHE_VERSION, 'inputs': fingerprints, 'params': params}, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    on-disk cache of analysis results, keyed by a fingerprint of the inputs and the analysis parameters (see
+    cache_key). Each result is one JSON file. Serving a result touches its file, so the least recently used results
+    are the ones removed once there are more than max_entries.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        """
+        :param path: directory of the cache
+        :param max_entries: number of results to keep
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def entry_file(self, key):
+        """
+        :param key: cache key
+        :return: path to the file with the key's results
+        """
+        return os.path.join(self.path, key + '.json')
+
+    def load(self, key, touch=True):
+        """
+        gets the results for a key, and marks them as the most recently used
+        :param key: cache key
+        :param touch: bool of whether to mark the results as the most recently used (False leaves the cache as it is)
+        :return: dictionary of horizon name to [analysis_dict, dates], or None if the key is not in the cache
+        """
+        try:
+            with open(self.entry_file(key), mode='r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if touch:
+                os.utime(self.entry_file(key))
+        except (FileNotFoundError, ValueError, OSError):
+            metrics.count('analysis_cache_misses')
+            return None
+
+        metrics.count('analysis_cache_hits')
+        return {name: (analysis_dict, dates) for name, (analysis_dict, dates) in entry['results'].items()}
+
+    def store(self, key, results):
+        """
+        saves the results for a key, and removes the least recently used results past max_entries
+        :param key: cache key
+        :param results: dictionary of horizon name to [analysis_dict, dates]
+        :return: nothing is returned
+        """
+        data = {name: [{sector: [float(value) for value in values] for sector, values in analysis_dict.items()},
+                       [str(date) for date in dates]]
+                for name, (analysis_dict, dates) in results.items()}
+
+        os.makedirs(self.path, exist_ok=True)
+        entry_file = self.entry_file(key)
+        tmp_file = entry_file + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_file, mode='w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'results': data}, f)
+        os.replace(tmp_file, entry_file)
+        self.evict()
+
+    def evict(self):
+        """
+        removes the least recently used results until there are max_entries left
+        :return: nothing is returned
+        """
+        with self.lock:
+            entries = list()
+            for name in os.listdir(self.path):
+                if name.endswith('.json'):
+                    try:
+                        entries.append((os.path.getmtime(os.path.join(self.path, name)), name))
+                    except FileNotFoundError:
+                        continue
+
+            entries.sort()
+            for _, name in entries[:max(0, len(entries) - self.max_entries)]:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    continue
+
+    def get_or_compute(self, key, compute):
+        """
+        results for a key from the cache, or computed (and saved) if they are not in it
+        :param key: cache key
+        :param compute: function that computes the results
+        :return: dictionary of horizon name to [analysis_dict, dates]
+        """
+        results = self.load(key)
+        if results is None:
+            results = compute()
+            self.store(key, results)
+        return results
+
+
+# the cache used by analysis_driver. None means the results are always computed (like before there was a cache)
+_cache = None
+
+
+def configure(max_entries=MAX_ENTRIES, path=CACHE_PATH):
+    """
+    sets up the cache used by analysis_driver
+    :param max_entries: number of results to keep, 0 to always compute the results
+    :param path: directory of the cache
+    :return: nothing is returned
+    """
+    global _cache
+    if max_entries <= 0:
+        _cache = None
+    else:
+        _cache = ResultCache(path, max_entries)
+
+
+def get_cache():
+    """
+    :return: the configured ResultCache, None if there is none
+    """
+    return _cache
@@ -0,0 +1,202 @@
+import metrics
+import profile_store
+import json
+import os
+import threading
+
+JOURNAL_PATH = 'run_journal.jsonl'
+
+# what a journal line can record
+PAGE = 'page'
+PROFILE = 'profile'
+PRICES = 'prices'
+
+
+class RunJournal:
+    """
+    append-only journal of the work a remote/test run has finished: each swingtradebot.com listing page, each yahoo
+    finance profile and each alphavantage response is written as one JSON line as soon as it lands. A run started
+    with resume reads the journal back and only does the work that is not in it, so a run that failed or was stopped
+    continues from where it was instead of starting over.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, resume=False):
+        """
+        :param path: file to keep the journal in
+        :param resume: bool of whether to continue from the journal on disk (False starts a new one)
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {PAGE: dict(), PROFILE: dict(), PRICES: dict()}
+        if resume:
+            self.load()
+        self.file = open(path, mode='a' if resume else 'w', encoding='utf-8')
+
+    def load(self):
+        """
+        reads the journal from disk. A line that was only partly written when the run stopped is skipped
+        :return: nothing is returned
+        """
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['kind']][entry['key']] = entry['value']
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except FileNotFoundError:
+            return
+
+    def record(self, kind, key, value):
+        """
+        keeps a finished piece of work and writes it to disk right away
+        :param kind: PAGE, PROFILE or PRICES
+        :param key: page number or symbol
+        :param value: what the work returned (must be JSON serializable)
+        :return: nothing is returned
+        """
+        line = json.dumps({'kind': kind, 'key': key, 'value': value})
+        with self.lock:
+            self.entries[kind][key] = value
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def get(self, kind, key):
+        """
+        :param kind: PAGE, PROFILE or PRICES
+        :param key: page number or symbol
+        :return: the recorded value, or None if that work has not been done yet
+        """
+        # json turns the page numbers into strings, so keys are always compared as strings
+        with self.lock:
+            value = self.entries[kind].get(str(key))
+        if value is not None:
+            metrics.count('journal_hits', kind=kind)
+        return value
+
+    def counts(self):
+        """
+        :return: dictionary of kind to the number of finished pieces of work in the journal
+        """
+        with self.lock:
+            return {kind: len(entries) for kind, entries in self.entries.items()}
+
+    def close(self):
+        """
+        closes the journal file (the journal stays on disk)
+        :return: nothing is returned
+        """
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+# the journal used by the scrapers. None means nothing is journaled (like before there was a journal)
+_journal = None
+
+
+def configure(resume=False, path=JOURNAL_PATH):
+    """
+    starts the journal used by the scrapers and the alphavantage calls
+    :param resume: bool of whether to continue from the journal on disk (False starts a new one)
+    :param path: file to keep the journal in
+    :return: nothing is returned
+    """
+    global _journal
+    close()
+    _journal = RunJournal(path, resume)
+    if resume:
+        counts = _journal.counts()
+        print(f'Resuming from {path}: {counts[PAGE]} listing page(s), {counts[PROFILE]} profile(s) and '
+              f'{counts[PRICES]} price response(s) are already done.')
+
+
+def get_journal():
+    """
+    :return: the configured RunJournal, None if there is none
+    """
+    return _journal
+
+
+def listing_page(page_num, fetch):
+    """
+    companies on a swingtradebot.com listing page, from the journal if the page was already scraped
+    :param page_num: page number (each swingtradebot.com page has 20 symbols)
+    :param fetch: function that requests and parses the page, returns [companies, message] (companies is None if
+    the request failed)
+    :return: [companies, message]
+    """
+    if _journal is not None:
+        companies = _journal.get(PAGE, page_num)
+        if companies is not None:
+            return [[dict(curr_company) for curr_company in companies], None]
+
+    companies, message = fetch(page_num)
+    if _journal is not None and companies is not None:
+        _journal.record(PAGE, str(page_num), companies)
+    return [companies, message]
+
+
+def get_company_info(symbol):
+    """
+    company information for a symbol, from the journal if it was already scraped this run (else see
+    profile_store.get_company_info)
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :return: dictionary of company information (same as scrape_and_compile_yahoo)
+    """
+    if _journal is not None:
+        info = _journal.get(PROFILE, symbol)
+        if info is not None:
+            return dict(info)
+
+    info = profile_store.get_company_info(symbol)
+
+    # profiles that could not be scraped (all None) are not kept, so they are scraped again on resume
+    if _journal is not None and not all(value is None for value in info.values()):
+        _journal.record(PROFILE, symbol, info)
+    return info
+
+
+def fetch_prices(symbol, fetch):
+    """
+    alphavantage response for a symbol, from the journal if it was already fetched this run
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :param fetch: function that calls alphavantage for the symbol, returns [historical_prices, stop]
+    :return: [historical_prices, stop] (see alphavantage_api.fetch_symbol)
+    """
+    if _journal is not None:
+        historical_prices = _journal.get(PRICES, symbol)
+        if historical_prices is not None:
+            return historical_prices, False
+
+    historical_prices, stop = fetch(symbol)
+
+    # only responses with prices are kept, so symbols that failed are requested again on resume
+    if _journal is not None and isinstance(historical_prices, dict) and 'Time Series (Daily)' in historical_prices:
+        _journal.record(PRICES, symbol, historical_prices)
+    return historical_prices, stop
+
+
+def close():
+    """
+    closes the configured journal (if there is one). The journal stays on disk so the run can be resumed
+    :return: nothing is returned
+    """
+    global _journal
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+
+
+def finish():
+    """
+    closes the configured journal and removes it, once the run has finished and nothing is left to resume
+    :return: nothing is returned
+    """
+    if _journal is None:
+        return
+    path = _journal.path
+    close()
+    if os.path.exists(path):
+        os.remove(path)
@@ -1,23 +1,44 @@
 import requests
-from bs4 import BeautifulSoup
+import http_client
+from bs4 import BeautifulSoup, SoupStrainer
 import csv
-import scrape_yahoo_finance
-import time
+import os
+import re
+import metrics
+import profile_store
+import run_journal
+from concurrent.futures import ThreadPoolExecutor
 
+# only the listing table is built when parsing a page (same class matching as soup.find)
+LISTING_STRAINER = SoupStrainer('div', attrs={'class': re.compile(r'(^|\s)table-responsive(\s|$)')})
 
-def get_sym_data(curr_company, symbols, sectors):
+# number of yahoo finance profiles to request at the same time (a swingtradebot page has 20 symbols)
+YAHOO_WORKERS = 20
+
+# the listing is requested from this site, unless the SWINGTRADEBOT_URL environment variable points somewhere else
+# (i.e. the local fake_upstream.py server)
+BASE_URL = 'https://swingtradebot.com'
+BASE_URL_VARIABLE = 'SWINGTRADEBOT_URL'
+
+
+def base_url():
+    """
+    :return: url of the swingtradebot.com site to request (without a trailing slash)
+    """
+    return os.environ.get(BASE_URL_VARIABLE, BASE_URL).rstrip('/')
+
+
+def merge_sym_data(curr_company, yahoo_company_info, symbols, sectors):
     """
-    calls yahoo finance and merges the data into the sectors, symbols dictionaries
+    merges the data from yahoo finance into the sectors, symbols dictionaries
 
     :param curr_company: dictionary - current symbol and data about the symbol from swingtradebot
+    :param yahoo_company_info: dictionary - information about the symbol from yahoo finance
     :param symbols: dictionary - previous symbols and their data from swingtradebot
     :param sectors: dictionary - sectors and the symbols within each
-    :return: updated versions of (avg_volumes, symbols, sectors)
+    :return: updated versions of (symbols, sectors)
     """
     SYMBOL_KEY = 'symbol'
-
-    # yahoo finance call, returns a dictionary with information about that symbol
-    yahoo_company_info = scrape_yahoo_finance.scrape_and_compile_yahoo(curr_company[SYMBOL_KEY])
     sector = yahoo_company_info['sector']
 
     # update sectors dictionary with new symbol
@@ -32,99 +53,154 @@ def get_sym_data(curr_company, symbols, sectors):
     return symbols, sectors
 
 
-def swingtradebot_scraper(max_page_num):
+def get_page_sym_data(companies, symbols, sectors, max_workers=YAHOO_WORKERS):
+    """
+    calls yahoo finance for every company on a page at the same time (up to max_workers requests in flight), then
+    merges the data into the sectors, symbols dictionaries in the same order as the page.
+    profiles that are in the run journal or fresh in the local profile store are not requested again.
+
+    :param companies: list of dictionaries - symbols and data about them from one swingtradebot page
+    :param symbols: dictionary - previous symbols and their data from swingtradebot
+    :param sectors: dictionary - sectors and the symbols within each
+    :param max_workers: number of yahoo finance requests to make at once
+    :return: updated versions of (symbols, sectors)
+    """
+    sym_list = [curr_company['symbol'] for curr_company in companies]
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        yahoo_infos = list(executor.map(run_journal.get_company_info, sym_list))
+
+    for curr_company, yahoo_company_info in zip(companies, yahoo_infos):
+        symbols, sectors = merge_sym_data(curr_company, yahoo_company_info, symbols, sectors)
+
+    return symbols, sectors
+
+
+def get_listing_page(page_num):
+    """
+    requests one page of the swingtradebot.com listing
+    :param page_num: page number to request (each swingtradebot.com page has 20 symbols)
+    :return: [response, message]
+
+    response is the requests response, or None if the request failed
+    message is None if the request was successful, or a text of why it failed
+    """
+    url = f'{base_url()}/equities?adx_trend=&direction=desc&end_date=2019-11-15&grade=&grade_target' \
+          f'=B&include_etfs=0&max_price=99999999999999.0&min_price=0.0&min_vol=0&optionable=false&sort' \
+          f'=average_daily_volume&sort_by=average_daily_volume+ASC&trading_date=2019-11-15&weekly_options=false' \
+          f'&page={page_num}'
+
+    # transient errors (503 and the like) are retried by the http client with backoff.
+    # if it still fails, it will return an unsuccessful message
+    try:
+        response = http_client.get(url)
+    except requests.exceptions.RequestException as e:
+        return [None, f'Error requesting the page. The page_num was {page_num}. Error was "{e}"']
+
+    return [response, None]
+
+
+def fetch_listing_page(page_num):
+    """
+    requests and parses one page of the swingtradebot.com listing
+    :param page_num: page number to request (each swingtradebot.com page has 20 symbols)
+    :return: [companies, message]
+
+    companies is the list of companies on the page (see parse_listing_page), or None if the request failed
+    message is None if the request was successful, or a text of why it failed
+    """
+    response, message = get_listing_page(page_num)
+    if response is None:
+        return [None, message]
+
+    companies = parse_listing_page(response.content)
+    metrics.count('rows_parsed', len(companies), source='swingtradebot')
+    return [companies, None]
+
+
+def parse_listing_page(content, fast=True):
+    """
+    parses the companies out of one page of the swingtradebot.com listing
+    :param content: html of the page
+    :param fast: bool of whether to only build the listing table (False builds the whole page)
+    :return: list of dictionaries - symbol, name, close_price, volatility, avg_volume for each company on the page
+    """
+    curr_company_swing_trade_keys = ['symbol', 'name', 'close_price', 'volatility', 'avg_volume']
+    VOLUME_KEY = 'avg_volume'
+
+    # using BS4 to parse the data we want
+    soup = BeautifulSoup(content, 'lxml', parse_only=LISTING_STRAINER if fast else None)
+    table = soup.find('div', {'class': 'table-responsive'})
+    data = table.find('tbody')
+    companies = list()
+
+    for tr in data.find_all('tr'):
+        curr_company = dict()
+
+        # put in dummy values of None for each key
+        for key in curr_company_swing_trade_keys:
+            curr_company[key] = None
+
+        # this loop assumes that the structure of the table is the same for each page.
+        for td in tr.find_all('td'):
+            a = td.find('a')
+
+            # some data is stored in <a> tags, some is not
+            if a is None:
+                # skip if there is no data
+                if len(td.text) == 0:
+                    continue
+                else:
+                    td_text = td.text.replace(',', '')
+                    if curr_company['close_price'] is None:
+                        curr_company['close_price'] = float(td_text)
+                    elif curr_company['volatility'] is None:
+                        curr_company['volatility'] = float(td_text)
+                    elif curr_company['avg_volume'] is None:
+                        curr_company['avg_volume'] = float(td_text)
+            else:
+                if curr_company['symbol'] is None:
+                    curr_company['symbol'] = a.text
+                elif curr_company['name'] is None:
+                    curr_company['name'] = a.text
+
+        # convert volume to an integer
+        curr_company[VOLUME_KEY] = int(curr_company[VOLUME_KEY])
+
+        companies.append(curr_company)
+
+    return companies
+
+
+@metrics.timed('swingtradebot_scrape')
+def swingtradebot_scraper(max_page_num, max_workers=YAHOO_WORKERS):
     """
     Processes the main scrape using requests and bs4.
     :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+    :param max_workers: number of yahoo finance requests to make at once
     :return: [symbols, message, success]
 
     symbols is a dictionary full with the data from STB and Yahoo Finance
     message is a text of whether the scrape was successful or if it failed
     success is a bool based on if the scrape was successful or it it failed
     """
-    curr_company_swing_trade_keys = ['symbol', 'name', 'close_price', 'volatility', 'avg_volume']
     symbols = dict()  # has full information about symbol
     sectors = dict()  # sectors to symbols
     page_num = 1
     success = True
-    VOLUME_KEY = 'avg_volume'
 
     # continue until the max page number is reached
     while page_num < max_page_num:
-        url = f'https://swingtradebot.com/equities?adx_trend=&direction=desc&end_date=2019-11-15&grade=&grade_target' \
-              f'=B&include_etfs=0&max_price=99999999999999.0&min_price=0.0&min_vol=0&optionable=false&sort' \
-              f'=average_daily_volume&sort_by=average_daily_volume+ASC&trading_date=2019-11-15&weekly_options=false' \
-              f'&page={page_num}'
-
-        # get request and see if it is valid. If a 503 or 400 Error comes up, then it will wait 2 seconds and try again
-        # if it fails a second time, it will return whatever the program was able to scrape with an unsuccessful message
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            if '503 Server Error' in response or '400 Client Error:' in response:
-                print('503 Error or 400 Error. Trying again in 2 seconds. If it fails again, program will quit. ')
-                time.sleep(2)
-
-                try:
-                    response = requests.get(url)
-                    response.raise_for_status()
-                except requests.exceptions.HTTPError as e:
-                    if '503 Server Error' in response or '400 Client Error:' in response:
-                        print('503 Error or 400 Error. It failed again, program will quit. ')
-                        success = False
-                        message = f'Back to back 503 or 400 errors. The page_num was {page_num}. Error was "{e}"'
-                        return [symbols, message, success]
-                    else:
-                        message = f'Unexpected error. The page_num was {page_num}. Error was "{e}"'
-                        success = False
-                        return [symbols, message, success]
-            else:
-                message = f'Unexpected error. The page_num was {page_num}. Error was "{e}"'
-                success = False
-                return [symbols, message, success]
-
-        # once the request is deemed valid, using BS4 to parse the data we want
-        soup = BeautifulSoup(response.content, 'lxml')
-        table = soup.find('div', {'class': 'table-responsive'})
-        data = table.find('tbody')
-
-        for tr in data.find_all('tr'):
-            curr_company = dict()
-
-            # put in dummy values of None for each key
-            for key in curr_company_swing_trade_keys:
-                curr_company[key] = None
-
-            # this loop assumes that the structure of the table is the same for each page.
-            for td in tr.find_all('td'):
-                a = td.find('a')
-
-                # some data is stored in <a> tags, some is not
-                if a is None:
-                    # skip if there is no data
-                    if len(td.text) == 0:
-                        continue
-                    else:
-                        td_text = td.text.replace(',', '')
-                        if curr_company['close_price'] is None:
-                            curr_company['close_price'] = float(td_text)
-                        elif curr_company['volatility'] is None:
-                            curr_company['volatility'] = float(td_text)
-                        elif curr_company['avg_volume'] is None:
-                            curr_company['avg_volume'] = float(td_text)
-                else:
-                    if curr_company['symbol'] is None:
-                        curr_company['symbol'] = a.text
-                    elif curr_company['name'] is None:
-                        curr_company['name'] = a.text
-
-            # convert volume to an integer
-            curr_company[VOLUME_KEY] = int(curr_company[VOLUME_KEY])
+        # if the page can't be requested, return whatever the program was able to scrape with an unsuccessful message.
+        # pages that are in the run journal are not requested again
+        companies, message = run_journal.listing_page(page_num, fetch_listing_page)
+        if companies is None:
+            success = False
+            return [symbols, message, success]
 
-            # get the sector and other important company information.
-            # it returns updated symbols, sectors dictionaries
-            symbols, sectors = get_sym_data(curr_company, symbols, sectors)
+        # get the sector and other important company information for the whole page at once.
+        # it returns updated symbols, sectors dictionaries
+        symbols, sectors = get_page_sym_data(companies, symbols, sectors, max_workers)
 
         print(f'Finished scraping symbols from SwingTradeBot/Yahoo Finance for page {page_num}.')
         page_num += 1
@@ -133,6 +209,7 @@ def swingtradebot_scraper(max_page_num):
     return [symbols, message, success]
 
 
+@metrics.timed('deposit_symbols')
 def deposit_to_csv(symbols):
     """
     store the symbols and the collected data into a csv called "symbols.csv"
@@ -165,14 +242,16 @@ def deposit_to_csv(symbols):
                 for header in headers:
                     row.append(s[header])
                 symbols_writer.writerow(row)
+        metrics.count('rows_written', len(symbols), file='symbols.csv')
         return 'symbols.csv was created or updated.'
 
 
-def swingtradebot_driver(overwrite, max_page_num):
+def swingtradebot_driver(overwrite, max_page_num, max_workers=YAHOO_WORKERS):
     """
     calls the swingtradebot functions in order to scrape and generate a CSV file with the data.
     :param overwrite: whether to overwrite current file.
     :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+    :param max_workers: number of yahoo finance requests to make at once
     :return: the symbols dictionary is returned
     """
     if max_page_num == 2:
@@ -183,7 +262,8 @@ def swingtradebot_driver(overwrite, max_page_num):
               'complete.')
 
     # call swingtradebot scraper
-    symbols, message, scrape_success = swingtradebot_scraper(max_page_num)
+    symbols, message, scrape_success = swingtradebot_scraper(max_page_num, max_workers)
+    profile_store.close()
 
     if scrape_success and overwrite:
         message = deposit_to_csv(symbols)
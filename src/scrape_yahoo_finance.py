@@ -1,7 +1,24 @@
 import csv
 import requests
-from bs4 import BeautifulSoup
-import time
+import http_client
+import metrics
+import os
+from bs4 import BeautifulSoup, SoupStrainer
+
+# only the tags the get_* functions look at are built (the description <p> is inside the <section>)
+PROFILE_STRAINER = SoupStrainer(['p', 'section'])
+
+# profiles are requested from this site, unless the YAHOO_FINANCE_URL environment variable points somewhere else
+# (i.e. the local fake_upstream.py server)
+BASE_URL = 'https://finance.yahoo.com'
+BASE_URL_VARIABLE = 'YAHOO_FINANCE_URL'
+
+
+def base_url():
+    """
+    :return: url of the yahoo finance site to request (without a trailing slash)
+    """
+    return os.environ.get(BASE_URL_VARIABLE, BASE_URL).rstrip('/')
 
 
 def clean_address(info, company_info, fields):
@@ -135,38 +152,24 @@ def get_desc(soup):
         return desc_dict
 
 
-def scrape_and_compile_yahoo(sym):
+def empty_company_info():
     """
-    scrapes yahoo finance, and returns a variety of information for each company that is assocaited with the given
-    symbol
-    :param sym:  Symbol of the company
-    :return: dictionary of information for that company
+    information for a company whose profile could not be scraped
+    :return: dictionary with the same keys as scrape_and_compile_yahoo, all set to None
     """
-    yahoo_link = f'https://finance.yahoo.com/quote/{sym}/profile?p={sym}'
+    fields = ('phone', 'website', 'city', 'country', 'sector', 'industry', 'fte', 'description')
+    return {field: None for field in fields}
 
-    # ensure the response is valid or exit program.
-    try:
-        response = requests.get(yahoo_link)
-        response.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        if '503 Server Error' in str(e):
-            print(e)
-            print(f'Retrying in 2 seconds. If it fails again, program will stop. Current symbol is {sym}')
-
-            time.sleep(2)
-            try:
-                response = requests.get(yahoo_link)
-                response.raise_for_status()
-            except requests.exceptions.HTTPError as e:
-                print(e)
-                exit()
-        else:
-            print(f'There was an error. This error was not seen before. Error: "{e}". Program has exited. Please '
-                  f're-run if it is a network issue.')
-            exit()
 
+def parse_profile(content, fast=True):
+    """
+    parses the company information out of a yahoo finance profile page
+    :param content: html of the page
+    :param fast: bool of whether to only build the tags that are needed (False builds the whole page)
+    :return: dictionary of information for that company
+    """
     # call functions to fill the dictionary and return it
-    soup = BeautifulSoup(response.content, 'lxml')
+    soup = BeautifulSoup(content, 'lxml', parse_only=PROFILE_STRAINER if fast else None)
     company_info = get_address(soup)
 
     sifte = get_sector_industry_fte(soup)
@@ -176,3 +179,25 @@ def scrape_and_compile_yahoo(sym):
     company_info.update(desc)
 
     return company_info
+
+
+@metrics.timed('yahoo_profile')
+def scrape_and_compile_yahoo(sym):
+    """
+    scrapes yahoo finance, and returns a variety of information for each company that is assocaited with the given
+    symbol
+    :param sym:  Symbol of the company
+    :return: dictionary of information for that company
+    """
+    yahoo_link = f'{base_url()}/quote/{sym}/profile?p={sym}'
+
+    # transient errors (503 and the like) are retried by the http client with backoff.
+    # if it still fails, the symbol gets empty information instead of ending the program
+    try:
+        response = http_client.get(yahoo_link)
+    except requests.exceptions.RequestException as e:
+        print(f'Could not get the Yahoo Finance profile for {sym}. Continuing without it. Error: "{e}"')
+        return empty_company_info()
+
+    metrics.count('rows_parsed', source='yahoo_finance')
+    return parse_profile(response.content)
@@ -0,0 +1,406 @@
+import alphavantage_api as av
+import http_client
+import metrics
+import price_refresh
+import profile_store
+import rate_limit
+import run_journal
+import scrape_swingtradebot as stb
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+
+SHARD_DIR = 'shards'
+LISTING_FILE = 'listing.json'
+SYMBOLS_FILE = 'symbols.json'
+PRICES_FILE = 'ninety_day_historical_prices.csv'
+
+
+def shard_of(symbol, num_shards):
+    """
+    shard a symbol belongs to. The hash does not change between runs, processes or hosts (unlike hash()), so a
+    symbol is always fetched by the same shard and each shard's profile store and journal stay useful
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :param num_shards: number of shards
+    :return: shard number, from 0 to num_shards - 1
+    """
+    return int(hashlib.sha1(symbol.encode('utf-8')).hexdigest(), 16) % num_shards
+
+
+def shard_path(shard, num_shards, root=SHARD_DIR):
+    """
+    :param shard: shard number
+    :param num_shards: number of shards
+    :param root: directory of the listing and the shard outputs
+    :return: directory of the shard's outputs (i.e. "shards/shard_0_of_4")
+    """
+    return os.path.join(root, f'shard_{shard}_of_{num_shards}')
+
+
+def shard_keys(api_keys, shard, num_shards, calls_per_minute=av.CALLS_PER_MINUTE):
+    """
+    api keys a shard can use. Keys are split between the shards. With fewer keys than shards, each shard gets one key
+    and a share of its calls per minute, so the shards that share a key stay within its limit together
+    :param api_keys: list of api keys from alphavantage
+    :param shard: shard number
+    :param num_shards: number of shards
+    :param calls_per_minute: number of calls allowed per minute for each api key
+    :return: [keys, calls_per_minute] for the shard
+    """
+    if len(api_keys) >= num_shards:
+        return [api_keys[shard::num_shards], calls_per_minute]
+
+    sharing = len(range(shard % len(api_keys), num_shards, len(api_keys)))
+    return [[api_keys[shard % len(api_keys)]], calls_per_minute / sharing]
+
+
+def write_json(path, data):
+    """
+    writes json to a temp file first, so the file is never half written
+    :param path: path of the file
+    :param data: data to write
+    :return: nothing is returned
+    """
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, mode='w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    """
+    :param path: path of the file
+    :return: data in the file
+    """
+    with open(path, mode='r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@metrics.timed('shard_listing')
+def scrape_listing(max_page_num, root=SHARD_DIR):
+    """
+    scrapes the swingtradebot.com listing pages (without the profiles) and saves the companies for the shards
+    :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+    :param root: directory of the listing and the shard outputs
+    :return: [companies, message, success]
+
+    companies is the list of companies from the listing, in listing order
+    message is a text of whether the scrape was successful or if it failed
+    success is a bool based on if the scrape was successful or it it failed
+    """
+    companies = list()
+    message = 'Successfully scraped the SwingTradeBot.com listing'
+    success = True
+
+    for page_num in range(1, max_page_num):
+        page_companies, page_message = run_journal.listing_page(page_num, stb.fetch_listing_page)
+        if page_companies is None:
+            message = page_message
+            success = False
+            break
+        companies.extend(page_companies)
+        print(f'Finished scraping symbols from SwingTradeBot for page {page_num}.')
+
+    os.makedirs(root, exist_ok=True)
+    write_json(os.path.join(root, LISTING_FILE), {'companies': companies, 'message': message, 'success': success})
+    return [companies, message, success]
+
+
+def shard_companies(shard, num_shards, root=SHARD_DIR):
+    """
+    :param shard: shard number
+    :param num_shards: number of shards
+    :param root: directory of the listing and the shard outputs
+    :return: list of the companies from the listing that belong to the shard, in listing order
+    """
+    return [curr_company for curr_company in read_json(os.path.join(root, LISTING_FILE))['companies']
+            if shard_of(curr_company['symbol'], num_shards) == shard]
+
+
+def configure_shard(path, cache='off', profile_max_age=profile_store.MAX_AGE_DAYS, refresh_in_background=False,
+                    resume=False):
+    """
+    sets up the http cache, the profile store and the journal of a shard process. The profile store and the journal
+    are kept in the shard's directory, so shards never write to the same file (even on the same host). The shard's
+    profile store starts with the shard's profiles from the main store (see seed_profiles)
+    :param path: directory of the shard's outputs
+    :param cache: "off", "on" or "replay" (see http_client.configure_cache)
+    :param profile_max_age: number of days a profile is used before it is scraped again, 0 to always scrape
+    :param refresh_in_background: bool of whether to return stale profiles and refresh them in the background
+    :param resume: bool of whether to continue from the shard's journal
+    :return: nothing is returned
+    """
+    os.makedirs(path, exist_ok=True)
+    http_client.configure_cache(cache)
+    profile_store.configure(profile_max_age, refresh_in_background, os.path.join(path, profile_store.PROFILE_PATH))
+    run_journal.configure(resume, os.path.join(path, run_journal.JOURNAL_PATH))
+
+
+def fetch_shard(shard, num_shards, root=SHARD_DIR, api_keys=None, profile_workers=stb.YAHOO_WORKERS):
+    """
+    scrapes the profiles and fetches the prices of the symbols in one shard, and writes them to the shard's directory
+    (symbols.json and the prices csv file). The listing has to be scraped first (see scrape_listing)
+    :param shard: shard number
+    :param num_shards: number of shards
+    :param root: directory of the listing and the shard outputs
+    :param api_keys: list of api keys from alphavantage (split between the shards), defaults to get_api_keys()
+    :param profile_workers: number of yahoo finance requests to make at once
+    :return: dictionary with the shard, its number of symbols and symbols with prices, and whether it completed
+    (False if alphavantage looked to be offline)
+    """
+    path = shard_path(shard, num_shards, root)
+    os.makedirs(path, exist_ok=True)
+    companies = shard_companies(shard, num_shards, root)
+    sym_list = [curr_company['symbol'] for curr_company in companies]
+
+    # profiles, merged in listing order like swingtradebot_scraper does
+    symbols = dict()
+    sectors = dict()
+    with ThreadPoolExecutor(max_workers=max(1, profile_workers)) as executor:
+        yahoo_infos = list(executor.map(run_journal.get_company_info, sym_list))
+    for curr_company, yahoo_company_info in zip(companies, yahoo_infos):
+        symbols, sectors = stb.merge_sym_data(curr_company, yahoo_company_info, symbols, sectors)
+    profile_store.close()
+    write_json(os.path.join(path, SYMBOLS_FILE), symbols)
+    print(f'Shard {shard} of {num_shards}: finished {len(symbols)} profiles.')
+
+    keys, calls_per_minute = shard_keys(av.get_api_keys() if api_keys is None else api_keys, shard, num_shards)
+    key_pool = rate_limit.KeyPool(keys, calls_per_minute)
+    priced = 0
+    completed = True
+
+    executor = ThreadPoolExecutor(max_workers=len(keys))
+
+    # symbols that are not fetched yet are cancelled if the shard stops early
+    try:
+        with av.PriceWriter(os.path.join(path, PRICES_FILE), overwrite=True, store_path=None) as writer:
+            results = executor.map(lambda s: run_journal.fetch_prices(s, lambda x: av.fetch_symbol(x, key_pool)),
+                                   sym_list)
+
+            for symbol, (historical_prices, stop) in zip(sym_list, results):
+                if stop:
+                    print(f'Shard {shard} of {num_shards}: hit 10 consecutive 503 Errors. Stopping the shard. Please '
+                          f'check to see if the Alphavantage API is still online.')
+                    completed = False
+                    break
+
+                try:
+                    time_series = historical_prices['Time Series (Daily)']
+                    headers = list(list(time_series.values())[0].keys())
+                except (KeyError, IndexError, TypeError):
+                    print(f'Alphavantage could not process {symbol}. Continuing with the remaining symbols.')
+                    continue
+
+                writer.deposit(symbol, time_series, headers)
+                priced += 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    run_journal.close()
+    print(f'Shard {shard} of {num_shards}: finished {priced} of {len(sym_list)} price calls.')
+    return {'shard': shard, 'symbols': len(sym_list), 'priced': priced, 'completed': completed}
+
+
+def run_shard(shard, num_shards, root=SHARD_DIR, cache='off', profile_max_age=profile_store.MAX_AGE_DAYS,
+              refresh_in_background=False, resume=False):
+    """
+    sets up a shard process and fetches its shard (see configure_shard and fetch_shard)
+    :param shard: shard number
+    :param num_shards: number of shards
+    :param root: directory of the listing and the shard outputs
+    :param cache: "off", "on" or "replay" (see http_client.configure_cache)
+    :param profile_max_age: number of days a profile is used before it is scraped again, 0 to always scrape
+    :param refresh_in_background: bool of whether to return stale profiles and refresh them in the background
+    :param resume: bool of whether to continue from the shard's journal
+    :return: dictionary from fetch_shard
+    """
+    path = shard_path(shard, num_shards, root)
+    seed_profiles(path, [curr_company['symbol'] for curr_company in shard_companies(shard, num_shards, root)])
+    configure_shard(path, cache, profile_max_age, refresh_in_background, resume)
+    return fetch_shard(shard, num_shards, root)
+
+
+def seed_profiles(path, sym_list, main_path=profile_store.PROFILE_PATH):
+    """
+    copies the shard's profiles from the main profile store into the shard's store, so profiles that were scraped
+    before (with or without shards) are not scraped again. On another host, copy the main store next to the shards
+    directory first
+    :param path: directory of the shard's outputs
+    :param sym_list: list of the shard's symbols
+    :param main_path: json file of the main profile store
+    :return: nothing is returned
+    """
+    os.makedirs(path, exist_ok=True)
+    profile_store.merge_profiles([main_path], os.path.join(path, profile_store.PROFILE_PATH), set(sym_list))
+
+
+def read_merged_prices(prices_path):
+    """
+    typed DataFrame of the merged prices, decoded the same way as the prices of a run without shards (see
+    alphavantage_api.PriceAccumulator), so every mode gives the same analysis
+    :param prices_path: path to the merged prices csv file (see merge_shards)
+    :return: pandas DataFrame with symbol (categorical), date (datetime64) and the typed price columns
+    """
+    prices_df = price_refresh.load_stored_prices(prices_path)
+    headers = [column for column in prices_df.columns if column not in price_refresh.KEY_COLUMNS]
+    prices = av.PriceAccumulator()
+    for symbol, rows in prices_df.groupby('symbol', sort=False):
+        time_series = {row[0]: dict(zip(headers, row[1:])) for row in rows[['date'] + headers].itertuples(index=False)}
+        prices.add(symbol, time_series)
+    return prices.to_frame()
+
+
+@metrics.timed('shard_merge')
+def merge_shards(num_shards, root=SHARD_DIR, overwrite=True):
+    """
+    combines the shard outputs into symbols.csv and the prices csv file and store, in listing order (the same files
+    a run without shards writes), and folds the shards' profiles back into the main profile store
+    :param num_shards: number of shards
+    :param root: directory of the listing and the shard outputs
+    :param overwrite: bool of whether to write symbols.csv and the prices file and store (the merged prices are
+    always written to the root directory)
+    :return: [symbols, prices_path]
+
+    symbols is a dictionary full with the data from STB and Yahoo Finance, in listing order
+    prices_path is the path to the merged prices csv file, None if no shard has prices
+    """
+    import pandas as pd
+
+    shard_symbols = dict()
+    frames = list()
+    for shard in range(num_shards):
+        path = shard_path(shard, num_shards, root)
+        try:
+            shard_symbols.update(read_json(os.path.join(path, SYMBOLS_FILE)))
+        except FileNotFoundError:
+            print(f'{path} has no outputs. Run the fetch step of shard {shard} (or copy its directory here) before '
+                  f'merging. Ending program.')
+            exit()
+
+        prices = price_refresh.load_stored_prices(os.path.join(path, PRICES_FILE))
+        if len(prices) > 0:
+            frames.append(prices)
+
+    # profiles the shards scraped are kept for the next run, with or without shards
+    profile_store.merge_profiles([os.path.join(shard_path(shard, num_shards, root), profile_store.PROFILE_PATH)
+                                  for shard in range(num_shards)])
+
+    # symbols and prices go back in listing order
+    symbols = dict()
+    for curr_company in read_json(os.path.join(root, LISTING_FILE))['companies']:
+        if curr_company['symbol'] in shard_symbols:
+            symbols[curr_company['symbol']] = shard_symbols[curr_company['symbol']]
+
+    if overwrite and len(symbols) > 0:
+        print(stb.deposit_to_csv(symbols))
+
+    if len(frames) == 0:
+        return [symbols, None]
+
+    stored_df = pd.concat(frames, ignore_index=True)
+    prices_df = price_refresh.merge_prices(stored_df, list(), list(stored_df.columns), list(symbols.keys()))
+    prices_path = os.path.join(root, PRICES_FILE)
+    price_refresh.write_prices(prices_df, prices_path, store_path=None)
+    if overwrite:
+        price_refresh.write_prices(prices_df)
+        print('ninety_day_historical_prices.csv and the ninety_day_historical_prices store were created or updated.')
+
+    # the shard journals are only needed until their outputs are merged
+    for shard in range(num_shards):
+        journal_path = os.path.join(shard_path(shard, num_shards, root), run_journal.JOURNAL_PATH)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+
+    return [symbols, prices_path]
+
+
+def shard_driver(overwrite, max_page_num, num_shards, cache='off', profile_max_age=profile_store.MAX_AGE_DAYS,
+                 refresh_in_background=False, resume=False, root=SHARD_DIR):
+    """
+    scrapes the listing, fetches each shard in its own process and merges the shard outputs
+    :param overwrite: bool of whether to write symbols.csv and the prices file and store
+    :param max_page_num: page number to stop at (each swingtradebot.com page has 20 symbols)
+    :param num_shards: number of shards (and processes)
+    :param cache: "off", "on" or "replay" (see http_client.configure_cache)
+    :param profile_max_age: number of days a profile is used before it is scraped again, 0 to always scrape
+    :param refresh_in_background: bool of whether to return stale profiles and refresh them in the background
+    :param resume: bool of whether the shards continue from their journals
+    :param root: directory of the listing and the shard outputs
+    :return: [symbols, prices_path] (see merge_shards)
+    """
+    print(f'--------\nScraping the SwingTradeBot.com listing, then fetching the profiles and prices in {num_shards} '
+          f'shard(s).')
+    companies, message, success = scrape_listing(max_page_num, root)
+    print(message)
+
+    # spawned processes start clean, like a shard on another host (no sockets or locks from this process)
+    context = multiprocessing.get_context('spawn')
+    with metrics.stage('shard_fetch'), ProcessPoolExecutor(max_workers=num_shards, mp_context=context) as executor:
+        futures = [executor.submit(run_shard, shard, num_shards, root, cache, profile_max_age,
+                                   refresh_in_background, resume) for shard in range(num_shards)]
+        summaries = [future.result() for future in futures]
+
+    if not all(summary['completed'] for summary in summaries):
+        print('Not every shard finished. Ending program. Rerun with "-resume=1" to continue from the finished work.')
+        exit()
+
+    return merge_shards(num_shards, root, overwrite)
+
+
+def main():
+    """
+    runs one step of a sharded fetch, so the shards can run on different hosts: scrape the listing once, copy the
+    shards directory to each host and run the fetch step of its shard(s), copy the shard directories back and merge
+    :return: nothing is returned
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-step', type=str, required=True,
+                        help='"listing" scrapes the SwingTradeBot.com listing into shards/listing.json. "fetch" '
+                             'scrapes the profiles and fetches the prices of one shard into its own directory. '
+                             '"merge" combines the shard directories into symbols.csv and the prices file and store.')
+    parser.add_argument('-pages', type=int, required=False, default=10,
+                        help='Number of listing pages to scrape (20 symbols each) for the listing step. '
+                             'Defaults to 10.')
+    parser.add_argument('-shards', type=int, required=False, default=1,
+                        help='Number of shards the symbols are split into. Defaults to 1.')
+    parser.add_argument('-shard', type=int, required=False, default=0,
+                        help='Shard to fetch (0 to shards - 1) for the fetch step. Defaults to 0.')
+    parser.add_argument('-cache', type=str, required=False, default='off',
+                        help='"off", "on" or "replay" (see fulay_atharva.py -h). Defaults to "off".')
+    parser.add_argument('-profile_max_age', type=int, required=False, default=profile_store.MAX_AGE_DAYS,
+                        help='Number of days a profile in the shard\'s profile store is used before it is scraped '
+                             f'again. Defaults to {profile_store.MAX_AGE_DAYS}.')
+    parser.add_argument('-resume', type=int, required=False, default=0,
+                        help='"1" to continue the fetch step from the shard\'s journal. Defaults to 0.')
+    args, unknown = parser.parse_known_args()
+
+    if args.shards < 1 or not 0 <= args.shard < args.shards:
+        print('Invalid arguments. -shards must be at least 1 and -shard between 0 and -shards - 1.')
+        return
+
+    if args.step == 'listing':
+        run_journal.configure(args.resume == 1)
+        companies, message, success = scrape_listing(args.pages + 1)
+        if success:
+            run_journal.finish()
+        else:
+            run_journal.close()
+        print(f'{message}. {len(companies)} symbols were saved in {os.path.join(SHARD_DIR, LISTING_FILE)}.')
+    elif args.step == 'fetch':
+        summary = run_shard(args.shard, args.shards, cache=args.cache, profile_max_age=args.profile_max_age,
+                            resume=args.resume == 1)
+        if not summary['completed']:
+            print('Rerun with "-resume=1" to continue from the finished work.')
+    elif args.step == 'merge':
+        symbols, prices_path = merge_shards(args.shards)
+        print(f'Merged {len(symbols)} symbols from {args.shards} shard(s).')
+    else:
+        print('Invalid arguments. -step must be "listing", "fetch" or "merge".')
+
+
+if __name__ == '__main__':
+    main()
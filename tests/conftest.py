@@ -0,0 +1,125 @@
+import pytest
+import os
+import sys
+
+# the modules in src import each other by name, like when the program is run from src
+SRC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_PATH)
+
+import fake_upstream  # noqa: E402
+import fixtures  # noqa: E402
+import http_client  # noqa: E402
+import profile_store  # noqa: E402
+import result_cache  # noqa: E402
+import run_journal  # noqa: E402
+import pandas as pd  # noqa: E402
+
+# symbols served by the fake upstream in the tests
+NUM_SYMBOLS = 20
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    runs the test in an empty directory, since the program reads and writes its files in the current directory
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def no_shared_state(monkeypatch):
+    """
+    every test starts without a run journal, profile store, result cache or response cache, and the ones a test
+    configures are closed after it
+    """
+    monkeypatch.setattr(http_client, '_client', None)
+    monkeypatch.setattr(run_journal, '_journal', None)
+    monkeypatch.setattr(profile_store, '_store', None)
+    monkeypatch.setattr(result_cache, '_cache', None)
+    yield
+    run_journal.close()
+
+
+@pytest.fixture
+def upstream(workdir, monkeypatch):
+    """
+    fake swingtradebot.com, finance.yahoo.com and alphavantage API (see fake_upstream.py) that the scrapers and the
+    alphavantage calls are pointed at
+    """
+    up = start_upstream(monkeypatch, num_symbols=NUM_SYMBOLS)
+    yield up
+    up.stop()
+
+
+class FakeClock:
+    """
+    clock that only moves when it is slept on, so waits can be checked without taking any time
+    """
+
+    def __init__(self, now=0.0):
+        """
+        :param now: time to start at in seconds
+        """
+        self.now = now
+        self.sleeps = list()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        :param seconds: seconds to move the clock forward by
+        :return: nothing is returned
+        """
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def start_upstream(monkeypatch, **kwargs):
+    """
+    starts a fake upstream and points the scrapers and the alphavantage calls at it
+    :param kwargs: arguments of fake_upstream.FakeUpstream
+    :return: the started fake_upstream.FakeUpstream (stop it when the test is done)
+    """
+    up = fake_upstream.FakeUpstream(**kwargs)
+    up.start()
+    for name, value in up.environment().items():
+        monkeypatch.setenv(name, value)
+    return up
+
+
+def prices_frame(series):
+    """
+    prices as text, in the same layout as the prices csv file
+    :param series: iterable of (symbol, time_series) (see fixtures.synthetic_prices)
+    :return: pandas DataFrame with symbol, date and the price columns, by symbol and then newest date first
+    """
+    rows = list()
+    headers = None
+    for symbol, time_series in series:
+        for date, values in time_series.items():
+            headers = headers or list(values.keys())
+            rows.append([symbol, date] + [values[header] for header in headers])
+    return pd.DataFrame(rows, columns=['symbol', 'date'] + headers, dtype=str)
+
+
+def sector_groups(symbols):
+    """
+    :param symbols: dictionary of symbol to its information (see fixtures.synthetic_symbols)
+    :return: dictionary of sectors and the symbols within them (same as the groups of analysis_driver)
+    """
+    groups = dict()
+    for symbol, info in symbols.items():
+        groups.setdefault(info['sector'], list()).append(symbol)
+    return groups
+
+
+@pytest.fixture
+def universe():
+    """
+    synthetic symbols and 120 days of prices for them (without missing days, which analysis.calculations needs)
+    :return: [symbols, prices_text_df]
+    """
+    symbols = fixtures.synthetic_symbols(30, seed=1)
+    return symbols, prices_frame(fixtures.synthetic_prices(list(symbols.keys()), 120, seed=1, missing_rate=0))
@@ -0,0 +1,48 @@
+import alphavantage_api as av
+import fixtures
+import numpy as np
+import pandas as pd
+import json
+import pytest
+
+
+def dict_frame(time_series):
+    """
+    decodes a time series the way it was done before decode_time_series: a DataFrame of text built from the dict of
+    dicts, turned into numbers with pd.to_numeric by the analysis
+    :param time_series: prices where the keys are the date and the value is a dictionary of prices
+    :return: pandas DataFrame with a column for each header, indexed by date
+    """
+    df = pd.DataFrame.from_dict(time_series, orient='index')
+    return df.apply(pd.to_numeric, errors='coerce')
+
+
+def payload(broken=False):
+    """
+    :param broken: bool of whether to leave out values and send values that are not numbers
+    :return: time series of an alphavantage response, after a round trip through JSON
+    """
+    _, time_series = next(iter(fixtures.synthetic_prices(['AAA'], 30, seed=4)))
+    time_series = json.loads(json.dumps(time_series))
+    if broken:
+        dates = list(time_series.keys())
+        del time_series[dates[1]]['8. split coefficient']
+        time_series[dates[2]]['1. open'] = 'abc'
+        time_series[dates[3]]['6. volume'] = ''
+        time_series[dates[4]]['9. extra'] = '1.5'
+    return time_series
+
+
+@pytest.mark.parametrize('broken', [False, True])
+def test_decode_matches_the_dict_path(broken):
+    time_series = payload(broken)
+    expected = dict_frame(time_series)
+    dates, columns = av.decode_time_series(time_series)
+
+    assert dates.astype(str).tolist() == expected.index.tolist()
+    assert list(columns.keys()) == list(expected.columns)
+    for header, values in columns.items():
+        assert np.array_equal(values, expected[header].to_numpy(dtype='float64'), equal_nan=True), header
+
+    # volume stays an int column unless a value is missing
+    assert (columns['6. volume'].dtype == np.int64) != broken
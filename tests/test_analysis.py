@@ -0,0 +1,111 @@
+from conftest import prices_frame, sector_groups
+import analysis as an
+import benchmark
+import coverage
+import fixtures
+import price_refresh
+import price_store
+import numpy as np
+import pandas as pd
+import pytest
+
+CSV_PATH = 'ninety_day_historical_prices.csv'
+
+
+def same_horizons(expected, actual):
+    """
+    :param expected: dictionary of horizon name to [analysis_dict, dates]
+    :param actual: dictionary of horizon name to [analysis_dict, dates]
+    :return: bool of whether every horizon matches (see benchmark.same_analysis)
+    """
+    return list(expected.keys()) == list(actual.keys()) and \
+        all(benchmark.same_analysis(expected[name], actual[name]) for name in expected.keys())
+
+
+def covered_pairs(index):
+    """
+    :param index: coverage.CoverageIndex
+    :return: set of the (symbol, date) pairs that have prices
+    """
+    return {(index.symbols[symbol], index.dates[date]) for date, symbol in np.argwhere(index.matrix())}
+
+
+def test_vectorized_matches_calculations(workdir, universe):
+    symbols, text_df = universe
+    price_refresh.write_prices(text_df, CSV_PATH, store_path=None)
+    prices_df = pd.read_csv(CSV_PATH)
+    groups = sector_groups(symbols)
+
+    expected = an.calculations(groups, prices_df)
+    assert len(expected[0]) > 1
+    assert benchmark.same_analysis(expected, an.vectorized_calculations(groups, prices_df))
+
+
+def test_store_matches_csv(workdir, universe):
+    symbols, text_df = universe
+    price_refresh.write_prices(text_df, CSV_PATH, price_store.STORE_PATH)
+    groups = sector_groups(symbols)
+
+    expected = an.vectorized_calculations(groups, pd.read_csv(CSV_PATH))
+    actual = an.vectorized_calculations(groups, price_store.open_prices(columns=an.PRICE_COLUMNS))
+    assert benchmark.same_analysis(expected, actual)
+
+
+@pytest.mark.parametrize('chunk_rows', [7, 500, 100000])
+def test_streaming_matches_multi_horizon(workdir, universe, chunk_rows):
+    symbols, text_df = universe
+    price_refresh.write_prices(text_df, CSV_PATH, store_path=None)
+    groups = sector_groups(symbols)
+    horizons = an.parse_horizons('5d,20d:2,100d')
+
+    expected = an.multi_horizon_calculations(groups, pd.read_csv(CSV_PATH), horizons)
+    assert same_horizons(expected, an.streaming_calculations(groups, CSV_PATH, horizons, chunk_rows))
+
+
+def test_streaming_needs_the_rows_of_each_symbol_together(workdir, universe):
+    symbols, text_df = universe
+    groups = sector_groups(symbols)
+    horizons = an.parse_horizons('5d')
+    price_refresh.write_prices(text_df, CSV_PATH, store_path=None)
+    expected = an.multi_horizon_calculations(groups, pd.read_csv(CSV_PATH), horizons)
+
+    # the latest date of every symbol at the end of the file, like an update adds it
+    latest = text_df['date'] == text_df['date'].max()
+    price_refresh.write_prices(pd.concat([text_df[~latest], text_df[latest]]), CSV_PATH, store_path=None)
+    with pytest.raises(ValueError, match='without -stream'):
+        an.streaming_calculations(groups, CSV_PATH, horizons)
+    assert same_horizons(expected, an.multi_horizon_calculations(groups, pd.read_csv(CSV_PATH), horizons))
+
+
+def test_coverage_matches_full_pivot(workdir):
+    # missing days, so symbols drop out of some horizons
+    symbols = fixtures.synthetic_symbols(40, seed=2)
+    text_df = prices_frame(fixtures.synthetic_prices(list(symbols.keys()), 120, seed=2, missing_rate=0.002))
+    price_refresh.write_prices(text_df, CSV_PATH, price_store.STORE_PATH)
+    groups = sector_groups(symbols)
+    horizons = an.parse_horizons('5d,20d:2,100d')
+    prices_df = price_store.open_prices(columns=an.PRICE_COLUMNS)
+
+    index = price_store.open_coverage()
+    assert index is not None
+    assert covered_pairs(index) == set(zip(text_df['symbol'], text_df['date']))
+    assert covered_pairs(index) == covered_pairs(coverage.CoverageIndex.from_pairs(text_df['symbol'],
+                                                                                     text_df['date']))
+
+    expected = an.multi_horizon_calculations(groups, prices_df, horizons)
+    assert same_horizons(expected, an.multi_horizon_calculations(groups, prices_df, horizons, index))
+
+
+def test_parse_horizons():
+    assert an.parse_horizons('5d, 2w:3,1m') == {'5d': (4, 1), '2w': (9, 3), '1m': (20, 1)}
+    for text in ('20d,20d:5', '1d', 'x', '5d:0'):
+        with pytest.raises(ValueError):
+            an.parse_horizons(text)
+
+
+def test_fit_horizons_skips_long_horizons():
+    horizons = an.parse_horizons('20d,100d,1y')
+    assert an.fit_horizons(horizons, 106) == {'20d': horizons['20d'], '100d': horizons['100d']}
+
+    # the 100 day analysis is kept even with fewer dates
+    assert list(an.fit_horizons(horizons, 50).keys()) == ['20d', '100d']
@@ -0,0 +1,87 @@
+from conftest import FakeClock, start_upstream
+import http_client
+import requests
+import pytest
+from urllib.parse import urlsplit
+
+
+@pytest.fixture
+def failing(workdir, monkeypatch):
+    """
+    fake upstream that answers every request with a 503
+    """
+    up = start_upstream(monkeypatch, num_symbols=2, error_rate=1.0)
+    yield up
+    up.stop()
+
+
+def counters(client, url):
+    """
+    :param client: http_client.HttpClient
+    :param url: url that was requested
+    :return: dictionary of the request, retry and failure counts of the url's host
+    """
+    stats = client.stats()[urlsplit(url).netloc]
+    return {name: stats[name] for name in ('requests', 'retries', 'failures')}
+
+
+def test_retryable_status_is_retried(failing):
+    clock = FakeClock()
+
+    def sleep(seconds):
+        # the upstream recovers while the client waits
+        clock.sleep(seconds)
+        failing.error_rate = 0.0
+
+    client = http_client.HttpClient(sleep=sleep)
+    url = f'{failing.url}/equities?page=1'
+    assert client.get(url).status_code == 200
+    assert failing.requests['equities'] == 2
+    assert counters(client, url) == {'requests': 2, 'retries': 1, 'failures': 0}
+    assert 0.5 * http_client.BASE_BACKOFF <= clock.sleeps[0] <= http_client.BASE_BACKOFF
+
+
+def test_gives_up_after_max_retries(failing):
+    clock = FakeClock()
+    client = http_client.HttpClient(max_retries=2, base_backoff=4, sleep=clock.sleep)
+    url = f'{failing.url}/equities?page=1'
+    with pytest.raises(requests.exceptions.HTTPError, match='503'):
+        client.get(url)
+    assert failing.requests['equities'] == 3
+    assert counters(client, url) == {'requests': 3, 'retries': 2, 'failures': 1}
+
+    # the wait doubles for each retry (with jitter between half and all of it)
+    assert len(clock.sleeps) == 2
+    assert 2 <= clock.sleeps[0] <= 4 and 4 <= clock.sleeps[1] <= 8
+
+
+def test_other_statuses_are_not_retried(failing):
+    clock = FakeClock()
+    client = http_client.HttpClient(sleep=clock.sleep)
+    url = f'{failing.url}/equities?page=1'
+    with pytest.raises(requests.exceptions.HTTPError, match='503'):
+        client.get(url, retry_statuses=())
+
+    failing.error_rate = 0.0
+    missing = f'{failing.url}/missing'
+    with pytest.raises(requests.exceptions.HTTPError, match='404'):
+        client.get(missing)
+    assert counters(client, url) == {'requests': 2, 'retries': 0, 'failures': 2}
+    assert clock.sleeps == list()
+
+
+def test_counters_are_kept_per_host(failing):
+    failing.error_rate = 0.0
+    client = http_client.HttpClient(sleep=FakeClock().sleep)
+
+    # the same server under two host names
+    by_address = f'{failing.url}/equities?page=1'
+    by_name = by_address.replace('127.0.0.1', 'localhost')
+    for url in (by_address, by_address, by_name):
+        client.get(url)
+
+    assert counters(client, by_address) == {'requests': 2, 'retries': 0, 'failures': 0}
+    assert counters(client, by_name) == {'requests': 1, 'retries': 0, 'failures': 0}
+    stats = client.stats()[urlsplit(by_address).netloc]
+    assert 0 < stats['average_seconds'] <= stats['max_seconds']
+    assert stats['total_seconds'] == pytest.approx(2 * stats['average_seconds'])
@@ -0,0 +1,85 @@
+from conftest import FakeClock
+import metrics
+import json
+import re
+
+# one sample of the Prometheus text exposition format: name, optional labels and a value
+LABEL = r'[a-zA-Z_]\w*="[^"]*"'
+SAMPLE = re.compile(rf'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{{(?P<labels>{LABEL}(?:,{LABEL})*)\}})? (?P<value>\S+)$')
+
+
+def recorded():
+    """
+    :return: metrics.Metrics with a stage, a counter and a histogram, timed with a fake clock
+    """
+    clock = FakeClock()
+    run = metrics.Metrics(clock=clock, cpu_clock=clock)
+    with run.stage('load'):
+        clock.sleep(2.0)
+    run.count('rows_parsed', 10, source='csv')
+    run.count('rows_parsed', 5, source='csv')
+    run.observe('http_request_seconds', 0.2, host='h')
+    run.observe('http_request_seconds', 3.0, host='h')
+    return run
+
+
+def parse_prometheus(text):
+    """
+    :param text: metrics in the Prometheus text format
+    :return: [types, samples] where types is a dictionary of metric name to type, and samples a dictionary of
+    (name, labels text) to value
+    """
+    types = dict()
+    samples = dict()
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert name not in types
+            types[name] = kind
+            continue
+
+        match = SAMPLE.match(line)
+        assert match is not None, line
+        name = match.group('name')
+        family = re.sub('_(bucket|sum|count)$', '', name) if name not in types else name
+        assert family in types, f'{name} comes before its TYPE line'
+        samples[(name, match.group('labels') or '')] = float(match.group('value'))
+    return types, samples
+
+
+def test_prometheus_exposition(workdir):
+    recorded().export('metrics.prom')
+    with open('metrics.prom', mode='r', encoding='utf-8') as f:
+        text = f.read()
+    assert text.endswith('\n')
+
+    types, samples = parse_prometheus(text)
+    prefix = metrics.PROMETHEUS_PREFIX
+    assert types[f'{prefix}stage_wall_seconds'] == 'counter'
+    assert types[f'{prefix}rows_parsed'] == 'counter'
+    assert types[f'{prefix}http_request_seconds'] == 'histogram'
+
+    assert samples[(f'{prefix}stage_calls', 'stage="load"')] == 1
+    assert samples[(f'{prefix}stage_wall_seconds', 'stage="load"')] == 2.0
+    assert samples[(f'{prefix}rows_parsed', 'source="csv"')] == 15
+
+    # buckets are cumulative and end with +Inf, which matches the count
+    histogram = f'{prefix}http_request_seconds'
+    assert samples[(f'{histogram}_bucket', 'host="h",le="0.1"')] == 0
+    assert samples[(f'{histogram}_bucket', 'host="h",le="0.25"')] == 1
+    assert samples[(f'{histogram}_bucket', 'host="h",le="5"')] == 2
+    assert samples[(f'{histogram}_bucket', 'host="h",le="+Inf"')] == 2
+    assert samples[(f'{histogram}_count', 'host="h"')] == 2
+    assert samples[(f'{histogram}_sum', 'host="h"')] == 3.2
+
+
+def test_json_lines_export(workdir):
+    recorded().export('metrics.jsonl')
+    with open('metrics.jsonl', mode='r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+
+    assert [record['type'] for record in records] == ['run', 'stage', 'counter', 'histogram']
+    assert records[1] == {'type': 'stage', 'name': 'load', 'calls': 1, 'wall_seconds': 2.0, 'cpu_seconds': 2.0,
+                          'peak_rss_mb': records[1]['peak_rss_mb'], 'traced_peak_mb': None}
+    assert records[2] == {'type': 'counter', 'name': 'rows_parsed', 'labels': {'source': 'csv'}, 'value': 15}
+    assert records[3]['count'] == 2 and records[3]['buckets'][-1] == ['+Inf', 2]
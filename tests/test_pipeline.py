@@ -0,0 +1,32 @@
+from conftest import NUM_SYMBOLS, start_upstream
+import alphavantage_api as av
+import fixtures
+import pipeline
+import shard_fetch
+import filecmp
+import os
+
+# a key for every symbol, so the key pool never waits
+API_KEYS = [f'key_{i}' for i in range(NUM_SYMBOLS)]
+
+
+def test_results_are_written_in_listing_order(workdir, monkeypatch):
+    # random latency, so the profiles and prices come back out of order
+    up = start_upstream(monkeypatch, num_symbols=NUM_SYMBOLS, latency=0.02, seed=3)
+    try:
+        listing = [fixtures.symbol_name(i) for i in range(NUM_SYMBOLS)]
+
+        # the calls one after the other, in their own directory
+        os.makedirs('batch')
+        monkeypatch.chdir('batch')
+        batch_df = av.alphavantage_api_call(listing, API_KEYS, True, 2, calls_per_minute=60000)
+        monkeypatch.chdir('..')
+
+        symbols, message, success, prices_df = pipeline.Pipeline(2, True, API_KEYS, calls_per_minute=60000).run()
+        assert success
+        assert list(symbols.keys()) == listing
+        assert list(prices_df['symbol'].unique()) == listing
+        assert prices_df.equals(batch_df)
+        assert filecmp.cmp(shard_fetch.PRICES_FILE, os.path.join('batch', shard_fetch.PRICES_FILE), shallow=False)
+    finally:
+        up.stop()
@@ -0,0 +1,163 @@
+from conftest import NUM_SYMBOLS, SRC_PATH, prices_frame
+import alphavantage_api as av
+import fixtures
+import price_refresh
+import price_store
+import scrape_swingtradebot as stb
+import pytest
+import os
+import subprocess
+import sys
+
+CSV_PATH = 'ninety_day_historical_prices.csv'
+
+# the fake upstream's prices end on 2019-12-12 (a Thursday), so they are current on the 13th
+TODAY = '2019-12-13'
+
+# the fake upstream does not throttle, so the key pool should not wait either
+CALLS_PER_MINUTE = 60000
+
+
+def upstream_prices(upstream):
+    """
+    :param upstream: fake_upstream.FakeUpstream
+    :return: pandas DataFrame of what a normal run stores for every symbol of the upstream (see conftest.prices_frame)
+    """
+    symbols = [fixtures.symbol_name(i) for i in range(NUM_SYMBOLS)]
+    return prices_frame((symbol, upstream.time_series(symbol, 'compact')['Time Series (Daily)'])
+                        for symbol in symbols)
+
+
+def refresh(upstream, today=TODAY, store_path=price_store.STORE_PATH):
+    """
+    refreshes the prices of every symbol of the upstream
+    :return: [prices_df, summary] (see price_refresh.refresh_prices)
+    """
+    symbols = [fixtures.symbol_name(i) for i in range(NUM_SYMBOLS)]
+    return price_refresh.refresh_prices(symbols, ['key_a', 'key_b'], CSV_PATH, store_path,
+                                        f'{upstream.url}/query', CALLS_PER_MINUTE, today)
+
+
+@pytest.mark.parametrize('store_path', [price_store.STORE_PATH, None])
+def test_refresh_fills_holes(upstream, store_path):
+    full_df = upstream_prices(upstream)
+
+    # three symbols are missing a few days in the middle of their prices
+    holes = full_df['symbol'].isin(['AAB', 'AAF', 'AAK']) & full_df['date'].isin(['2019-11-01', '2019-11-04',
+                                                                                     '2019-12-02'])
+    price_refresh.write_prices(full_df[~holes], CSV_PATH, store_path)
+
+    prices_df, summary = refresh(upstream, store_path=store_path)
+    assert summary['fetched'] == 3
+    assert summary['holes'] == 3
+    assert summary['new_rows'] == holes.sum()
+    assert prices_df.equals(full_df)
+    assert price_refresh.load_stored_prices(CSV_PATH).equals(full_df)
+    if store_path is not None:
+        assert price_store.read_meta(store_path)['rows'] == len(full_df)
+
+    # nothing is missing anymore
+    _, summary = refresh(upstream, store_path=store_path)
+    assert summary['fetched'] == 0
+    assert upstream.requests['query'] == 3
+
+
+def test_newer_dates_are_appended(upstream, monkeypatch):
+    full_df = upstream_prices(upstream)
+
+    # the last three days were not fetched yet
+    newest = sorted(full_df['date'].unique())[-3:]
+    stored_df = full_df[~full_df['date'].isin(newest)].reset_index(drop=True)
+    price_refresh.write_prices(stored_df, CSV_PATH)
+    with open(CSV_PATH, mode='rb') as f:
+        stored_bytes = f.read()
+    column_file = price_store.column_file(price_store.STORE_PATH, 'symbol')
+    with open(column_file, mode='rb') as f:
+        stored_codes = f.read()
+
+    # nothing is written again
+    def no_rewrite(*args, **kwargs):
+        raise AssertionError('the prices were written again')
+    monkeypatch.setattr(price_refresh, 'write_prices', no_rewrite)
+    monkeypatch.setattr(price_store, 'csv_to_store', no_rewrite)
+
+    prices_df, summary = refresh(upstream)
+    assert summary['fetched'] == NUM_SYMBOLS
+    assert summary['new_rows'] == 3 * NUM_SYMBOLS
+
+    # the new rows are at the end of the file and the store, and the store still matches the file
+    with open(CSV_PATH, mode='rb') as f:
+        assert f.read().startswith(stored_bytes)
+    with open(column_file, mode='rb') as f:
+        assert f.read().startswith(stored_codes)
+    assert price_refresh.load_stored_prices(CSV_PATH).equals(prices_df)
+    assert price_store.store_is_current()
+    store_df = price_store.open_prices()
+    assert store_df['symbol'].astype(str).tolist() == prices_df['symbol'].tolist()
+    assert store_df['date'].astype(str).tolist() == prices_df['date'].tolist()
+    assert price_refresh.find_holes(prices_df) == dict()
+
+    # the same prices as a full fetch, in another order
+    key = ['symbol', 'date']
+    assert prices_df.sort_values(key).reset_index(drop=True).equals(full_df.sort_values(key).reset_index(drop=True))
+
+
+def test_unfillable_holes_are_not_requested_again(upstream):
+    full_df = upstream_prices(upstream)
+
+    # one symbol has a price on a day the upstream has no prices for, so every other symbol has a hole there
+    extra = full_df[full_df['symbol'] == 'AAA'].head(1).copy()
+    extra['date'] = '2019-12-07'
+    stored_df = price_refresh.merge_prices(full_df, extra.values.tolist(), list(full_df.columns),
+                                           list(full_df['symbol'].unique()))
+    price_refresh.write_prices(stored_df, CSV_PATH)
+
+    prices_df, summary = refresh(upstream)
+    assert summary['fetched'] == NUM_SYMBOLS - 1
+    assert summary['new_rows'] == 0
+    assert prices_df.equals(stored_df)
+
+    _, summary = refresh(upstream)
+    assert summary['fetched'] == 0
+    assert upstream.requests['query'] == NUM_SYMBOLS - 1
+
+
+def test_symbols_without_newer_prices_are_remembered(upstream):
+    price_refresh.write_prices(upstream_prices(upstream), CSV_PATH)
+
+    # the upstream never gets prices for the 13th and 16th, so every symbol comes back unchanged
+    _, summary = refresh(upstream, today='2019-12-17')
+    assert summary['fetched'] == NUM_SYMBOLS
+    assert summary['unchanged'] == NUM_SYMBOLS
+
+    _, summary = refresh(upstream, today='2019-12-17')
+    assert summary['skipped'] == NUM_SYMBOLS
+    assert upstream.requests['query'] == NUM_SYMBOLS
+
+
+def test_new_symbols_are_fetched(upstream):
+    prices_df, summary = refresh(upstream)
+    assert summary['fetched'] == NUM_SYMBOLS
+    full_df = upstream_prices(upstream)
+    assert prices_df.values.tolist() == full_df.values.tolist()
+    assert price_refresh.load_stored_prices(CSV_PATH).equals(full_df)
+
+
+@pytest.mark.parametrize('today, expected', [('2019-12-13', '2019-12-12'), ('2019-12-16', '2019-12-13'),
+                                             ('2019-11-29', '2019-11-27'), ('2019-12-26', '2019-12-24'),
+                                             ('2020-01-02', '2019-12-31'), ('2019-04-22', '2019-04-18')])
+def test_expected_latest_date_skips_weekends_and_holidays(today, expected):
+    assert price_refresh.expected_latest_date(today) == expected
+
+
+def test_update_without_prices_file(upstream, monkeypatch):
+    # only symbols.csv, as after a scrape that did not get to the prices
+    stb.deposit_to_csv(fixtures.synthetic_symbols(NUM_SYMBOLS))
+    monkeypatch.setenv(av.API_KEYS_VARIABLE, ','.join(f'key_{i}' for i in range(NUM_SYMBOLS)))
+
+    run = subprocess.run([sys.executable, os.path.join(SRC_PATH, 'fulay_atharva.py'), '-source=update',
+                          '-headless=1'], capture_output=True, text=True, timeout=300)
+    assert run.returncode == 0, run.stdout + run.stderr
+    assert 'End of program.' in run.stdout
+    assert upstream.requests['query'] == NUM_SYMBOLS
+    assert price_refresh.load_stored_prices(CSV_PATH).equals(upstream_prices(upstream))
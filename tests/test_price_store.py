@@ -0,0 +1,118 @@
+import alphavantage_api as av
+import coverage
+import fixtures
+import fulay_atharva
+import price_store
+import scrape_swingtradebot as stb
+import numpy as np
+import pandas as pd
+import os
+
+CSV_PATH = 'ninety_day_historical_prices.csv'
+
+
+def deposit(symbols, overwrite, store_path=price_store.STORE_PATH, buffer_rows=50):
+    """
+    writes synthetic prices for the symbols with a PriceWriter (the buffer is small, so it is flushed many times)
+    :param symbols: list of symbols
+    :param overwrite: bool to determine if we should overwrite the current file
+    :param store_path: directory of the columnar store, None to only write the csv file
+    :param buffer_rows: number of rows the writer keeps before writing them
+    :return: nothing is returned
+    """
+    with av.PriceWriter(CSV_PATH, overwrite, buffer_rows, store_path) as writer:
+        for symbol, time_series in fixtures.synthetic_prices(symbols, 60, seed=3):
+            assert writer.deposit(symbol, time_series, list(list(time_series.values())[0].keys()))
+
+
+def assert_store_matches_csv():
+    """
+    checks that the store has the same rows as the csv file, and a coverage bitmap of them
+    """
+    csv_df = pd.read_csv(CSV_PATH, dtype={'symbol': str, 'date': str})
+    store_df = price_store.open_prices()
+    assert list(store_df.columns) == list(csv_df.columns)
+    assert store_df['symbol'].astype(str).tolist() == csv_df['symbol'].tolist()
+    assert store_df['date'].astype(str).tolist() == csv_df['date'].tolist()
+    for column in csv_df.columns[2:]:
+        assert np.allclose(store_df[column].to_numpy(dtype=float), csv_df[column].to_numpy(dtype=float))
+
+    meta = price_store.read_meta(price_store.STORE_PATH)
+    index = coverage.CoverageIndex.load(price_store.coverage_file(price_store.STORE_PATH), meta['symbols'],
+                                        meta['dates'], meta['rows'])
+    assert index is not None
+    expected = coverage.CoverageIndex.from_pairs(csv_df['symbol'], csv_df['date'])
+    assert index.holes() == expected.holes()
+    assert index.complete(expected.trading_dates()) == expected.complete(expected.trading_dates())
+    assert index.matrix().sum() == len(csv_df)
+
+
+def test_writer_store_matches_csv(workdir):
+    deposit([fixtures.symbol_name(i) for i in range(10)], True)
+    assert_store_matches_csv()
+
+
+def test_append_without_store_starts_from_the_csv(workdir):
+    symbols = [fixtures.symbol_name(i) for i in range(10)]
+    deposit(symbols[:5], True, store_path=None)
+    assert not price_store.store_exists()
+
+    deposit(symbols[5:], False)
+    assert_store_matches_csv()
+
+
+def test_append_adds_to_store(workdir):
+    symbols = [fixtures.symbol_name(i) for i in range(10)]
+    deposit(symbols[:5], True)
+    deposit(symbols[5:], False)
+    assert_store_matches_csv()
+
+
+def test_meta_is_written_once_per_session(workdir, monkeypatch):
+    writes = list()
+    write_meta = price_store.write_meta
+    monkeypatch.setattr(price_store, 'write_meta', lambda path, meta: writes.append(meta['rows']) or
+                        write_meta(path, meta))
+
+    deposit([fixtures.symbol_name(i) for i in range(10)], True)
+
+    # once when the store is created and once when the writer is closed, not once per flush
+    assert writes == [0, len(pd.read_csv(CSV_PATH))]
+
+
+def test_missing_coverage_is_rebuilt(workdir):
+    deposit([fixtures.symbol_name(i) for i in range(10)], True)
+    saved = price_store.open_coverage()
+    os.remove(price_store.coverage_file(price_store.STORE_PATH))
+
+    rebuilt = price_store.open_coverage()
+    assert np.array_equal(rebuilt.bits, saved.bits)
+
+
+def remove_symbol(symbol):
+    """
+    removes a symbol's rows from the csv file by hand, without touching the store
+    :param symbol: string value of symbol (i.e. "AAPL")
+    :return: nothing is returned
+    """
+    csv_df = pd.read_csv(CSV_PATH, dtype=str, keep_default_na=False)
+    csv_df[csv_df['symbol'] != symbol].to_csv(CSV_PATH, index=False, lineterminator='\r\n')
+
+
+def test_store_is_checked_against_the_csv(workdir):
+    symbols = [fixtures.symbol_name(i) for i in range(10)]
+    deposit(symbols, True)
+    assert price_store.store_is_current()
+
+    remove_symbol('AAC')
+    assert not price_store.store_is_current()
+
+    # local runs read the csv file instead of the old store
+    stb.deposit_to_csv(fixtures.synthetic_symbols(10))
+    _, prices_df = fulay_atharva.local_driver()
+    assert sorted(prices_df['symbol'].astype(str).unique()) == [symbol for symbol in symbols if symbol != 'AAC']
+
+    # and the store is built again from the csv file before rows are appended to it
+    deposit([fixtures.symbol_name(i) for i in range(10, 15)], False)
+    assert price_store.store_is_current()
+    assert_store_matches_csv()
@@ -0,0 +1,67 @@
+from conftest import FakeClock
+import fixtures
+import profile_store
+import threading
+
+DAY = 24 * 60 * 60
+
+
+class BlockingFetch:
+    """
+    fetch function that waits until it is let go, so a test can see what happens while a refresh is running
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = list()
+
+    def __call__(self, symbol):
+        self.calls.append(symbol)
+        self.release.wait(timeout=10)
+        return {'sector': f'new {symbol}'}
+
+
+def test_profiles_are_scraped_again_after_max_age(upstream):
+    clock = FakeClock(1000.0)
+    store = profile_store.ProfileStore(max_age_days=30, clock=clock)
+    symbol = fixtures.symbol_name(0)
+    info = store.get_company_info(symbol)
+    assert info['sector'] is not None
+    assert upstream.requests['quote'] == 1
+
+    # a profile is used up to max_age_days old, and scraped again after that
+    clock.now += 30 * DAY
+    assert store.get_company_info(symbol) == info
+    assert upstream.requests['quote'] == 1
+
+    clock.now += 1
+    assert store.get_company_info(symbol) == info
+    assert upstream.requests['quote'] == 2
+    assert store.profiles[symbol]['fetched_at'] == clock.now
+
+    # the store is read back from disk by the next run
+    store.close()
+    assert profile_store.ProfileStore(clock=clock).get_company_info(symbol) == info
+    assert upstream.requests['quote'] == 2
+
+
+def test_stale_profiles_are_refreshed_in_the_background(workdir):
+    clock = FakeClock(1000.0)
+    fetch = BlockingFetch()
+    store = profile_store.ProfileStore(max_age_days=1, refresh_in_background=True, fetch=fetch, clock=clock)
+    store.put('AAA', {'sector': 'old'})
+
+    # the stale profile is returned right away, and only one refresh runs however often it is asked for
+    clock.now += 2 * DAY
+    assert [store.get_company_info('AAA') for _ in range(3)] == [{'sector': 'old'}] * 3
+    assert store.refreshing == {'AAA'}
+
+    fetch.release.set()
+    store.close()
+    assert fetch.calls == ['AAA']
+    assert store.refreshing == set()
+    assert store.get_company_info('AAA') == {'sector': 'new AAA'}
+
+    # a symbol that is not in the store is scraped while the caller waits
+    assert store.get_company_info('AAB') == {'sector': 'new AAB'}
+    assert fetch.calls == ['AAA', 'AAB']
@@ -0,0 +1,72 @@
+from conftest import FakeClock, start_upstream
+import alphavantage_api as av
+import fixtures
+import rate_limit
+import pytest
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_bucket_refills_after_a_burst(clock):
+    bucket = rate_limit.TokenBucket(rate=1, capacity=2, clock=clock)
+
+    # two calls back to back, then one a second
+    assert [bucket.reserve(0.0) for _ in range(3)] == [0.0, 0.0, 1.0]
+
+    # an idle key gets its burst back, but no more than capacity
+    assert [bucket.reserve(10.0) for _ in range(3)] == [10.0, 10.0, 11.0]
+
+
+def test_bucket_backoff_doubles_until_reset(clock):
+    bucket = rate_limit.TokenBucket(rate=1, base_backoff=12, max_backoff=60, clock=clock)
+    assert [bucket.backoff(0.0) for _ in range(4)] == [12, 24, 48, 60]
+    assert bucket.peek(0.0) == 60
+
+    bucket.reset()
+    assert bucket.backoff(100.0) == 12
+
+
+def test_pool_waits_for_the_next_token(clock):
+    pool = rate_limit.KeyPool(['key_a'], calls_per_minute=60, clock=clock, sleep=clock.sleep)
+    assert [pool.acquire() for _ in range(3)] == ['key_a'] * 3
+    assert clock.sleeps == [1.0, 1.0]
+
+    # with a second key, calls are rotated between them instead of waiting
+    pool = rate_limit.KeyPool(['key_a', 'key_b'], calls_per_minute=60, clock=clock, sleep=clock.sleep)
+    assert [pool.acquire() for _ in range(4)] == ['key_a', 'key_b', 'key_a', 'key_b']
+    assert clock.sleeps == [1.0, 1.0, 1.0]
+
+
+def test_throttled_key_is_rotated_out(workdir, monkeypatch, clock):
+    up = start_upstream(monkeypatch, num_symbols=2, calls_per_minute=1)
+    try:
+        # key_a has used up its calls for this minute
+        assert not up.throttled('key_a')
+        pool = rate_limit.KeyPool(['key_a', 'key_b'], calls_per_minute=60000, clock=clock, sleep=clock.sleep)
+
+        historical_prices, stop = av.fetch_symbol(fixtures.symbol_name(0), pool)
+        assert not stop
+        assert 'Time Series (Daily)' in historical_prices
+        assert up.requests['query'] == 2
+        assert pool.buckets['key_a'].failures == 1
+        assert pool.buckets['key_b'].failures == 0
+        assert clock.sleeps == list()
+    finally:
+        up.stop()
+
+
+def test_503_backs_off_until_max_errors(workdir, monkeypatch, clock):
+    up = start_upstream(monkeypatch, num_symbols=2, error_rate=1.0)
+    try:
+        pool = rate_limit.KeyPool(['key_a'], calls_per_minute=60000, base_backoff=12, clock=clock, sleep=clock.sleep)
+
+        # the key waits longer after each 503, and the api looks offline after max_errors of them
+        assert av.fetch_symbol(fixtures.symbol_name(0), pool, max_errors=3) == (None, True)
+        assert up.requests['query'] == 3
+        assert clock.sleeps == [12, 24]
+        assert pool.buckets['key_a'].failures == 3
+    finally:
+        up.stop()
@@ -0,0 +1,78 @@
+from conftest import FakeClock
+import alphavantage_api as av
+import fixtures
+import http_client
+import rate_limit
+import response_cache
+import requests
+import pytest
+
+
+@pytest.fixture
+def clock():
+    return FakeClock(1000.0)
+
+
+def cached_client(clock, replay=False):
+    """
+    :param clock: FakeClock of the cache
+    :param replay: bool of whether to only serve from the cache
+    :return: http_client.HttpClient with a response cache in the current directory
+    """
+    return http_client.HttpClient(cache=response_cache.ResponseCache(replay=replay, clock=clock), sleep=clock.sleep)
+
+
+def test_api_key_is_not_part_of_the_key():
+    assert response_cache.cache_key('http://host/query?symbol=AAA&apikey=key_a&function=x') == \
+        response_cache.cache_key('http://host/query?function=x&apikey=key_b&symbol=AAA')
+    assert response_cache.cache_key('http://host/query?symbol=AAA&apikey=key_a') != \
+        response_cache.cache_key('http://host/query?symbol=AAB&apikey=key_a')
+
+
+def test_responses_expire_after_their_ttl(upstream, clock):
+    client = cached_client(clock)
+    url = f'{upstream.url}/query?symbol={fixtures.symbol_name(0)}'
+    content = client.get(f'{url}&apikey=key_a').content
+
+    # another key still gets the cached response, until it is older than the ttl
+    clock.now += response_cache.DEFAULT_TTL
+    assert client.get(f'{url}&apikey=key_b').content == content
+    assert upstream.requests['query'] == 1
+
+    clock.now += 1
+    assert client.get(f'{url}&apikey=key_b').content == content
+    assert upstream.requests['query'] == 2
+
+
+def test_replay_raises_on_a_miss(upstream, clock):
+    url = f'{upstream.url}/query?symbol={fixtures.symbol_name(0)}'
+    cached_client(clock).get(url)
+
+    # replay serves responses whatever their age, and never goes to the network
+    clock.now += 365 * 24 * 60 * 60
+    client = cached_client(clock, replay=True)
+    assert client.get(url).status_code == 200
+    with pytest.raises(requests.exceptions.ConnectionError, match='replay mode'):
+        client.get(f'{upstream.url}/query?symbol={fixtures.symbol_name(1)}')
+    assert upstream.requests['query'] == 1
+
+    # the alphavantage calls move on to the next symbol
+    http_client.configure_cache('replay')
+    pool = rate_limit.KeyPool(['key_a'], calls_per_minute=60000)
+    assert av.fetch_symbol(fixtures.symbol_name(1), pool) == (None, False)
+    assert upstream.requests['query'] == 1
+
+
+def test_error_messages_are_not_cached(upstream):
+    http_client.configure_cache('on')
+    pool = rate_limit.KeyPool(['key_a'], calls_per_minute=60000)
+    for _ in range(2):
+        historical_prices, stop = av.fetch_symbol('ZZZZ', pool)
+        assert av.ERROR_KEY in historical_prices and not stop
+    assert upstream.requests['query'] == 2
+
+    # while prices are
+    for _ in range(2):
+        historical_prices, _ = av.fetch_symbol(fixtures.symbol_name(0), pool)
+        assert 'Time Series (Daily)' in historical_prices
+    assert upstream.requests['query'] == 3
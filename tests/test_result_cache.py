@@ -0,0 +1,136 @@
+from conftest import sector_groups
+import analysis as an
+import benchmark
+import fulay_atharva
+import price_refresh
+import price_store
+import result_cache
+import scrape_swingtradebot as stb
+import pandas as pd
+import os
+import pytest
+
+CSV_PATH = 'ninety_day_historical_prices.csv'
+
+
+def results(name):
+    """
+    :param name: value to tell results apart
+    :return: dictionary of horizon name to (analysis_dict, dates), as the cache loads them
+    """
+    return {an.DEFAULT_HORIZON: ({name: [0.0, 1.0]}, ['2019-12-11', '2019-12-12'])}
+
+
+def set_mtime(path, seconds):
+    """
+    :param path: path to a file
+    :param seconds: modification time to give the file
+    :return: nothing is returned
+    """
+    os.utime(path, (seconds, seconds))
+
+
+def test_least_recently_used_is_evicted(workdir):
+    cache = result_cache.ResultCache(max_entries=2)
+    cache.store('k1', results('k1'))
+    cache.store('k2', results('k2'))
+    set_mtime(cache.entry_file('k1'), 100)
+    set_mtime(cache.entry_file('k2'), 200)
+
+    # serving k1 makes it the most recently used, so k2 is the one removed
+    assert cache.load('k1') == results('k1')
+    cache.store('k3', results('k3'))
+    assert cache.load('k2') is None
+    assert cache.load('k1') == results('k1')
+    assert cache.load('k3') == results('k3')
+
+
+@pytest.fixture
+def analyzed(workdir, universe, monkeypatch):
+    """
+    prices and symbols files of the universe, a configured cache, and a count of the calculations that were run
+    :return: [symbols, text_df, calls] where calls is a list with an entry for every calculation
+    """
+    symbols, text_df = universe
+    price_refresh.write_prices(text_df, CSV_PATH, price_store.STORE_PATH)
+    stb.deposit_to_csv(symbols)
+    result_cache.configure()
+
+    calls = list()
+    multi_horizon_calculations = an.multi_horizon_calculations
+    monkeypatch.setattr(an, 'multi_horizon_calculations', lambda *args: calls.append(args) or
+                        multi_horizon_calculations(*args))
+    return symbols, text_df, calls
+
+
+def run(symbols, source, horizons='5d'):
+    """
+    :param symbols: dictionary of symbol to its information (see fixtures.synthetic_symbols)
+    :param source: prices csv file or store directory to read the prices from
+    :param horizons: text of the horizons (see analysis.parse_horizons)
+    :return: dictionary of horizon name to [analysis_dict, dates]
+    """
+    if os.path.isdir(source):
+        prices_df = price_store.open_prices(columns=an.PRICE_COLUMNS)
+    else:
+        prices_df = pd.read_csv(source)
+    return an.cached_calculations(fulay_atharva.symbols_driver(), prices_df, sector_groups(symbols),
+                                  {an.DEFAULT_HORIZON: an.DEFAULT_LOOKBACK, **an.parse_horizons(horizons)},
+                                  prices_source=source)
+
+
+@pytest.mark.parametrize('source', [CSV_PATH, price_store.STORE_PATH])
+def test_same_inputs_are_served_from_the_cache(analyzed, source):
+    symbols, _, calls = analyzed
+    expected = run(symbols, source)
+    actual = run(symbols, source)
+    assert len(calls) == 1
+    assert all(benchmark.same_analysis(expected[name], actual[name]) for name in expected.keys())
+
+    # other horizons are calculated again
+    run(symbols, source, '5d,20d')
+    assert len(calls) == 2
+
+
+def test_changed_prices_are_calculated_again(analyzed):
+    symbols, text_df, calls = analyzed
+    run(symbols, CSV_PATH)
+
+    # the same size and modification time, but other contents
+    stat = os.stat(CSV_PATH)
+    with open(CSV_PATH, mode='r+b') as f:
+        f.seek(-3, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-3, os.SEEK_END)
+        f.write(b'1' if last != b'1' else b'2')
+    os.utime(CSV_PATH, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    run(symbols, CSV_PATH)
+    assert len(calls) == 2
+
+    # writing the store again starts a new generation of it
+    run(symbols, price_store.STORE_PATH)
+    price_refresh.write_prices(text_df, CSV_PATH, price_store.STORE_PATH)
+    run(symbols, price_store.STORE_PATH)
+    assert len(calls) == 4
+
+
+def test_changed_symbols_are_calculated_again(analyzed):
+    symbols, _, calls = analyzed
+    run(symbols, CSV_PATH)
+
+    moved = dict(symbols)
+    symbol = next(iter(moved.keys()))
+    moved[symbol] = {**moved[symbol], 'sector': 'Moved'}
+    stb.deposit_to_csv(moved)
+    run(moved, CSV_PATH)
+    assert len(calls) == 2
+
+
+def test_runs_without_overwrite_fill_the_cache(analyzed):
+    symbols, _, calls = analyzed
+    for _ in range(2):
+        an.analysis_driver(fulay_atharva.symbols_driver(), price_store.open_prices(columns=an.PRICE_COLUMNS), False,
+                           headless=True, prices_source=price_store.STORE_PATH)
+    assert len(calls) == 1
+    assert len(os.listdir(result_cache.CACHE_PATH)) == 1
+    assert not os.path.exists('sector_analysis.csv')
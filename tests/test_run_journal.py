@@ -0,0 +1,108 @@
+import alphavantage_api as av
+import run_journal
+import scrape_swingtradebot as stb
+import shard_fetch
+import pytest
+
+# calls allowed per minute for each key, the fake upstream does not throttle
+CALLS_PER_MINUTE = 60000
+
+
+class Recorder:
+    """
+    fetch function that remembers what it was asked for
+    """
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = list()
+
+    def __call__(self, key):
+        self.calls.append(key)
+        return self.result
+
+
+def test_resume_skips_journaled_work(workdir):
+    companies = [{'symbol': 'AAA', 'company': 'AAA Inc.'}]
+    prices = {'Time Series (Daily)': {'2019-12-12': {'1. open': '1.0000'}}}
+
+    run_journal.configure()
+    assert run_journal.listing_page(1, Recorder([companies, None])) == [companies, None]
+    assert run_journal.fetch_prices('AAA', Recorder([prices, False])) == (prices, False)
+    run_journal.close()
+
+    run_journal.configure(resume=True)
+    fetch_page = Recorder([None, 'failed'])
+    fetch = Recorder([None, False])
+    assert run_journal.listing_page(1, fetch_page) == [companies, None]
+    assert run_journal.fetch_prices('AAA', fetch) == (prices, False)
+    assert fetch_page.calls == list()
+    assert fetch.calls == list()
+
+    # work that is not in the journal is still done
+    assert run_journal.listing_page(2, fetch_page) == [None, 'failed']
+    assert fetch_page.calls == [2]
+
+
+def test_failed_work_is_not_journaled(workdir):
+    run_journal.configure()
+    run_journal.listing_page(1, Recorder([None, 'failed']))
+    run_journal.fetch_prices('AAA', Recorder([{'Note': 'throttled'}, False]))
+    run_journal.fetch_prices('AAB', Recorder([None, True]))
+    assert run_journal.get_journal().counts() == {run_journal.PAGE: 0, run_journal.PROFILE: 0,
+                                                  run_journal.PRICES: 0}
+
+
+def test_partly_written_line_is_skipped(workdir):
+    run_journal.configure()
+    run_journal.listing_page(1, Recorder([[{'symbol': 'AAA'}], None]))
+    run_journal.close()
+    with open(run_journal.JOURNAL_PATH, mode='a', encoding='utf-8') as f:
+        f.write('{"kind": "page", "key": "2", "val')
+
+    run_journal.configure(resume=True)
+    assert run_journal.get_journal().counts()[run_journal.PAGE] == 1
+
+
+def test_new_run_starts_over(workdir):
+    run_journal.configure()
+    run_journal.listing_page(1, Recorder([[{'symbol': 'AAA'}], None]))
+    run_journal.close()
+
+    run_journal.configure(resume=False)
+    fetch_page = Recorder([[{'symbol': 'AAB'}], None])
+    assert run_journal.listing_page(1, fetch_page) == [[{'symbol': 'AAB'}], None]
+    assert fetch_page.calls == [1]
+
+
+def test_finish_removes_the_journal(workdir):
+    run_journal.configure()
+    run_journal.finish()
+    assert run_journal.get_journal() is None
+    with pytest.raises(FileNotFoundError):
+        open(run_journal.JOURNAL_PATH)
+
+
+def test_resumed_run_makes_no_requests(upstream):
+    run_journal.configure()
+    companies, _, success = shard_fetch.scrape_listing(2)
+    symbols = [curr_company['symbol'] for curr_company in companies]
+    profiles = [run_journal.get_company_info(symbol) for symbol in symbols]
+    prices_df = av.alphavantage_api_call(symbols, ['key_a', 'key_b'], False, 2, calls_per_minute=CALLS_PER_MINUTE)
+    run_journal.close()
+    assert success
+    before = dict(upstream.requests)
+    assert before == {'equities': 1, 'quote': len(symbols), 'query': len(symbols)}
+
+    run_journal.configure(resume=True)
+    assert [curr_company['symbol'] for curr_company in shard_fetch.scrape_listing(2)[0]] == symbols
+    assert [run_journal.get_company_info(symbol) for symbol in symbols] == profiles
+    assert av.alphavantage_api_call(symbols, ['key_a', 'key_b'], False, 2,
+                                    calls_per_minute=CALLS_PER_MINUTE).equals(prices_df)
+    assert dict(upstream.requests) == before
+
+    # the scraper of a run without shards reads the same journal
+    scraped, _, success = stb.swingtradebot_scraper(2)
+    assert success
+    assert list(scraped.keys()) == symbols
+    assert dict(upstream.requests) == before
@@ -0,0 +1,87 @@
+from conftest import NUM_SYMBOLS
+import alphavantage_api as av
+import fixtures
+import price_store
+import profile_store
+import shard_fetch
+import filecmp
+import os
+
+NUM_SHARDS = 2
+
+# a key for every symbol, so the key pool never waits (each shard gets half of them)
+API_KEYS = [f'key_{i}' for i in range(2 * NUM_SYMBOLS)]
+
+
+def run_shards(num_shards):
+    """
+    runs every shard in this process, one after the other (like separate processes, each has its own journal and
+    profile store)
+    :param num_shards: number of shards
+    :return: list of the dictionaries from fetch_shard
+    """
+    return [shard_fetch.run_shard(shard, num_shards) for shard in range(num_shards)]
+
+
+def test_shards_match_batch(upstream, monkeypatch):
+    monkeypatch.setenv(av.API_KEYS_VARIABLE, ','.join(API_KEYS))
+    symbols = [fixtures.symbol_name(i) for i in range(NUM_SYMBOLS)]
+
+    # a run without shards, in its own directory
+    os.makedirs('batch')
+    monkeypatch.chdir('batch')
+    batch_df = av.alphavantage_api_call(symbols, API_KEYS, True, 2, calls_per_minute=60000)
+    monkeypatch.chdir('..')
+
+    companies, _, success = shard_fetch.scrape_listing(2)
+    assert success
+    results = run_shards(NUM_SHARDS)
+    assert sum(result['symbols'] for result in results) == NUM_SYMBOLS
+    assert all(result['completed'] and result['priced'] == result['symbols'] for result in results)
+
+    merged, prices_path = shard_fetch.merge_shards(NUM_SHARDS)
+    assert list(merged.keys()) == symbols
+    assert filecmp.cmp(prices_path, os.path.join('batch', shard_fetch.PRICES_FILE), shallow=False)
+    assert filecmp.cmp(shard_fetch.PRICES_FILE, os.path.join('batch', shard_fetch.PRICES_FILE), shallow=False)
+    assert price_store.read_meta(price_store.STORE_PATH)['rows'] == len(batch_df)
+    assert shard_fetch.read_merged_prices(prices_path).equals(batch_df)
+
+    # the journals are removed once the shards are merged, and their profiles are kept in the main store
+    assert not any(os.path.exists(os.path.join(shard_fetch.shard_path(shard, NUM_SHARDS), 'run_journal.jsonl'))
+                   for shard in range(NUM_SHARDS))
+    assert set(profile_store.ProfileStore(fetch=dict).profiles.keys()) == set(symbols)
+
+    # so the next sharded run (with another number of shards) does not scrape them again
+    quotes = upstream.requests['quote']
+    run_shards(NUM_SHARDS + 1)
+    assert upstream.requests['quote'] == quotes
+
+
+def test_every_symbol_is_in_one_shard(workdir):
+    companies = [{'symbol': fixtures.symbol_name(i)} for i in range(100)]
+    shard_fetch.write_json(shard_fetch.LISTING_FILE, {'companies': companies, 'message': '', 'success': True})
+
+    shards = [shard_fetch.shard_companies(shard, 4, '.') for shard in range(4)]
+    assert sorted(curr_company['symbol'] for shard in shards for curr_company in shard) == \
+        [curr_company['symbol'] for curr_company in companies]
+    assert all(len(shard) > 0 for shard in shards)
+    assert shard_fetch.shard_of('AAPL', 4) == shard_fetch.shard_of('AAPL', 4)
+
+
+def test_merge_profiles_keeps_newest(workdir):
+    old = profile_store.ProfileStore('old.json', fetch=dict, clock=lambda: 100.0)
+    new = profile_store.ProfileStore('new.json', fetch=dict, clock=lambda: 200.0)
+    old.put('AAA', {'sector': 'old'})
+    old.put('AAB', {'sector': 'old'})
+    new.put('AAA', {'sector': 'new'})
+    old.save()
+    new.save()
+
+    assert profile_store.merge_profiles(['new.json', 'old.json', 'missing.json']) == 2
+    profiles = profile_store.ProfileStore(fetch=dict).profiles
+    assert {symbol: entry['info']['sector'] for symbol, entry in profiles.items()} == {'AAA': 'new', 'AAB': 'old'}
+
+    # only the symbols asked for are folded in, and nothing changes if the store is already newer
+    assert profile_store.merge_profiles(['old.json'], 'subset.json', {'AAB'}) == 1
+    assert list(profile_store.ProfileStore('subset.json', fetch=dict).profiles.keys()) == ['AAB']
+    assert profile_store.merge_profiles(['old.json']) == 0